@@ -0,0 +1,195 @@
+## シフト件数ごとの処理時間の計測（1千件・1万件・10万件で、どこが遅くなるかを追いかけるためのスクリプト）
+# 使い方:
+#   python bench_shifts.py [--sizes 1000 10000 100000] [--repeat 3] [--json bench.json]
+#   python bench_shifts.py --json new.json --compare old.json   （前のコミットの結果と比べる）
+# shift_synth の架空履歴（seed 固定）を作業用ディレクトリのCSVに保存し、アプリと同じ関数で各段階を測る。
+import argparse #コマンドライン引数
+import calendar #月末の日付用
+import json #結果の保存
+import os #パス操作
+import platform #実行環境の記録
+import shutil #作業用ディレクトリの削除
+import statistics #中央値
+import subprocess #コミットIDの記録
+import sys
+import tempfile #作業用ディレクトリ
+import time #計測
+from datetime import date #日付の型
+from typing import Any, Callable, Dict, List, Optional, Tuple #型ヒント用
+
+import pandas as pd #DataFrame処理用
+
+from shift_batch import load_workplace_settings #settings.json の勤務先設定
+from shift_calendar import build_month_model, is_holiday_array #カレンダーの表示データ
+from shift_engine import recompute_shift_frame #全件の再計算
+from shift_quality import check_shifts #データチェック
+from shift_rollup import build_rollup, rollup_period_aggregates #月別・勤務先別の集計
+from shift_store import load_records, write_snapshot #CSVの保存・読み込み
+from shift_synth import DEFAULT_END_DATE, generate_history #架空のシフト履歴
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000] #計測するシフト件数
+DEFAULT_THRESHOLD = 0.2 #--compare で「遅くなった」とみなす割合（20%）
+
+
+def _timed(fn: Callable[[], Any], repeat: int) -> Tuple[List[float], Any]:
+    """fn を repeat 回実行して、所要時間のリストと最後の戻り値を返す"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return samples, result
+
+
+def _rows(value: Any) -> int:
+    """計測した処理が扱った行数（結果の大きさ）"""
+    if isinstance(value, (pd.DataFrame, list, dict)):
+        return len(value)
+    return 0
+
+
+def bench_size(
+    size: int, workplace_settings: Dict[str, Dict[str, Any]], repeat: int, seed: int
+) -> List[Dict[str, Any]]:
+    """1つの件数について、各段階の所要時間を測る"""
+    records, settings = generate_history(size, workplace_settings, seed=seed)
+    work = tempfile.mkdtemp(prefix="shift_bench_")
+    data_file = os.path.join(work, "shifts_data.csv")
+    journal_file = os.path.join(work, "shifts_journal.jsonl")
+    end = DEFAULT_END_DATE
+    month_first = date(end.year, end.month, 1)
+    month_last = date(end.year, end.month, calendar.monthrange(end.year, end.month)[1])
+    year_first = date(end.year, 1, 1)
+
+    def load() -> pd.DataFrame: #アプリの初回読み込みと同じ（CSV → dictリスト → DataFrame）
+        df = pd.DataFrame(load_records(data_file, journal_file))
+        df["date"] = pd.to_datetime(df["date"])
+        return df
+
+    try:
+        stages: List[Tuple[str, Callable[[], Any]]] = [
+            ("save", lambda: write_snapshot(records, data_file, journal_file)),
+            ("load", load),
+        ]
+        results = []
+        frame: Optional[pd.DataFrame] = None
+        for name, fn in stages:
+            samples, value = _timed(fn, repeat)
+            results.append(_result(size, name, samples, _rows(value) or size))
+            if name == "load":
+                frame = value
+
+        def month_calendar() -> Any: #表示月の絞り込み＋日別集計＋祝日判定
+            df_month = frame[(frame["date"] >= pd.Timestamp(month_first)) & (frame["date"] <= pd.Timestamp(month_last))]
+            model = build_month_model(end.year, end.month, df_month)
+            is_holiday_array([d for week in model.weeks for d in week])
+            return df_month
+
+        workplaces = sorted(frame["workplace"].unique().tolist())[1:] or None #1つ外した勤務先フィルタ
+
+        def list_filter_sort() -> pd.DataFrame: #シフト一覧の絞り込み・並び替え・1ページ目
+            mask = (frame["date"] >= pd.Timestamp(year_first)) & (frame["date"] <= pd.Timestamp(end))
+            if workplaces is not None:
+                mask &= frame["workplace"].isin(workplaces)
+            return frame[mask].sort_values("pay", ascending=False).head(50)
+
+        def aggregates() -> Dict[str, Any]: #月別・勤務先別の集計から期間の集計を作る
+            return rollup_period_aggregates(build_rollup(frame), year_first)["by_month"]
+
+        for name, fn in [
+            ("recompute", lambda: recompute_shift_frame(frame, settings, reprice_wages=True)),
+            ("calendar", month_calendar),
+            ("list_filter_sort", list_filter_sort),
+            ("aggregates", aggregates),
+            ("data_check", lambda: check_shifts(frame)),
+        ]:
+            samples, value = _timed(fn, repeat)
+            results.append(_result(size, name, samples, _rows(value)))
+        return results
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def _result(size: int, stage: str, samples: List[float], rows: int) -> Dict[str, Any]:
+    return {
+        "size": size,
+        "stage": stage,
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "rows": rows,
+    }
+
+
+def run_metadata(seed: int, repeat: int) -> Dict[str, Any]:
+    """結果と一緒に保存する実行環境（どのコミットの結果かが分かるように）"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): #gitがない・リポジトリでない場合
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "seed": seed,
+        "repeat": repeat,
+        "measured_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> int:
+    """前回の結果と段階ごとに比べて表示し、threshold より遅くなった段階の数を返す"""
+    before = {(r["size"], r["stage"]): r["median_s"] for r in baseline.get("results", [])}
+    commit = baseline.get("meta", {}).get("commit") or "?"
+    print(f"\n--- {commit} との比較（中央値） ---")
+    regressions = 0
+    for r in results:
+        old = before.get((r["size"], r["stage"]))
+        if not old:
+            continue
+        ratio = r["median_s"] / old
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  ← 遅くなった"
+            regressions += 1
+        print(f"{r['size']:>7}件 {r['stage']:<17} {old:8.4f}s → {r['median_s']:8.4f}s  ×{ratio:.2f}{mark}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="シフト件数ごとに、読み込み・再計算・カレンダー・一覧・集計・データチェックの時間を測る")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="計測するシフト件数")
+    parser.add_argument("--repeat", type=int, default=3, help="段階ごとの計測回数（中央値を使う）")
+    parser.add_argument("--seed", type=int, default=0, help="架空履歴の乱数のseed")
+    parser.add_argument("--settings", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "settings.json"), help="勤務先設定を読む settings.json")
+    parser.add_argument("--json", help="結果を保存するJSONファイル")
+    parser.add_argument("--compare", help="比べる前回の結果（--json で保存したもの）")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="遅くなったとみなす割合（0.2 = 20%%）")
+    args = parser.parse_args()
+
+    workplace_settings = load_workplace_settings(args.settings)
+    results: List[Dict[str, Any]] = []
+    for size in args.sizes:
+        for r in bench_size(size, workplace_settings, args.repeat, args.seed):
+            results.append(r)
+            print(f"{r['size']:>7}件 {r['stage']:<17} {r['median_s']:8.4f}s  (最小 {r['min_s']:.4f}s, {r['rows']}行)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"meta": run_metadata(args.seed, args.repeat), "results": results}, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+## 起動時間の計測（コンテナ再起動直後の「初回表示」の速さを追いかけるためのスクリプト）
+# 使い方: python bench_startup.py [--repeat 3] [--json startup.json]
+# ページごとに新しいPythonプロセスを立ち上げ、streamlit の読み込み時間と、
+# そのページを最初に表示するまでの時間（AppTest で1回実行）を測る。
+import argparse #コマンドライン引数
+import json #結果の保存
+import os #パス操作
+import shutil #作業用ディレクトリへのコピー
+import statistics #中央値
+import subprocess #計測ごとに新しいプロセスを使う（読み込み済みモジュールの影響をなくす）
+import sys
+import tempfile #作業用ディレクトリ
+from typing import Any, Dict, List #型ヒント用
+
+APP_FILE = "shift_app_8.py" #計測するアプリ
+PAGES = ["カレンダー", "シフト一覧", "勤務先設定"] #サイドバーのページ
+HEAVY_MODULES = ["pandas", "numpy", "jpholiday"] #初回表示までに読み込まれたかを記録するモジュール
+DATA_FILES = ["shifts_data.csv", "shifts_journal.jsonl", "settings.json", "shifts.db", "shifts_arrow"] #計測に使うデータ（shifts_arrow はArrow形式のディレクトリ）
+
+# 子プロセスで実行するコード（結果をJSONで1行出力する）
+CHILD_CODE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import streamlit
+t1 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.session_state["page"] = sys.argv[2]
+t2 = time.perf_counter()
+at.run()
+t3 = time.perf_counter()
+print(json.dumps({
+    "import_streamlit_s": t1 - t0,
+    "first_render_s": t3 - t2,
+    "exception": [str(e.value) for e in at.exception],
+    "loaded": {m: m in sys.modules for m in json.loads(sys.argv[3])},
+}))
+"""
+
+
+def prepare_workdir(src_dir: str) -> str:
+    """アプリとデータを作業用ディレクトリにコピーする（計測で元のデータを書き換えないため）"""
+    work = tempfile.mkdtemp(prefix="shift_bench_")
+    for name in os.listdir(src_dir):
+        path = os.path.join(src_dir, name)
+        if name in DATA_FILES and os.path.isdir(path):
+            shutil.copytree(path, os.path.join(work, name))
+        elif name.endswith(".py") or name in DATA_FILES:
+            shutil.copy(path, work)
+    if os.path.isdir(os.path.join(src_dir, "blobs")):
+        shutil.copytree(os.path.join(src_dir, "blobs"), os.path.join(work, "blobs"))
+    return work
+
+
+def measure_page(work: str, page: str) -> Dict[str, Any]:
+    """新しいプロセスで1ページ分の初回表示を測る"""
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE, os.path.join(work, APP_FILE), page, json.dumps(HEAVY_MODULES)],
+        cwd=work,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run(repeat: int, src_dir: str) -> List[Dict[str, Any]]:
+    """ページごとに repeat 回測り、中央値をまとめる"""
+    work = prepare_workdir(src_dir)
+    try:
+        results = []
+        for page in PAGES:
+            samples = [measure_page(work, page) for _ in range(repeat)]
+            results.append({
+                "page": page,
+                "import_streamlit_s": statistics.median(s["import_streamlit_s"] for s in samples),
+                "first_render_s": statistics.median(s["first_render_s"] for s in samples),
+                "loaded": samples[-1]["loaded"],
+                "exception": samples[-1]["exception"],
+            })
+        return results
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="シフト管理アプリの起動時間（ページごとの初回表示）を測る")
+    parser.add_argument("--repeat", type=int, default=3, help="ページごとの計測回数（中央値を使う）")
+    parser.add_argument("--json", help="結果を保存するJSONファイル")
+    parser.add_argument("--dir", default=os.path.dirname(os.path.abspath(__file__)), help="アプリとデータのあるディレクトリ")
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.dir)
+    for r in results:
+        loaded = ", ".join(m for m, ok in r["loaded"].items() if ok) or "-"
+        print(
+            f"{r['page']:<8} streamlit読込 {r['import_streamlit_s']:.3f}s  "
+            f"初回表示 {r['first_render_s']:.3f}s  読み込まれた重いモジュール: {loaded}"
+            + (f"  例外: {r['exception']}" if r["exception"] else "")
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
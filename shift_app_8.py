@@ -2,199 +2,135 @@
 
 1
 import streamlit as st #WebアプリフレームワークStreamlitをインポート
-import pandas as pd #データ処理用のpandasをインポート
 from datetime import datetime, date, time, timedelta #日付・時刻関連クラスをインポート
-import calendar #カレンダー生成用モジュール
 import os #ファイル存在チェックなどに利用
-import base64 #画像などをBase64エンコード/デコードするため
+import hashlib #設定の変更検知（内容のハッシュ）用
+import inspect #Streamlitのバージョンごとの引数の有無を調べるため
 import json #設定の保存・読み込みに利用
+import sqlite3 #SQLiteバックエンド用
 from typing import Dict, Any, Optional #型ヒント用（辞書型などに使う）
-import jpholiday #日本の祝日判定用ライブラリ
+from shift_store import ( #シフトの保存（スナップショット＋ジャーナル / SQLite）
+    add_op,
+    apply_ops,
+    atomic_write_text,
+    get_blob,
+    is_blob_digest,
+    put_blob,
+    delete_op,
+    ensure_shift_ids,
+    file_lock,
+    load_records,
+    merge_settings,
+    new_shift_id,
+    record_ops,
+    sqlite_apply_ops,
+    sqlite_connect,
+    sqlite_count,
+    sqlite_data_version,
+    sqlite_date_bounds,
+    sqlite_import_if_empty,
+    sqlite_load_records,
+    sqlite_load_rollup,
+    sqlite_query_shifts,
+    sqlite_replace_all,
+    sqlite_save_workplaces,
+    sqlite_workplaces,
+    storage_version,
+    update_op,
+    user_data_dir,
+    write_snapshot,
+)
+from shift_arrow import ( #列指向の保存（Arrow IPC、年度ごとのファイル）
+    arrow_apply_ops,
+    arrow_count,
+    arrow_date_bounds,
+    arrow_import_if_empty,
+    arrow_load_records,
+    arrow_load_rollup,
+    arrow_manifest_file,
+    arrow_open,
+    arrow_query_shifts,
+    arrow_replace_all,
+    arrow_workplaces,
+)
+from shift_config import ( #勤務先設定・勤務パターン（ファイルが変わったときだけ読み直す読み取り専用の設定）
+    apply_overrides,
+    load_config,
+    read_settings_file,
+    serialize_shift_patterns_for_settings,
+    set_override,
+    thaw,
+)
+from shift_timing import begin_run, end_run, record_section, section_start, section_stats, timed #区間ごとの処理時間
+# pandas / numpy / jpholiday と、それを使う計算モジュール（shift_engine・shift_calendar・shift_quality・shift_rollup）は
+# 必要になった関数・ページの中で読み込む。勤務先設定ページなどは pandas を読み込まずに表示できる（起動直後の初回表示を速くするため）
 
+begin_run() #この再実行の処理時間の記録を始める
 st.set_page_config(page_title="シフト(給料)管理アプリ", layout="wide") #ページタイトルとレイアウトを設定
 st.title("シフト(給料)管理") #アプリ上部のタイトル表示
 
-DATA_FILE = "shifts_data.csv" #シフト情報を保存するCSVファイル名
-SETTINGS_FILE = "settings.json" #設定情報を保存するJSONファイル名
-
-
-### 勤務先ごとの設定マスタ
-WORKPLACE_SETTINGS = { #各バイト先ごとのルールやデフォルト時給などを定義
-    "すたば": { #バイト先「すたば」の設定
-        "default_wage": 1310, #デフォルト時給
-        "default_transport": 640, #デフォルト交通費
-        "wage_history": [ #時給改定の履歴（開始日と時給）
-            {"from": "2024-12-12", "wage": 1200},
-            {"from": "2025-04-01", "wage": 1220},
-            {"from": "2025-10-01", "wage": 1310},
-        ],
-        "pre_minutes": 10, #給与計算上、開始前に自動でプラスされる分数
-        "post_minutes": 5, #給与計算上、終了後に自動でプラスされる分数
-        "break_rules": [ #勤務時間に応じた休憩時間の自動付与ルール
-            {"min_hours": 4, "break_minutes": 15},
-            {"min_hours": 6, "break_minutes": 45},
-            {"min_hours": 8, "break_minutes": 60},
-        ],
-        "night_start": 22, #深夜時間帯の開始時刻（時）
-        "night_end": 1, #深夜時間帯の終了時刻（時）
-        "night_rate": 1.25, #深夜割増率（1.25倍など）
-        "early_start": 5, #早朝手当の開始時刻（時）
-        "early_end": 7, #早朝手当の終了時刻（時）
-        "early_bonus_per_hour": 160, #早朝手当（円/時間）
-        "busy_bonus_per_hour": 200,  #繁忙期手当（円/時間）
-    },
-    "駿台": { #バイト先「駿台」の設定
-        "default_wage": 1350,
-        "default_transport": 0,
-        "wage_history": [
-            {"from": "2024-04-24", "wage": 1200},
-            {"from": "2025-04-01", "wage": 1350},
-        ],
-        "pre_minutes": 0,
-        "post_minutes": 0,
-        "break_rules": [
-            {"min_hours": 6, "break_minutes": 45},
-        ],
-        "night_start": 23,
-        "night_end": 1,
-        "night_rate": 1, #深夜割増なし
-        "early_start": 5,
-        "early_end": 6,
-        "early_bonus_per_hour": 0, #早朝手当なし
-        "busy_bonus_per_hour": 0, #繁忙期手当なし
-    },
-    "C": { #バイト先「C」の設定
-        "default_wage": 1100,
-        "default_transport": 0, 
-        "wage_history": [
-            {"from": "2024-01-01", "wage": 1100},
-        ],
-        "pre_minutes": 0,
-        "post_minutes": 0,
-        "break_rules": [
-            {"min_hours": 5, "break_minutes": 30},
-            {"min_hours": 8, "break_minutes": 60},
-        ],
-        "night_start": 22,
-        "night_end": 5,
-        "night_rate": 1.25,
-        "early_start": 5,
-        "early_end": 8,
-        "early_bonus_per_hour": 0,
-        "busy_bonus_per_hour": 0,
-    },
-    "D": { #バイト先「D」の設定
-        "default_wage": 1100,
-        "default_transport": 0, 
-        "wage_history": [
-            {"from": "2024-01-01", "wage": 1100},
-        ],
-        "pre_minutes": 0,
-        "post_minutes": 0,
-        "break_rules": [], #特に休憩ルールなし
-        "night_start": 22,
-        "night_end": 5,
-        "night_rate": 1.25,
-        "early_start": 5,
-        "early_end": 8,
-        "early_bonus_per_hour": 0,
-        "busy_bonus_per_hour": 0,
-    },
-}
+# 保存先：SHIFT_DATA_ROOT（未設定なら作業ディレクトリ）。利用者が分かるときは、その下の users/<利用者> に分ける
+DATA_ROOT = os.environ.get("SHIFT_DATA_ROOT", "")
+USER_HEADER = os.environ.get("SHIFT_USER_HEADER") #利用者IDを渡すHTTPヘッダー名（認証つきのリバースプロキシの後ろで動かすとき）
+
+
+def current_user_id() -> Optional[str]:
+    """この利用者のID（USER_HEADER のヘッダー、なければStreamlitのログイン情報。どちらもなければ None）"""
+    if USER_HEADER:
+        value = st.context.headers.get(USER_HEADER)
+        if value and value.strip():
+            return value.strip()
+    user = getattr(st, "user", None)
+    try:
+        if user is not None and user.get("is_logged_in"):
+            return user.get("email") or user.get("sub")
+    except Exception: #ログイン機能を設定していないStreamlitでもアプリが止まらないようにする
+        pass
+    return None
+
+
+DATA_DIR = user_data_dir(DATA_ROOT, current_user_id()) #この利用者のデータの置き場所
+DATA_FILE = os.path.join(DATA_DIR, "shifts_data.csv") #シフト情報を保存するCSVファイル名
+JOURNAL_FILE = os.path.join(DATA_DIR, "shifts_journal.jsonl") #シフトの追加・変更・削除を追記していくジャーナル
+SETTINGS_FILE = os.path.join(DATA_DIR, "settings.json") #設定情報を保存するJSONファイル名
+DB_FILE = os.path.join(DATA_DIR, "shifts.db") #SQLiteバックエンドのDBファイル名
+ARROW_DIR = os.path.join(DATA_DIR, "shifts_arrow") #Arrow形式で保存するディレクトリ（年度ごとのファイル）
+BLOB_DIR = os.path.join(DATA_DIR, "blobs") #背景画像などをSHA-256をキーに保存するディレクトリ
+AGGREGATE_CACHE_ENTRIES = 32 #集計結果を覚えておく件数（超えたら古いものから捨てる）
+OPS_PAGE_SIZES = [20, 50, 100, 200] #シフト一覧の操作欄で1ページに並べる件数の選択肢
+TIMING_LOG_FILE = os.environ.get("SHIFT_TIMING_LOG") #再実行ごとの処理時間を追記するJSONL（未設定なら書かない）
+
+# 保存方式："csv"（CSV＋ジャーナル、既定）、"sqlite"（表示範囲だけをDBから読み出す）、
+# "arrow"（年度ごとの列指向ファイル。表示範囲にかかる年度だけを開く。pyarrow が必要）
+STORAGE_BACKEND = os.environ.get("SHIFT_STORAGE_BACKEND", "csv")
+USE_SQLITE = STORAGE_BACKEND == "sqlite"
+USE_ARROW = STORAGE_BACKEND == "arrow"
+
+
+### 勤務先ごとの設定マスタ（既定値は shift_config。設定ファイルの内容を重ねたものを CONFIG として読み込む）
 
 #背景テーマのプリセット
 THEME_OPTIONS = ["シンプルホワイト", "スタバグリーン", "ネイビーダーク", "パステルピンク"] #背景テーマの選択肢
 
-#よく使う勤務パターン
-SHIFT_PATTERNS = { #フォームで選べる「勤務パターン」プリセット
-    "すたば:15-CL": {
-        "workplace": "すたば",
-        "start": time(15, 0), #15:00開始
-        "end": time(22, 30), #22:30終了
-        "wage": 1310,
-        "manual_break_min": 45,
-    },
-    "すたば:18-CL": {
-        "workplace": "すたば",
-        "start": time(18, 0),
-        "end": time(22, 30),
-        "wage": 1310,
-        "manual_break_min": 15,
-    },
-    "駿台:CL業務": {
-        "workplace": "駿台",
-        "start": time(18, 0),
-        "end": time(22, 00),
-        "wage": 1350,
-        "manual_break_min": 0,
-    },
-}
-
-# === 勤務パターン設定：JSON保存用の変換関数 ===
-def serialize_shift_patterns_for_settings(
-    patterns: Dict[str, Dict[str, Any]]
-) -> Dict[str, Any]:
-    """SHIFT_PATTERNS を settings.json に保存できる形に変換"""
-    result: Dict[str, Any] = {}
-    for name, p in patterns.items():
-        start_val = p.get("start")
-        end_val = p.get("end")
-        result[name] = {
-            "workplace": p.get("workplace", ""),
-            "start": start_val.strftime("%H:%M") if isinstance(start_val, time) else start_val,
-            "end": end_val.strftime("%H:%M") if isinstance(end_val, time) else end_val,
-            "wage": p.get("wage"),
-            "manual_break_min": int(p.get("manual_break_min", 0)),
-        }
-    return result
-
-
-def load_shift_patterns_from_settings(
-    data: Dict[str, Any]
-) -> Dict[str, Dict[str, Any]]:
-    """settings.json に保存したパターン情報を SHIFT_PATTERNS 形式に戻す"""
-    loaded: Dict[str, Dict[str, Any]] = {}
-    for name, p in data.items():
-        start_str = p.get("start")
-        end_str = p.get("end")
-        start_obj = (
-            datetime.strptime(start_str, "%H:%M").time()
-            if isinstance(start_str, str) and start_str
-            else time(0, 0)
-        )
-        end_obj = (
-            datetime.strptime(end_str, "%H:%M").time()
-            if isinstance(end_str, str) and end_str
-            else time(0, 0)
-        )
-        loaded[name] = {
-            "workplace": p.get("workplace", ""),
-            "start": start_obj,
-            "end": end_obj,
-            "wage": p.get("wage"),
-            "manual_break_min": int(p.get("manual_break_min", 0)),
-        }
-    return loaded
 
 def get_default_wage_for_date(workplace: str, shift_date: date) -> int:
     """
     勤務先と日付から、その日に適用されるデフォルト時給を返す。
     時給履歴(wage_history)があれば、開始日以降の最新レコードを使う。
+    履歴は勤務先ごとに一度だけ時給テーブルに変換し、二分探索で引く。
     """
+    from shift_engine import get_wage_table #時給テーブル（初回のみ読み込み）
+
     settings = WORKPLACE_SETTINGS.get(workplace, {}) #指定の勤務先設定を取得（なければ空dict）
-    history = settings.get("wage_history") #時給履歴を取得
+    return get_wage_table(workplace, settings).wage_for_date(shift_date) #時給テーブルから取得
+
 
-    if history: #履歴があれば、日付に応じて選ぶ
-        history_sorted = sorted(history, key=lambda h: h["from"]) #from日付でソート
-        chosen_wage = None #適用される時給
-        for h in history_sorted: #古い順に確認
-            from_date = datetime.strptime(h["from"], "%Y-%m-%d").date() #"YYYY-MM-DD" を date型に
-            if shift_date >= from_date: #シフト日が開始日以降なら候補
-                chosen_wage = h["wage"]
-        if chosen_wage is not None: #適用時給が見つかったら返す
-            return int(chosen_wage)
+def wages_for_dates(workplace: str, dates) -> "np.ndarray":
+    """get_default_wage_for_date の一括版（日付の列から時給の配列を返す）"""
+    from shift_engine import dates_to_ordinals, get_wage_table
 
-    return int(settings.get("default_wage", 1100)) #見つからなければ default_wage か 1100を返す
+    settings = WORKPLACE_SETTINGS.get(workplace, {})
+    return get_wage_table(workplace, settings).wages_for_ordinals(dates_to_ordinals(dates))
 
 def get_default_transport_for_workplace(workplace: str) -> int:
     """
@@ -220,23 +156,331 @@ def color_by_workplace(row): #DataFrame Styler用のカラー関数
 
 
 ### データの保存・読み込み
-def save_shifts() -> None:
-    """セッション内のシフトをCSVに自動保存"""
-    if "shifts" not in st.session_state: #シフトがなければ何もしない
-        return
-    df_save = pd.DataFrame(st.session_state["shifts"]) #シフトリストをDataFrameに変換
-    if not df_save.empty and "date" in df_save.columns: #date列がある場合
-        df_save["date"] = pd.to_datetime(df_save["date"]).dt.strftime("%Y-%m-%d") #日付を文字列に変換
-    df_save.to_csv(DATA_FILE, index=False) #CSVとして保存（インデックス列は保存しない）
+def open_db() -> Optional[sqlite3.Connection]:
+    """SQLiteバックエンドならDBに接続する（DBが空ならCSVから一度だけ取り込む）"""
+    if not USE_SQLITE:
+        return None
+    conn = sqlite_connect(DB_FILE)
+    sqlite_import_if_empty(conn, DATA_FILE, JOURNAL_FILE)
+    return conn
+
+
+def open_arrow() -> Optional[str]:
+    """Arrow形式なら保存ディレクトリを用意する（まだ空ならCSVから一度だけ取り込む）"""
+    if not USE_ARROW:
+        return None
+    root = arrow_open(ARROW_DIR)
+    arrow_import_if_empty(root, DATA_FILE, JOURNAL_FILE)
+    return root
+
+
+db_conn = open_db() #再実行ごとに1回だけ接続
+arrow_root = open_arrow()
+_all_shifts_df: Optional["pd.DataFrame"] = None #CSV方式のときの全シフトDataFrame（再実行ごとに作り直す）
+
+
+def data_lock():
+    """シフトの保存先の排他ロック（同じデータを開いているほかのセッション・プロセスの書き込みを待つ）"""
+    if db_conn is not None:
+        return file_lock(DB_FILE)
+    if arrow_root is not None:
+        return file_lock(arrow_manifest_file(arrow_root)) #shift_arrow の書き込みと同じロック
+    return file_lock(DATA_FILE)
+
+
+def save_shifts(records: Optional[list[Dict[str, Any]]] = None) -> None:
+    """全シフトを書き出す（CSV読み込みなど全件入れ替え時用。records を省くと今の全シフトを書き直す）"""
+    global _all_shifts_df
+    with data_lock():
+        if records is None:
+            refresh_session_shifts() #ほかのセッションの変更を取り込んでから書き直す
+            records = all_shift_records()
+        _all_shifts_df = None #読み出し用のDataFrameを作り直させる
+        if db_conn is not None:
+            sqlite_replace_all(db_conn, records) #テーブルを丸ごと入れ替える
+        elif arrow_root is not None:
+            arrow_replace_all(arrow_root, records) #年度ごとのファイルを書き直す（集計も作り直される）
+        else:
+            from shift_rollup import build_rollup
+
+            st.session_state["shifts"] = records
+            write_snapshot(records, DATA_FILE, JOURNAL_FILE) #スナップショットを作り直す
+            st.session_state["rollup"] = build_rollup(_all_shifts()) #全件入れ替えなので集計も作り直す
+        bump_data_version() #集計キャッシュを新しいデータで引き直させる
+
+
+def commit_shift_ops(ops: list[Dict[str, Any]]) -> None:
+    """シフトの追加・変更・削除を反映して保存（履歴の長さによらず一定のI/O）"""
+    global _all_shifts_df
+    with data_lock():
+        if db_conn is not None:
+            sqlite_apply_ops(db_conn, ops) #DBに1トランザクションで反映
+        elif arrow_root is not None:
+            arrow_apply_ops(arrow_root, ops) #触れた年度のファイルだけ書き直す
+        else:
+            from shift_rollup import rollup_apply_ops
+
+            refresh_session_shifts() #ほかのセッションが追記していたら、その上に積む（上書きで消さない）
+            touched = {op["id"] for op in ops if op.get("op") in ("update", "delete")} #更新・削除されるシフトID
+            before = {s["id"]: s for s in find_shifts(list(touched))} if touched else {} #操作前のシフト
+            rollup_apply_ops(current_rollup(), ops, before) #月別・勤務先別の集計を差分だけ更新
+            apply_ops(session_shifts(), ops) #セッション内のシフト一覧に反映
+            record_ops(ops, session_shifts(), DATA_FILE, JOURNAL_FILE) #ジャーナルに追記
+        _all_shifts_df = None #読み出し用のDataFrameを作り直させる
+        bump_data_version() #集計キャッシュを新しいデータで引き直させる
+
+
+def bump_data_version() -> None:
+    """シフトを読み込んだ・書き換えたあとに、このセッションのデータのバージョンを更新する"""
+    st.session_state["data_version"] = storage_version(DATA_FILE, JOURNAL_FILE)
+
+
+def current_rollup() -> Dict[Any, list]:
+    """月別・勤務先別の集計（SQLiteならDBの shift_rollups、CSV方式ならセッション内）"""
+    if db_conn is not None:
+        return sqlite_load_rollup(db_conn)
+    if arrow_root is not None:
+        return arrow_load_rollup(arrow_root)
+    if "rollup" not in st.session_state:
+        from shift_rollup import build_rollup
+
+        st.session_state["rollup"] = build_rollup(_all_shifts())
+    return st.session_state["rollup"]
+
+
+def data_version() -> tuple:
+    """集計キャッシュのキーにするデータのバージョン"""
+    if db_conn is not None: #SQLiteは書き換えのトランザクションごとに増えるDB内のカウンタ（DBファイルごとに別）
+        return (DB_FILE, sqlite_data_version(db_conn))
+    if arrow_root is not None: #Arrow形式は書き込みのたびに manifest.json が置き換わり、そのカウンタが増える
+        return storage_version(arrow_manifest_file(arrow_root))
+    return st.session_state.get("data_version", ()) #CSV方式はセッション内のシフト一覧が対応するファイルの状態
+
+
+### シフトの読み出し（絞り込みは保存方式に合わせて行う）
+def prepare_shift_df(df: "pd.DataFrame") -> "pd.DataFrame":
+    """表示・集計用にDataFrameを整える（日付の型変換と欠損カラム対策）"""
+    import pandas as pd #シフトを表で扱うページで初めて読み込む
+    from shift_rollup import DURATION_COLUMNS, duration_minutes_column, minutes_to_hours
+
+    started = section_start()
+    if "date" not in df.columns:
+        df["date"] = pd.Series(dtype="datetime64[ns]")
+    df["date"] = pd.to_datetime(df["date"]) #date列をdatetime型に変換
+
+   #欠損カラム対策（古いCSVなどでも動くように）
+    for col, hours_col in DURATION_COLUMNS.items(): #時間は分の整数列で持ち、時間数は表示用にそこから作る
+        df[col] = duration_minutes_column(df, col) #分の列がない古いシフトは時間数から
+        df[hours_col] = minutes_to_hours(df[col])
+
+    if "transport" not in df.columns: #transport列がない場合
+        df["transport"] = 0
+    df["transport"] = df["transport"].fillna(0).astype(int) #NaNを0にしintへ
+
+    if "busy_bonus" not in df.columns: #busy_bonus列がない場合
+        df["busy_bonus"] = 0
+    df["busy_bonus"] = df["busy_bonus"].fillna(0).astype(int)
+
+    if "pay" not in df.columns: #pay列がない場合
+        df["pay"] = 0
+    df["pay"] = df["pay"].fillna(0).astype("int64") #給与は整数の円のまま合計する
+
+    if "memo" not in df.columns: #memo列がない場合
+        df["memo"] = ""
+    df["memo"] = df["memo"].fillna("") #NaNを空文字に
+
+    if "crosses_midnight" not in df.columns: #日付またぎの列がない場合
+        df["crosses_midnight"] = None
+    missing = df["crosses_midnight"].isna()
+    if missing.any(): #列ができる前に保存したシフトは開始・終了時刻から判定
+        from shift_engine import crosses_midnight_array
+        df.loc[missing, "crosses_midnight"] = crosses_midnight_array(df[missing])
+    df["crosses_midnight"] = df["crosses_midnight"].astype(bool)
+    record_section("prepare_shift_df", started, rows=len(df))
+    return df
+
+
+def _all_shifts() -> "pd.DataFrame":
+    """CSV方式：セッション内の全シフトをDataFrameにする（1回の再実行で1回だけ）"""
+    import pandas as pd
+
+    global _all_shifts_df
+    if _all_shifts_df is None:
+        _all_shifts_df = prepare_shift_df(pd.DataFrame(session_shifts()))
+    return _all_shifts_df
+
+
+def query_shifts(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    workplaces: Optional[list[str]] = None,
+) -> "pd.DataFrame":
+    """日付範囲（両端含む）・勤務先で絞り込んだシフトのDataFrameを返す"""
+    import pandas as pd
+
+    if db_conn is not None: #SQLiteなら条件をクエリとしてDBに渡す
+        return prepare_shift_df(sqlite_query_shifts(db_conn, start, end, workplaces))
+    if arrow_root is not None: #Arrow形式なら範囲にかかる年度のファイルだけを開く
+        return prepare_shift_df(arrow_query_shifts(arrow_root, start, end, workplaces))
+    df = _all_shifts()
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df["date"] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df["date"] <= pd.Timestamp(end)
+    if workplaces is not None:
+        mask &= df["workplace"].isin(workplaces)
+    return df[mask].copy()
+
+
+def find_shifts(shift_ids: list[str]) -> list[Dict[str, Any]]:
+    """IDでシフトを探す（CSV方式ではセッション内のdictそのものを返す）"""
+    if db_conn is not None:
+        return sqlite_load_records(db_conn, ids=list(shift_ids))
+    if arrow_root is not None:
+        return arrow_load_records(arrow_root, ids=list(shift_ids))
+    wanted = set(shift_ids)
+    return [s for s in session_shifts() if s.get("id") in wanted]
+
+
+def all_shift_records() -> list[Dict[str, Any]]:
+    """全シフトのdictリスト（全件の再計算・保存し直し用）"""
+    if db_conn is not None:
+        return sqlite_load_records(db_conn)
+    if arrow_root is not None:
+        return arrow_load_records(arrow_root)
+    return session_shifts()
+
+
+def count_shifts() -> int:
+    """シフトの件数"""
+    if db_conn is not None:
+        return sqlite_count(db_conn)
+    if arrow_root is not None:
+        return arrow_count(arrow_root)
+    return len(session_shifts())
+
+
+def shift_date_bounds() -> tuple[date, date]:
+    """最初と最後のシフトの日付"""
+    if db_conn is not None:
+        return sqlite_date_bounds(db_conn)
+    if arrow_root is not None:
+        return arrow_date_bounds(arrow_root)
+    df = _all_shifts()
+    return df["date"].min().date(), df["date"].max().date()
+
+
+def shift_workplaces() -> list[str]:
+    """シフトに登場する勤務先の一覧"""
+    if db_conn is not None:
+        return sqlite_workplaces(db_conn)
+    if arrow_root is not None:
+        return arrow_workplaces(arrow_root)
+    return sorted(_all_shifts()["workplace"].dropna().unique().tolist())
+
+
+def period_aggregates(start: date) -> Dict[str, Any]:
+    """集計開始日以降の集計（データ・集計開始日・設定が前回と同じならキャッシュから返す）"""
+    return cached_period_aggregates(data_version(), start, CONFIG.version)
+
+
+@st.cache_data(max_entries=AGGREGATE_CACHE_ENTRIES, show_spinner=False)
+def cached_period_aggregates(
+    version: tuple, start: date, settings_hash: str
+) -> Dict[str, Any]:
+    """(データのバージョン, 集計開始日, 設定のハッシュ) ごとの集計結果（全セッション共通、古いものから捨てる）"""
+    return compute_period_aggregates(start)
+
+
+def compute_period_aggregates(start: date) -> Dict[str, Any]:
+    """集計開始日以降の合計・勤務先別・月別の集計（月別・勤務先別の集計から組み立てる）"""
+    import calendar #月末の日付用
+    from shift_rollup import rollup_period_aggregates
+
+    partial_month = None
+    if start.day != 1: #開始月だけは日単位で絞ったシフトから足す
+        month_end = date(start.year, start.month, calendar.monthrange(start.year, start.month)[1])
+        partial_month = query_shifts(start, month_end)
+    return rollup_period_aggregates(current_rollup(), start, partial_month)
+
+
+def income_forecast(start: date, limit: int) -> Any:
+    """年度末の収入の見込み（シフトが追加されるとデータのバージョンが変わり、次の表示で計算し直す）"""
+    return cached_income_forecast(data_version(), start, date.today(), limit, CONFIG.version)
+
+
+@st.cache_data(max_entries=AGGREGATE_CACHE_ENTRIES, show_spinner=False)
+def cached_income_forecast(
+    version: tuple, start: date, today: date, limit: int, settings_hash: str
+) -> Any:
+    """(データのバージョン, 集計開始日, 今日, 上限, 設定のハッシュ) ごとの見込み（全セッション共通）"""
+    return compute_income_forecast(start, today, limit)
+
 
+def compute_income_forecast(start: date, today: date, limit: int) -> Any:
+    """期間の月別集計と、今月（と期間の最後の月の端）のシフトだけから見込みを計算する"""
+    import calendar #月末の日付用
+    from shift_forecast import forecast_income, period_end_of
 
+    end = period_end_of(start)
+    by_month_frame = period_aggregates(start)["by_month"]
+    by_month = dict(zip(by_month_frame["year_month"], by_month_frame["total_pay"].astype(int)))
+    if end.day != calendar.monthrange(end.year, end.month)[1]: #最後の月は期間の終わりまでで切る
+        by_month[end.strftime("%Y-%m")] = int(query_shifts(end.replace(day=1), end)["pay"].sum())
+    current_month = None
+    if start <= today <= end: #今月は今日までと明日以降に分けるので、日付ごとの給与が要る
+        month_end = date(today.year, today.month, calendar.monthrange(today.year, today.month)[1])
+        current_month = query_shifts(max(today.replace(day=1), start), min(month_end, end))[["date", "pay"]]
+    return forecast_income(current_rollup(), start, today, limit, by_month, current_month)
+
+
+def settings_fingerprint(settings: Dict[str, Any]) -> str:
+    """設定内容のハッシュ（変更があったかどうかの判定用）"""
+    text = json.dumps(settings, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def set_background_image(data: bytes, mime: str) -> None:
+    """背景画像をブロブ置き場に保存し、セッションにはハッシュとMIMEタイプだけを持つ"""
+    st.session_state["bg_file_digest"] = put_blob(BLOB_DIR, data) #画像のSHA-256
+    st.session_state["bg_file_mime"] = mime #MIMEタイプを保存
+
+
+def background_image_style(digest: str, mime: str) -> Optional[str]:
+    """背景画像のCSS（画像がブロブ置き場になければ None。見つからなかったことはキャッシュしない）"""
+    try:
+        return cached_background_image_style(digest, mime)
+    except FileNotFoundError: #あとで同じ画像が保存されれば、次の再実行で表示される
+        return None
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_background_image_style(digest: str, mime: str) -> str:
+    """背景画像のCSS（data URI）を作る。画像のハッシュごとに1回だけBase64にする"""
+    data = get_blob(BLOB_DIR, digest)
+    if data is None: #ブロブが見つからない場合（例外はキャッシュされない）
+        raise FileNotFoundError(digest)
+    import base64 #画像などをBase64エンコードするため
+
+    encoded = base64.b64encode(data).decode() #Base64文字列に変換
+    return f"""
+        background-image:
+            linear-gradient(rgba(0, 0, 0, 0.1), rgba(0, 0, 0, 0.1)),
+            url("data:{mime};base64,{encoded}");
+        background-size: cover;
+        background-position: center;
+    """ #背景画像を画面全体に表示するCSS
+
+
+@timed("save_settings")
 def save_settings(
     limit_income: int,
     fiscal_start: date,
     theme_name: Optional[str] = None,
     workplace_settings: Optional[Dict[str, Any]] = None,
 ) -> None:
-    """設定＋背景画像も JSON に保存"""
+    """設定＋背景画像も JSON に保存（前回保存時から内容が変わったときだけ書き込む）"""
     settings: Dict[str, Any] = { #保存する設定の辞書を作成
         "limit_income": limit_income, #扶養の上限金額
         "fiscal_start": fiscal_start.strftime("%Y-%m-%d"), #集計開始日を文字列に
@@ -245,7 +489,7 @@ def save_settings(
         settings["theme_name"] = theme_name
 
     if workplace_settings is not None: #勤務先設定が指定されていれば保存
-        settings["workplace_settings"] = workplace_settings
+        settings["workplace_settings"] = thaw(workplace_settings) #読み取り専用の表をふつうの辞書に戻す
         
     try:
         settings["shift_patterns"] = serialize_shift_patterns_for_settings(
@@ -254,257 +498,197 @@ def save_settings(
     except Exception: #NameError? など万一のエラーに備える
         pass #万一エラーが出てもアプリが止まらないようにする
 
-   #背景画像（あれば）も保存
-    if "bg_file_bytes" in st.session_state: #セッションに背景画像があれば
-        try:
-            settings["bg_image_b64"] = base64.b64encode(
-                st.session_state["bg_file_bytes"]
-            ).decode() #画像バイト列をBase64文字列に
-            settings["bg_image_mime"] = st.session_state.get(
-                "bg_file_mime", "image/png"
-            ) #MIMEタイプも保存
-        except Exception:
-            pass #万一エラーが出てもアプリが止まらないようにする
+   #背景画像（あれば）は画像本体ではなくブロブのハッシュとMIMEタイプだけを保存
+    if "bg_file_digest" in st.session_state: #セッションに背景画像があれば
+        settings["bg_image_sha256"] = st.session_state["bg_file_digest"]
+        settings["bg_image_mime"] = st.session_state.get("bg_file_mime", "image/png")
 
-    with open(SETTINGS_FILE, "w") as f: #JSONファイルとして保存
-        json.dump(settings, f)
+    fingerprint = settings_fingerprint(settings) #今回の設定内容のハッシュ
+    if st.session_state.get("settings_saved_hash") == fingerprint: #前回の保存内容と同じなら何もしない
+        return
+
+    mine = json.loads(json.dumps(settings)) #ファイルから読んだ内容と比べられる形にそろえる
+    with file_lock(SETTINGS_FILE): #読んでから書くまでの間にほかのセッションが保存しないように
+        merged = merge_settings( #このセッションで変えた項目だけを今のファイルの内容に反映（ほかのセッションの変更は残す）
+            read_settings_file(SETTINGS_FILE), st.session_state.get("settings_baseline", {}), mine
+        )
+        atomic_write_text(SETTINGS_FILE, json.dumps(merged)) #一時ファイルに書いてから置き換える
+        if db_conn is not None and workplace_settings is not None: #SQLiteなら勤務先・時給履歴・パターンはDBにも保存
+            sqlite_save_workplaces(
+                db_conn, merged.get("workplace_settings", {}), merged.get("shift_patterns", {})
+            )
+    st.session_state["settings_saved_hash"] = fingerprint #保存した内容のハッシュを記録
+    st.session_state["settings_baseline"] = mine #次の保存はここからの変更だけを反映する
+    st.session_state["workplace_overrides"] = {} #編集中の値はファイルに入ったので、次の再実行からは設定として読む
+    st.session_state["pattern_overrides"] = {}
+
+
+def session_shifts() -> list[Dict[str, Any]]:
+    """CSV方式のセッション内のシフト一覧（初めて使うときに読み込む。勤務先設定ページだけなら読み込まない）"""
+    if "shifts" not in st.session_state: #初回アクセス時など、セッションにシフトがない場合
+        load_shifts() #CSVから読み込む
+    return st.session_state["shifts"]
 
 
 def load_shifts() -> None:
-    """起動時にCSVがあれば読み込む(空ファイルは無視)"""
-    if os.path.exists(DATA_FILE): #CSVファイルが存在するかチェック
-        if os.path.getsize(DATA_FILE) == 0: #ファイルサイズが0なら中身なし
-            st.session_state["shifts"] = [] #空リストとして初期化
-            return
-
-        try:
-            df_loaded = pd.read_csv(DATA_FILE) #CSVを読み込み
-        except pd.errors.EmptyDataError: #形式的には存在するが中身が空の場合
-            st.session_state["shifts"] = []
-            return
-
-        if "date" in df_loaded.columns: #date列がある場合
-            df_loaded["date"] = pd.to_datetime(df_loaded["date"]).dt.date #date列をdate型に変換
-        st.session_state["shifts"] = df_loaded.to_dict(orient="records") #レコードのリストに変換して保存
-    else:
-        st.session_state["shifts"] = [] #ファイルがなければ空リストで初期化
+    """起動時にCSV(スナップショット)を読み込み、ジャーナルの操作を再生する"""
+    global _all_shifts_df
+    if db_conn is not None or arrow_root is not None: #SQLite / Arrow形式なら必要な範囲をその都度読むので、ここでは読み込まない
+        st.session_state["shifts"] = []
+        return
+    with data_lock(), timed("load_shifts") as sample: #読み込み時のコンパクションがほかの書き込みと重ならないように
+        st.session_state["shifts"] = load_records(DATA_FILE, JOURNAL_FILE) #IDのないシフトにはIDを付与
+        sample["rows"] = len(st.session_state["shifts"])
+        bump_data_version() #読み込んだファイルの状態を記録
+    _all_shifts_df = None
+    st.session_state.pop("rollup", None) #集計は次に使うときに作り直す
 
 
-def load_settings() -> Optional[Dict[str, Any]]:
-    """設定ファイル(JSON)の読み込み＋テーマ＆背景画像＆勤務先設定の復元"""
-    global WORKPLACE_SETTINGS, SHIFT_PATTERNS #グローバルな勤務先設定を更新するためglobal宣言
+def refresh_session_shifts() -> None:
+    """CSV方式：読み込んだあとにほかのセッションがファイルを書き換えていたら、セッション内のシフトを読み直す"""
+    if db_conn is not None or arrow_root is not None or "shifts" not in st.session_state:
+        return
+    if st.session_state.get("data_version") != storage_version(DATA_FILE, JOURNAL_FILE):
+        load_shifts()
+
 
-    if not os.path.exists(SETTINGS_FILE): #設定ファイルがない場合
+@timed("load_settings")
+def load_settings() -> Optional[Dict[str, Any]]:
+    """設定（CONFIG）からテーマ＆背景画像を復元し、このセッションで使う設定の辞書を返す（勤務先設定は CONFIG から）"""
+    raw = thaw(CONFIG.settings) #共有の設定は書き換えないので、ふつうの辞書に写して使う
+    if not raw: #設定ファイルがない場合
         return None
-    with open(SETTINGS_FILE, "r") as f: #JSONファイルを読み込み
-        settings = json.load(f)
+    settings = thaw(CONFIG.settings)
+
+    if "settings_saved_hash" not in st.session_state: #ファイルの内容のハッシュ（変更がなければ保存しない）
+        st.session_state["settings_saved_hash"] = settings_fingerprint(settings)
+    baseline = st.session_state.setdefault("settings_baseline", raw) #保存時のマージの基準（このセッションが読んだ内容）
+    for key in ("workplace_settings", "shift_patterns"): #勤務先設定・パターンは毎回 CONFIG から作るので、今回読んだ内容が基準
+        if key in raw:
+            baseline[key] = raw[key]
+        else:
+            baseline.pop(key, None)
 
    #年度開始
     if "fiscal_start" in settings: #fiscal_startが含まれていればdate型に変換
         settings["fiscal_start"] = date.fromisoformat(settings["fiscal_start"])
 
-   #勤務先設定をマスタにマージ
-    ws = settings.get("workplace_settings") #JSON中の勤務先設定を取得
-    if isinstance(ws, dict): #辞書として存在すれば
-        for name, cfg in ws.items(): #各勤務先ごとの設定を
-            if name in WORKPLACE_SETTINGS: #すでにある勤務先は上書きマージ
-                WORKPLACE_SETTINGS[name].update(cfg)
-            else: #新しい勤務先はそのまま追加
-                WORKPLACE_SETTINGS[name] = cfg
-    sp = settings.get("shift_patterns") #JSON中の勤務パターン設定を取得
-    if isinstance(sp, dict): #辞書として存在すれば
-        loaded_patterns = load_shift_patterns_from_settings(sp) #形式を変換して読み込み
-        SHIFT_PATTERNS.update(loaded_patterns) #既存のパターンにマージ
-
    #テーマをセッションに反映
     theme_name = settings.get("theme_name") #設定からテーマ名取得
     if theme_name and "theme" not in st.session_state:
         st.session_state["theme"] = theme_name #セッションのテーマにセット
 
    #背景画像をセッションに復元
-    bg_b64 = settings.get("bg_image_b64") #Base64文字列の背景画像
-    if bg_b64:
-        try:
-            st.session_state["bg_file_bytes"] = base64.b64decode(bg_b64) #バイト列に戻す
-            st.session_state["bg_file_mime"] = settings.get(
-                "bg_image_mime", "image/png"
-            ) #MIMEタイプも復元
-        except Exception:
-            pass #失敗してもアプリが落ちないようにする
+    if "bg_file_digest" not in st.session_state: #セッションにまだなければ
+        bg_digest = settings.get("bg_image_sha256") #ブロブ置き場の画像のハッシュ
+        bg_b64 = settings.get("bg_image_b64") #旧形式：Base64文字列の背景画像
+        if is_blob_digest(bg_digest): #パスに使うので、SHA-256の形のものだけ受け付ける
+            st.session_state["bg_file_digest"] = bg_digest
+            st.session_state["bg_file_mime"] = settings.get("bg_image_mime", "image/png")
+        elif bg_b64: #旧形式はブロブ置き場に移す（次の保存で settings.json からも消える）
+            import base64 #旧形式のデコード用
+
+            try:
+                set_background_image(
+                    base64.b64decode(bg_b64), #バイト列に戻す
+                    settings.get("bg_image_mime", "image/png"), #MIMEタイプも復元
+                )
+            except Exception:
+                pass #失敗してもアプリが落ちないようにする
 
     return settings #読み込んだ設定を返す
 
 
+
+def set_workplace_values(name: str, values: Dict[str, Any]) -> None:
+    """設定ページで編集した勤務先設定を、このセッションだけの上書きとして反映する（共有の CONFIG は書き換えない）"""
+    global WORKPLACE_SETTINGS
+    overrides = st.session_state.setdefault("workplace_overrides", {})
+    set_override(overrides, CONFIG.workplaces, name, values)
+    WORKPLACE_SETTINGS = apply_overrides(CONFIG.workplaces, overrides)
+
+
+def set_pattern_values(name: str, values: Optional[Dict[str, Any]]) -> None:
+    """勤務パターンの編集・追加（values が None なら削除）を、このセッションだけの上書きとして反映する"""
+    global SHIFT_PATTERNS
+    overrides = st.session_state.setdefault("pattern_overrides", {})
+    set_override(overrides, CONFIG.patterns, name, values)
+    SHIFT_PATTERNS = apply_overrides(CONFIG.patterns, overrides)
+
 # シフト削除・複製関数
-def DelAte(orig_index: int) -> None:
+def DelAte(shift_id: str) -> None:
     """シフトを1件削除して即反映する関数(DelAteボタン用)"""
-    if "shifts" not in st.session_state: #シフトがなければ何もしない
-        return
-    if 0 <= orig_index < len(st.session_state["shifts"]): #インデックスの範囲チェック
-        st.session_state["shifts"].pop(orig_index) #指定インデックスのシフトを削除
-        save_shifts() #CSVに保存
+    if find_shifts([shift_id]): #該当IDのシフトがあれば
+        commit_shift_ops([delete_op(shift_id)]) #削除を反映して保存
         st.success("シフトを削除しました。") #成功メッセージ
         st.rerun() #Streamlitアプリを再実行（画面更新）
 
 
-def duplicate_shift(orig_index: int, new_date: date) -> None:
+def duplicate_shift(shift_id: str, new_date: date) -> None:
     """シフトを日付だけ変えて複製して即再描画"""
-    if "shifts" not in st.session_state:
-        return
-    if 0 <= orig_index < len(st.session_state["shifts"]):
-        new_item = st.session_state["shifts"][orig_index].copy() #元のシフトをコピー
+    found = find_shifts([shift_id])
+    if found:
+        new_item = found[0].copy() #元のシフトをコピー
         new_item["date"] = new_date #日付だけ新しい日付に変更
-        st.session_state["shifts"].append(new_item) #シフトリストに追加
-        save_shifts() #CSVに保存
+        new_item["id"] = new_shift_id() #複製には新しいIDを付ける
+        commit_shift_ops([add_op(new_item)]) #追加を反映して保存
         st.success(f"{new_date} にシフトを複製しました。") #メッセージ表示
         st.rerun() #再描画
 
 
-### 休憩時間の自動計算
-def get_auto_break_minutes(total_hours: float, workplace: str) -> int:
-    """勤務時間と勤務先に応じて、自動で休憩時間（分）を計算"""
-    settings = WORKPLACE_SETTINGS.get(workplace) #勤務先設定を取得
-    if not settings: #なければ休憩0
-        return 0
-    rules = settings.get("break_rules", []) #休憩ルールリスト
-    break_min = 0 #デフォルトは0分
-    for rule in sorted(rules, key=lambda r: r["min_hours"]): #必要時間が小さい順にソート
-        if total_hours >= rule["min_hours"]: #条件を満たすごとに休憩時間を更新
-            break_min = rule["break_minutes"]
-    return break_min #最も大きな条件を満たした休憩時間を返す
-
-
-### 深夜・早朝の時間数を計算
-def _range_intersection_hours(
-    a_start: datetime, a_end: datetime, b_start: datetime, b_end: datetime
-) -> float:
-    """2つの時間帯[a_start, a_end], [b_start, b_end]の重なり時間（時間）を計算"""
-    start = max(a_start, b_start) #重なり開始時刻
-    end = min(a_end, b_end) #重なり終了時刻
-    if start >= end: #重なりがない場合
-        return 0.0
-    return (end - start).total_seconds() / 3600 #差を秒で計算し、時間に変換
-
-
-def _hours_in_window_non_crossing(
-    start_dt: datetime, end_dt: datetime, window_start_hour: int, window_end_hour: int
-) -> float:
-    """日付をまたがない時間帯(例:5〜8時など)の重なり時間を計算"""
-    total = 0.0 #合計時間
-    day = start_dt.date() #開始日
-    last_day = end_dt.date() #終了日
-    while day <= last_day: #開始日から終了日までループ
-        w_start = datetime.combine(day, time(window_start_hour, 0)) #当日の窓開始時刻
-        w_end = datetime.combine(day, time(window_end_hour, 0)) #当日の窓終了時刻
-        total += _range_intersection_hours(start_dt, end_dt, w_start, w_end) #重なり時間を加算
-        day += timedelta(days=1) #日付を1日進める
-    return total #合計時間を返す
-
-
-def _hours_in_window_crossing(
-    start_dt: datetime, end_dt: datetime, window_start_hour: int, window_end_hour: int
-) -> float:
-    """深夜のような「22〜5時」みたいに日付をまたぐ窓の重なり時間を計算"""
-    total = 0.0 #合計時間
-    day = start_dt.date() #開始日
-    last_day = end_dt.date() #終了日
-    while day <= last_day: #開始日から終了日まで
-       #当日window_start〜24:00
-        w1_start = datetime.combine(day, time(window_start_hour, 0)) #当日深夜開始
-        w1_end = datetime.combine(day, time(23, 59, 59, 999999)) #当日末（ほぼ24時）
-        total += _range_intersection_hours(start_dt, end_dt, w1_start, w1_end) #重なり時間加算
-
-       #翌日0:00〜window_end
-        next_day = day + timedelta(days=1) #翌日
-        w2_start = datetime.combine(next_day, time(0, 0)) #0:00
-        w2_end = datetime.combine(next_day, time(window_end_hour, 0)) #窓終了時刻
-        total += _range_intersection_hours(start_dt, end_dt, w2_start, w2_end) #重なり時間加算
-
-        day += timedelta(days=1) #日付を1日進める
-    return total #合計時間を返す
-
-
-def calc_night_early_hours(
-    start_dt: datetime, end_dt: datetime, workplace: str
-) -> tuple[float, float]:
-    """指定の勤務先設定に基づいて、深夜時間・早朝時間（時間数）を返す"""
-    settings = WORKPLACE_SETTINGS.get(workplace) #勤務先設定取得
-    if not settings:
-        return 0.0, 0.0
-
-    night_start = settings.get("night_start", 22) #深夜開始時刻
-    night_end = settings.get("night_end", 5) #深夜終了時刻
-    early_start = settings.get("early_start", 5) #早朝開始時刻
-    early_end = settings.get("early_end", 8) #早朝終了時刻
-
-   #深夜時間の計算
-    if night_start > night_end: #例: 22〜5時のように日付をまたぐ場合
-        night_hours = _hours_in_window_crossing(start_dt, end_dt, night_start, night_end)
-    else: #日付をまたがない場合
-        night_hours = _hours_in_window_non_crossing(start_dt, end_dt, night_start, night_end)
-
-   #早朝時間の計算
-    if early_start < early_end: #例: 5〜8時のように日付をまたがない場合
-        early_hours = _hours_in_window_non_crossing(start_dt, end_dt, early_start, early_end)
-    else: #日付をまたぐ場合
-        early_hours = _hours_in_window_crossing(start_dt, end_dt, early_start, early_end)
-
-    return night_hours, early_hours #(深夜時間, 早朝時間) を返す
-
-
-### 1レコード分の給与計算を行う共通関数（型ヒント付き）
-def calc_pay_for_shift(shift: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    1件分のシフト情報から、給与関連の項目を計算して埋める。
-
-    必要な入力:
-        shift["workplace"] : str
-        shift["work_hours"]: float
-        shift["night_hours"]: float
-        shift["early_hours"]: float
-        shift["wage"]      : int
-        shift["is_busy"]   : bool
-
-    追加・更新される出力:
-        shift["base_pay"]   : int
-        shift["night_bonus"]: int
-        shift["early_bonus"]: int
-        shift["busy_bonus"] : int
-        shift["pay"]        : int
-    """
-    workplace = str(shift.get("workplace", "")) #勤務先名を取得
-    settings_wp = WORKPLACE_SETTINGS.get(workplace, {}) #勤務先設定を取得（なければ空dict）
+# 操作欄のページ送り・選択状態（シフトIDで保持する）
+def page_shortcut(key: str) -> Dict[str, str]:
+    """ページ送りボタンのキーボードショートカット（shortcut 引数のないStreamlitでは付けない）"""
+    if "shortcut" in inspect.signature(st.button).parameters:
+        return {"shortcut": key}
+    return {}
+
 
-    work_hours = float(shift.get("work_hours", 0.0)) #実働時間（休憩控除後）を取得
-    night_hours = float(shift.get("night_hours", 0.0)) #深夜労働時間
-    early_hours = float(shift.get("early_hours", 0.0)) #早朝労働時間
-    wage = int(shift.get("wage", 0)) #時給
-    is_busy = bool(shift.get("is_busy", False)) #繁忙期フラグ
+def move_ops_page(step: int, page_count: int) -> None:
+    """操作欄のページを step だけ移動する（前へ/次へボタンのコールバック）"""
+    page = st.session_state.get("ops_page", 1) + step
+    st.session_state["ops_page"] = min(max(1, page), page_count)
 
-    night_rate = settings_wp.get("night_rate", 1.0) #深夜割増率
-    early_bonus_per_hour = settings_wp.get("early_bonus_per_hour", 0.0) #早朝手当（円/h）
-    busy_bonus_per_hour = settings_wp.get("busy_bonus_per_hour", 0.0) #繁忙期手当（円/h）
 
-    base_pay = work_hours * wage #基本給 = 実働時間 × 時給
-    night_bonus = night_hours * wage * max(night_rate - 1.0, 0) #深夜割増分
-    early_bonus = early_hours * early_bonus_per_hour #早朝手当
-    busy_bonus = work_hours * busy_bonus_per_hour if is_busy else 0.0 #繁忙期手当（繁忙期のみ）
-    pay = int(round(base_pay + night_bonus + early_bonus + busy_bonus)) #合計支給額
+def toggle_shift_selection(shift_id: str) -> None:
+    """チェックボックスの状態をシフトIDの選択集合に反映する"""
+    selected = st.session_state.setdefault("selected_shift_ids", set())
+    if st.session_state.get(f"select_{shift_id}"):
+        selected.add(shift_id)
+    else:
+        selected.discard(shift_id)
 
-    shift["base_pay"] = int(round(base_pay)) #基本給（整数）
-    shift["night_bonus"] = int(round(night_bonus)) #深夜手当
-    shift["early_bonus"] = int(round(early_bonus)) #早朝手当
-    shift["busy_bonus"] = int(round(busy_bonus)) #繁忙期手当
-    shift["pay"] = pay #合計給料
 
-    return shift #結果を含んだシフトdictを返す
+def clear_shift_selection() -> None:
+    """一括操作の選択をすべて解除する"""
+    st.session_state["selected_shift_ids"] = set()
+    for key in [k for k in st.session_state if str(k).startswith("select_")]:
+        del st.session_state[key] #チェックボックスの値も消す（次の表示で未選択に戻る）
 
 
-### 初期データ・設定読み込み
-if "shifts" not in st.session_state: #初回アクセス時など、セッションにシフトがない場合
-    load_shifts() #CSVから読み込む
+def finish_timing() -> None:
+    """この再実行の処理時間を締める（URLに ?diag=1 を付けたときだけサイドバーに診断パネルを出す）"""
+    samples = end_run(TIMING_LOG_FILE, {"page": page, "backend": STORAGE_BACKEND})
+    if st.query_params.get("diag") != "1":
+        return
+    with st.sidebar.expander("診断：処理時間", expanded=True):
+        st.caption("今回の再実行（ms）")
+        st.dataframe(
+            [{"区間": s["section"], "ms": round(s["ms"], 1), "行数": s["rows"]} for s in samples],
+            hide_index=True,
+        )
+        st.caption("直近の記録の分位点（ms）")
+        st.dataframe(section_stats(), hide_index=True)
 
-loaded_settings = load_settings() #設定ファイル(JSON)の読み込み
+
+### 設定読み込み（シフトは session_shifts / query_shifts で必要になったときに読み込む）
+CONFIG = load_config(SETTINGS_FILE, db_conn, DB_FILE) #設定ファイルが変わったときだけ読み直す（全セッション共通・読み取り専用）
+loaded_settings = load_settings() #設定の読み込み（テーマ・背景画像の復元）
+WORKPLACE_SETTINGS = apply_overrides( #この再実行で使う勤務先設定（共有の設定＋このセッションで編集中の値）
+    CONFIG.workplaces, st.session_state.get("workplace_overrides", {})
+)
+SHIFT_PATTERNS = apply_overrides(CONFIG.patterns, st.session_state.get("pattern_overrides", {})) #同じく勤務パターン
+refresh_session_shifts() #ほかのタブ・セッションで書き換えられていたら読み直す
 if loaded_settings:
     default_limit = loaded_settings.get("limit_income", 1030000) #扶養上限のデフォルト
     default_fiscal = loaded_settings.get("fiscal_start", date(date.today().year, 1, 1)) #集計開始日
@@ -525,6 +709,7 @@ page = st.sidebar.radio(
     "表示ページを選択",
     ["カレンダー", "シフト一覧", "勤務先設定"], #ページの選択肢
     index=0, #初期選択は「カレンダー」
+    key="page", #起動時間の計測（bench_startup.py）では最初に表示するページをここで指定する
 )
 
 # 背景テーマ選択
@@ -547,24 +732,16 @@ fiscal_start = st.sidebar.date_input(
 
 # カレンダー背景用画像アップロード
 bg_file = st.sidebar.file_uploader("カレンダー背景画像（任意）", type=["png", "jpg", "jpeg"]) #背景画像のアップロード
-if bg_file is not None: #ファイルがアップロードされた場合
-    st.session_state["bg_file_bytes"] = bg_file.getvalue() #バイト列としてセッションに保存
-    st.session_state["bg_file_mime"] = bg_file.type #MIMEタイプを保存
+if bg_file is not None and st.session_state.get("bg_file_id") != bg_file.file_id: #新しいファイルがアップロードされた場合
+    set_background_image(bg_file.getvalue(), bg_file.type) #ブロブ置き場に保存し、ハッシュをセッションに保存
+    st.session_state["bg_file_id"] = bg_file.file_id #同じファイルを毎回読み直さないように記録
 
 # テーマ or 背景画像に応じたCSSを生成
-bg_bytes = st.session_state.get("bg_file_bytes") #セッションから背景画像バイト列取得
+bg_digest = st.session_state.get("bg_file_digest") #セッションから背景画像のハッシュ取得
 bg_mime = st.session_state.get("bg_file_mime", "image/png") #MIMEタイプ（なければPNG）
+bg_style = background_image_style(bg_digest, bg_mime) if bg_digest else None #画像ごとにキャッシュされたCSS
 
-if bg_bytes: #画像がある場合
-    encoded = base64.b64encode(bg_bytes).decode() #Base64文字列に変換
-    bg_style = f"""
-        background-image:
-            linear-gradient(rgba(0, 0, 0, 0.1), rgba(0, 0, 0, 0.1)),
-            url("data:{bg_mime};base64,{encoded}");
-        background-size: cover;
-        background-position: center;
-    """ #背景画像を画面全体に表示するCSS
-else: #画像がない場合はテーマごとのグラデーション背景
+if bg_style is None: #画像がない場合はテーマごとのグラデーション背景
     if theme_name == "スタバグリーン":
         bg_style = "background: linear-gradient(135deg, #dfe7e1, #9ad0b1);" #緑系グラデーション
     elif theme_name == "ネイビーダーク":
@@ -683,10 +860,10 @@ if page in ("カレンダー", "シフト一覧"): #カレンダーとシフト
 
             is_busy = st.checkbox("繁忙期（手当適用）", value=False) #繁忙期フラグ
             
-            #交通費のデフォルト設定:パターン優先 なければ勤務先設定から
+            #交通費のデフォルト設定:パターン優先（0なら未指定） なければ勤務先設定から
             if pattern is not None:
-                default_transport = int(pattern.get("transport", 
-                                                    get_default_transport_for_workplace(workplace)))
+                default_transport = int(pattern.get("transport")
+                                        or get_default_transport_for_workplace(workplace))
             else:
                 default_transport = get_default_transport_for_workplace(workplace)
 
@@ -697,15 +874,26 @@ if page in ("カレンダー", "シフト一覧"): #カレンダーとシフト
                 step=10,
             ) #交通費入力
 
-            end_time = st.time_input("終了時刻", value=default_end) #終了時刻の入力
+            end_time = st.time_input(
+                "終了時刻", value=default_end, help="開始時刻より前の時刻なら、翌日に終わる夜勤として扱います"
+            ) #終了時刻の入力
 
        #メモ欄
         memo = st.text_input("メモ（任意）", "") #メモテキスト入力
 
         submitted = st.form_submit_button("このシフトを追加") #フォーム送信ボタン
         if submitted: #ボタンが押されたら
+            from shift_engine import ( #1件分の計算（休憩・深夜/早朝・給与）
+                calc_night_early_minutes,
+                calc_pay_for_shift,
+                get_auto_break_minutes,
+            )
+            from shift_rollup import minutes_to_hours #表示用の時間数
+
+            crosses_midnight = end_time < start_time #終了が開始より前なら翌日に終わる夜勤
             start_dt = datetime.combine(shift_date, start_time) #日付と開始時刻からdatetimeを生成
-            end_dt = datetime.combine(shift_date, end_time) #日付と終了時刻からdatetimeを生成
+            end_date = shift_date + timedelta(days=1) if crosses_midnight else shift_date #終了日
+            end_dt = datetime.combine(end_date, end_time) #終了日と終了時刻からdatetimeを生成
 
             settings_wp = WORKPLACE_SETTINGS.get(workplace, {}) #勤務先設定を取得
             pre_min = settings_wp.get("pre_minutes", 0) #開始前の付け時間
@@ -714,109 +902,156 @@ if page in ("カレンダー", "シフト一覧"): #カレンダーとシフト
             start_dt_for_pay = start_dt - timedelta(minutes=pre_min) #給与計算上の開始時刻
             end_dt_for_pay = end_dt + timedelta(minutes=post_min) #給与計算上の終了時刻
 
-            total_hours = (end_dt_for_pay - start_dt_for_pay).total_seconds() / 3600 #合計時間（付け時間込み）
+            total_min = int((end_dt_for_pay - start_dt_for_pay).total_seconds() // 60) #合計時間（付け時間込み、分）
 
-            if total_hours <= 0: #終了が開始より早い or 同じ場合はエラー
-                st.error("終了時刻が開始時刻より前になっていませんか？")
+            if end_time == start_time or total_min <= 0: #付け時間があっても、開始と終了が同じ時刻のシフトは作らない
+                st.error("開始時刻と終了時刻が同じになっていませんか？")
             else:
                 if manual_break_min > 0: #休憩が手動入力されている場合
-                    break_minutes = manual_break_min
-                else: #自動計算
-                    break_minutes = get_auto_break_minutes(total_hours, workplace)
+                    break_minutes = int(manual_break_min)
+                else: #自動計算（休憩ルールは時間数で書かれている）
+                    break_minutes = get_auto_break_minutes(total_min / 60, workplace, WORKPLACE_SETTINGS)
 
-                paid_hours = total_hours - break_minutes / 60.0 #実働時間 = 合計時間 − 休憩時間
-                if paid_hours < 0: #念のため0未満にならないように
-                    paid_hours = 0
+                work_min = max(total_min - break_minutes, 0) #実働時間 = 合計時間 − 休憩時間（0未満にはしない）
 
-                night_hours, early_hours = calc_night_early_hours(
-                    start_dt_for_pay, end_dt_for_pay, workplace
-                ) #深夜・早朝時間を計算
+                night_min, early_min = calc_night_early_minutes(
+                    start_dt_for_pay, end_dt_for_pay, workplace, WORKPLACE_SETTINGS
+                ) #深夜・早朝時間（分）を計算
 
-                if "shifts" not in st.session_state: #セッションにシフトリストがなければ初期化
-                    st.session_state["shifts"] = []
 
                #ここで1レコード分を組み立て → calc_pay_for_shift で給与計算
                 shift_record: Dict[str, Any] = { #シフト1件分の辞書を作成
+                    "id": new_shift_id(),
                     "workplace": workplace,
                     "date": shift_date,
                     "start": start_time.strftime("%H:%M"),
                     "end": end_time.strftime("%H:%M"),
+                    "crosses_midnight": crosses_midnight,
                     "pre_min": pre_min,
                     "post_min": post_min,
-                    "total_hours_raw": round(total_hours, 2),
+                    "total_min": total_min,
+                    "total_hours_raw": minutes_to_hours(total_min),
                     "break_min": break_minutes,
-                    "work_hours": round(paid_hours, 2),
-                    "night_hours": round(night_hours, 2),
-                    "early_hours": round(early_hours, 2),
+                    "work_min": work_min,
+                    "work_hours": minutes_to_hours(work_min),
+                    "night_min": night_min,
+                    "night_hours": minutes_to_hours(night_min),
+                    "early_min": early_min,
+                    "early_hours": minutes_to_hours(early_min),
                     "wage": wage,
                     "transport": int(transport),
                     "is_busy": is_busy,
                     "memo": memo,
                 }
-                shift_record = calc_pay_for_shift(shift_record) #共通関数で給与関連を計算
+                shift_record = calc_pay_for_shift(shift_record, WORKPLACE_SETTINGS) #共通関数で給与関連を計算
 
-                st.session_state["shifts"].append(shift_record) #シフトリストに追加
-                save_shifts() #CSVへ保存
+                commit_shift_ops([add_op(shift_record)]) #シフトを追加して保存
                 st.success("シフトを追加しました！") #成功メッセージ
     st.markdown('</div>', unsafe_allow_html=True) #カード枠の終了
 
+   #繰り返しシフト：パターン＋曜日（またはRRULE）＋期間からまとめて作り、確認してから1回で保存する
+    with st.expander("繰り返しシフトをまとめて追加", expanded="recur_preview" in st.session_state):
+        from shift_recur import WEEKDAY_LABELS, RecurrenceRule, expand_dates, parse_rrule
+
+        recur_patterns = list(SHIFT_PATTERNS.keys())
+        recur_pattern = st.selectbox("勤務パターン", recur_patterns, key="recur_pattern")
+        col_r1, col_r2 = st.columns(2)
+        with col_r1:
+            recur_start = st.date_input("開始日", value=date.today(), key="recur_start")
+            recur_weekdays = st.multiselect(
+                "曜日", list(range(7)), format_func=lambda i: WEEKDAY_LABELS[i], key="recur_weekdays"
+            ) #空なら開始日の曜日
+            recur_skip_holidays = st.checkbox("祝日を除く", value=True, key="recur_skip_holidays")
+        with col_r2:
+            recur_until = st.date_input("終了日（この日を含む）", value=date.today() + timedelta(days=90), key="recur_until")
+            recur_interval = st.number_input("何週おき", min_value=1, value=1, step=1, key="recur_interval")
+            recur_busy = st.checkbox("繁忙期（手当適用）", value=False, key="recur_busy")
+        recur_rrule = st.text_input(
+            "RRULE（任意。例: FREQ=WEEKLY;BYDAY=TU,TH;UNTIL=20260131）",
+            key="recur_rrule",
+            help="入力すると、曜日・間隔・終了日より RRULE の指定を優先します（FREQ・BYDAY・INTERVAL・UNTIL・COUNT）。UNTIL も COUNT もないときだけ上の終了日まで作ります",
+        )
+        recur_memo = st.text_input("メモ（任意）", key="recur_memo")
+        recur_params = (
+            recur_pattern, recur_start, recur_until, tuple(recur_weekdays), int(recur_interval),
+            recur_skip_holidays, recur_busy, recur_rrule.strip(), recur_memo,
+        ) #プレビューを作ったときの条件（変わったら作り直してもらう）
 
-# シフトがない場合
-if "shifts" not in st.session_state or len(st.session_state["shifts"]) == 0: #シフトが一件もない場合
-    st.info("まだシフトがありません。上のフォームから追加してください。") #メッセージ表示
-    save_settings(limit_income, fiscal_start, theme_name, WORKPLACE_SETTINGS) #設定保存
-    raise SystemExit #以降の処理を中断して終了
-
-
-# ここからはシフトがある前提
-df = pd.DataFrame(st.session_state["shifts"]) #シフトリストをDataFrameに変換
-df["date"] = pd.to_datetime(df["date"]) #date列をdatetime型に変換
-
-# 欠損カラム対策（古いCSVなどでも動くように）
-if "work_hours" not in df.columns: #work_hours列がない場合
-    df["work_hours"] = 0.0
-df["work_hours"] = df["work_hours"].fillna(0.0) #NaNは0に置き換え
-
-if "transport" not in df.columns: #transport列がない場合
-    df["transport"] = 0
-df["transport"] = df["transport"].fillna(0).astype(int) #NaNを0にしintへ
+        if st.button("プレビュー", key="recur_preview_button") and recur_pattern:
+            from shift_recur import preview_recurring_shifts
 
-if "busy_bonus" not in df.columns: #busy_bonus列がない場合
-    df["busy_bonus"] = 0
-df["busy_bonus"] = df["busy_bonus"].fillna(0).astype(int)
+            options = {"skip_holidays": recur_skip_holidays}
+            try:
+                if recur_rrule.strip():
+                    rule = parse_rrule(recur_rrule, recur_start, **options)
+                    if rule.until is None and rule.count is None: #RRULE に終わりの指定がなければ画面の終了日まで
+                        rule = parse_rrule(recur_rrule, recur_start, until=recur_until, **options)
+                else:
+                    rule = RecurrenceRule(
+                        start=recur_start, until=recur_until, weekdays=tuple(sorted(recur_weekdays)),
+                        interval=int(recur_interval), **options,
+                    )
+                window_end = max(expand_dates(rule), default=recur_start) #回数指定のときも、実際の最後の日まで重なりを見る
+                preview = preview_recurring_shifts(
+                    SHIFT_PATTERNS[recur_pattern],
+                    rule,
+                    WORKPLACE_SETTINGS,
+                    query_shifts(recur_start - timedelta(days=1), window_end), #前日に始まる夜勤も重なりの対象
+                    is_busy=recur_busy,
+                    memo=recur_memo,
+                )
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.session_state["recur_preview"] = (recur_params, preview)
+
+        if "recur_preview" in st.session_state:
+            preview_params, preview = st.session_state["recur_preview"]
+            if preview_params != recur_params:
+                st.info("条件が変わりました。もう一度「プレビュー」を押してください。")
+            elif preview.empty:
+                st.warning("条件に当てはまる日がありません。")
+            else:
+                conflicts = int(preview["conflict"].sum())
+                st.write(
+                    f"{len(preview)}件・給料合計 {int(preview['pay'].sum()):,} 円"
+                    + (f"（うち{conflicts}件は既存のシフトと時間帯が重なっています）" if conflicts else "")
+                )
+                shown = preview[["date", "start", "end", "work_hours", "wage", "pay", "conflict"]].copy()
+                shown.insert(1, "曜日", [WEEKDAY_LABELS[d.weekday()] for d in shown["date"]])
+                st.dataframe(
+                    shown.rename(columns={
+                        "date": "日付", "start": "開始", "end": "終了", "work_hours": "実働(h)",
+                        "wage": "時給", "pay": "給料", "conflict": "重複",
+                    }),
+                    hide_index=True,
+                )
+                skip_conflicts = st.checkbox("重なる日は追加しない", value=True, key="recur_skip_conflicts")
+                if st.button("まとめて追加", key="recur_commit"):
+                    from shift_recur import shift_records
 
-if "memo" not in df.columns: #memo列がない場合
-    df["memo"] = ""
-df["memo"] = df["memo"].fillna("") #NaNを空文字に
+                    adding = preview[~preview["conflict"]] if skip_conflicts else preview
+                    commit_shift_ops([add_op(rec) for rec in shift_records(adding)]) #1回の書き込みでまとめて保存
+                    del st.session_state["recur_preview"]
+                    st.success(f"{len(adding)}件のシフトを追加しました。")
 
-df_period = df[df["date"] >= pd.to_datetime(fiscal_start)] #集計開始日以降のデータだけ抽出
 
-total_income = df_period["pay"].sum() #期間内の支給合計
-by_workplace = df_period.groupby("workplace")["pay"].sum().reset_index() #勤務先ごとの合計支給額
+# シフトがない場合（勤務先設定ページはシフトを使わないので、ここでシフトを読み込まない）
+if page in ("カレンダー", "シフト一覧") and count_shifts() == 0: #シフトが一件もない場合
+    st.info("まだシフトがありません。上のフォームから追加してください。") #メッセージ表示
+    save_settings(limit_income, fiscal_start, theme_name, WORKPLACE_SETTINGS) #設定保存
+    finish_timing()
+    st.stop() #以降の処理を中断して終了
 
-df_period["year_month"] = df_period["date"].dt.to_period("M").astype(str) #年月（YYYY-MM形式）の列を追加
-by_month = (
-    df_period
-    .groupby("year_month")
-    .agg(
-        total_pay=("pay", "sum"),
-        total_hours=("work_hours", "sum"),
-    )
-    .reset_index()
-    .sort_values("year_month")
-) #月ごとの給与合計と勤務時間合計を集計
-by_month["total_hours"] = by_month["total_hours"].round(2) #勤務時間を小数2桁に丸める
-by_month = by_month.rename(
-    columns={
-        "year_month": "年月",
-        "total_pay": "給与合計(円)",
-        "total_hours": "勤務時間合計(h)",
-    }
-) #列名を日本語に変更
 
+# ここからはシフトがある前提（各ページは必要な範囲だけ query_shifts で読み出す）
 
 ### ページ1：カレンダー表示(Main)
 if page == "カレンダー": #カレンダーページ
+    import calendar #カレンダー生成用モジュール
+    import pandas as pd #データ処理用のpandas
+    from shift_calendar import build_month_model, is_holiday #カレンダーの日別集計・祝日表
+
     st.subheader("🗓 カレンダー表示(Main)") #セクションタイトル
 
     default_date = date.today() #デフォルトの日付は今日
@@ -826,13 +1061,16 @@ if page == "カレンダー": #カレンダーページ
 
     st.markdown(f"### {y}年 {m}月 のシフト") #見出し表示
 
-   #この月のデータを抽出
-    target_period = f"{y}-{m:02d}" #"YYYY-MM"形式の文字列
-    df_month = df[df["date"].dt.to_period("M").astype(str) == target_period] #指定年月に属する行のみ抽出
+   #この月のデータだけを読み出す（SQLiteなら日付の索引で絞り込み）
+    month_first = date(y, m, 1) #月初
+    month_last = date(y, m, calendar.monthrange(y, m)[1]) #月末
+    df_month = query_shifts(month_first, month_last) #指定年月に属する行のみ抽出
 
-   #カレンダー構造
-    cal = calendar.Calendar(firstweekday=0) #月曜始まりのカレンダー（0=月曜）
-    weeks = cal.monthdatescalendar(y, m) #表示対象月の「週ごとの日付リスト」を取得
+   #カレンダー構造＋日別集計（月のシフトを日付ごとに1回だけ集計し、表とボタンの両方で使う）
+    calendar_started = section_start()
+    month_model = build_month_model(y, m, df_month)
+    weeks = month_model.weeks #表示対象月の「週ごとの日付リスト」
+    day_summaries = month_model.days #シフトのある日の集計
 
    #カレンダー表示用テーブルデータ（HTML＋ツールチップ）
     table_data = [] #カレンダー用テーブルのデータ
@@ -843,14 +1081,13 @@ if page == "カレンダー": #カレンダーページ
                 row.append("")
                 continue
 
-            day_shifts = df_month[df_month["date"].dt.date == d] #その日のシフトを抽出
-            if day_shifts.empty: #シフトがない場合
+            summary = day_summaries.get(d) #その日の集計
+            if summary is None: #シフトがない場合
                 cell = f"{d.day}" #日付のみ
             else: #シフトがある場合
-                total_pay = int(day_shifts["pay"].sum()) #その日の支給額合計
-                total_hours = float(day_shifts["work_hours"].sum()) #その日の勤務時間合計
-                wp_list = sorted(day_shifts["workplace"].unique()) #勤務先名の一覧
-                wp_str = ", ".join(wp_list) #勤務先名をカンマ区切り文字列に
+                total_pay = summary.total_pay #その日の支給額合計
+                total_hours = summary.total_hours #その日の勤務時間合計
+                wp_str = ", ".join(summary.workplaces) #勤務先名をカンマ区切り文字列に
 
                #ツールチップ（title）用テキスト（改行は&#10;）
                 tooltip_text = (
@@ -863,21 +1100,17 @@ if page == "カレンダー": #カレンダーページ
             row.append(cell) #行にセルを追加
         table_data.append(row) #テーブルデータに行を追加
 
-        cal_df = pd.DataFrame(
+    cal_df = pd.DataFrame(
         table_data,
         columns=["月", "火", "水", "木", "金", "土", "日"],
     )  # カレンダーのテーブルとしてDataFrame化
 
     # --- 日曜 / 祝日 / シフト有りセルのスタイルを作る ---
-    # cal_df と同じ形の「CSS文字列」のDataFrameを用意
-    style_df = pd.DataFrame(
-        "",
-        index=cal_df.index,
-        columns=cal_df.columns,
-    )
-
-    for row_idx, week in enumerate(weeks):
-        for col_idx, d in enumerate(week):
+    # cal_df と同じ形の「CSS文字列」の表を週ごとに組み立てる
+    style_rows = []
+    for week in weeks:
+        style_row = []
+        for d in week:
             # 前後の月の日付の場合はグレー背景
             if d.month != m:
                 style = "background-color: rgba(245, 245, 245, 0.9); color: #999;"
@@ -890,17 +1123,18 @@ if page == "カレンダー": #カレンダーページ
                 if d.weekday() == 6:
                     style = "background-color: rgba(255, 230, 230, 0.95); color: #c00;"
                 # 日曜以外の祝日は薄い赤背景＋赤文字
-                elif jpholiday.is_holiday(d):
+                elif is_holiday(d): #年ごとに作った祝日表を引く
                     style = "background-color: rgba(255, 240, 240, 0.95); color: #c00;"
 
-                # このセルにシフトが入っているかどうか（表示文字列に「円」が含まれる）
-                cell_val = cal_df.iloc[row_idx, col_idx]
-                if isinstance(cell_val, str) and "円" in cell_val:
+                # このセルにシフトが入っているかどうか（日別集計にあるかどうか）
+                if d in day_summaries:
                     # 背景色は上の（日曜 / 祝日 / 通常）のまま、
                     # 枠線＋太字で「シフトあり」を強調
                     style += " font-weight: 600; border: 1px solid rgba(255, 200, 0, 0.9);"
 
-            style_df.iloc[row_idx, col_idx] = style
+            style_row.append(style)
+        style_rows.append(style_row)
+    style_df = pd.DataFrame(style_rows, index=cal_df.index, columns=cal_df.columns)
 
     def highlight_calendar(_df: pd.DataFrame) -> pd.DataFrame:
         """cal_df と同じ形の CSS DataFrame を返す"""
@@ -925,10 +1159,11 @@ if page == "カレンダー": #カレンダーページ
     cal_styler = cal_df.style.apply(highlight_calendar, axis=None)
     st.markdown(cal_styler.to_html(), unsafe_allow_html=True)
     st.markdown('</div>', unsafe_allow_html=True)
+    record_section("calendar_build", calendar_started, rows=len(df_month))
 
 
     month_total = int(df_month["pay"].sum()) if not df_month.empty else 0 #月合計支給額
-    month_hours = float(df_month["work_hours"].sum()) if not df_month.empty else 0.0 #月合計勤務時間
+    month_hours = int(df_month["work_min"].sum()) / 60 if not df_month.empty else 0.0 #月合計勤務時間（分で足してから時間に）
     st.markdown(
         f"#### {y}年{m}月の合計：**{month_total:,} 円 / {month_hours:.2f} h**"
     ) #月合計の表示
@@ -945,12 +1180,11 @@ if page == "カレンダー": #カレンダーページ
                 if d.month != m: #他の月の日付は空白
                     st.write(" ")
                 else:
-                    day_shifts = df_month[df_month["date"].dt.date == d] #当日のシフト
-                    if day_shifts.empty:
+                    summary = day_summaries.get(d) #当日の集計
+                    if summary is None:
                         label = f"{d.day}" #シフトなしは日付のみ
                     else:
-                        total_pay = int(day_shifts["pay"].sum()) #その日合計の給料
-                        label = f"{d.day}\n{total_pay:,}円" #ボタンラベルに給料も表示
+                        label = f"{d.day}\n{summary.total_pay:,}円" #ボタンラベルに給料も表示
                     if st.button(label, key=f"detail_btn_{d.isoformat()}"): #日付ボタン
                         st.session_state["detail_date"] = d #セッションに保存
                         detail_date = d #ローカル変数も更新
@@ -979,17 +1213,20 @@ if page == "カレンダー": #カレンダーページ
 
 # ページ2:シフト一覧(表＋扶養チェック＋削除&複製＋一括操作＋データチェック)
 elif page == "シフト一覧":
+    import pandas as pd #データ処理用のpandas
+    from shift_engine import apply_pay_to_records #一括編集時の給与の再計算
+    from shift_quality import check_shifts, issues_frame #データチェック（品質管理）
+
     st.subheader("シフト一覧（テーブル表示）") #セクションタイトル
 
    #絞り込み・並び替え UI
     st.markdown("### 絞り込み・並び替え") #絞り込みセクション見出し
-    workplaces = sorted(df["workplace"].dropna().unique().tolist()) #勤務先のユニーク一覧
+    workplaces = shift_workplaces() #勤務先のユニーク一覧
     selected_workplaces = st.multiselect(
         "バイト先フィルタ", workplaces, default=workplaces
     ) #勤務先でフィルタするマルチセレクト
 
-    min_date = df["date"].min().date() #シフトの最小日付
-    max_date = df["date"].max().date() #シフトの最大日付
+    min_date, max_date = shift_date_bounds() #シフトの最小日付・最大日付
     col_f1, col_f2, col_f3 = st.columns(3) #日付範囲＆並び替えの3列
     with col_f1:
         filter_start = st.date_input(
@@ -1012,13 +1249,12 @@ elif page == "シフト一覧":
             ],
         ) #並び替え条件の選択
 
-    df_filtered = df.copy() #フィルタリング用にコピー
-    df_filtered = df_filtered[
-        (df_filtered["date"].dt.date >= filter_start)
-        & (df_filtered["date"].dt.date <= filter_end)
-    ] #日付範囲でのフィルタ
-    if selected_workplaces: #勤務先フィルタがある場合
-        df_filtered = df_filtered[df_filtered["workplace"].isin(selected_workplaces)]
+    list_started = section_start()
+    df_filtered = query_shifts(
+        filter_start,
+        filter_end,
+        selected_workplaces if selected_workplaces else None, #勤務先フィルタがある場合のみ
+    ) #日付範囲・勤務先での絞り込みを読み出し時に行う
 
    #並び替え
     if sort_option == "日付昇順":
@@ -1026,9 +1262,9 @@ elif page == "シフト一覧":
     elif sort_option == "日付降順":
         df_sorted = df_filtered.sort_values("date", ascending=False)
     elif sort_option == "勤務時間（長い順）":
-        df_sorted = df_filtered.sort_values("work_hours", ascending=False)
+        df_sorted = df_filtered.sort_values("work_min", ascending=False)
     elif sort_option == "勤務時間（短い順）":
-        df_sorted = df_filtered.sort_values("work_hours", ascending=True)
+        df_sorted = df_filtered.sort_values("work_min", ascending=True)
     elif sort_option == "給料（高い順）":
         df_sorted = df_filtered.sort_values("pay", ascending=False)
     elif sort_option == "給料（低い順）":
@@ -1041,28 +1277,72 @@ elif page == "シフト一覧":
     else:
         styled_df = df_sorted.style.apply(color_by_workplace, axis=1) #行ごとに勤務先カラーを適用
         st.dataframe(styled_df, width=True) #ソート・フィルタ後のDataFrame表示
+    record_section("list_render", list_started, rows=len(df_sorted))
 
     st.markdown("### シフトの削除・複製・一括操作") #操作セクション見出し
 
-    df_ops = df_sorted.reset_index() if not df_sorted.empty else pd.DataFrame() #元インデックスを保持したDataFrame
-    selected_indices: list[int] = [] #一括操作対象として選択されたインデックスリスト
-
-    for _, row in df_ops.iterrows(): #表示されている各シフト行について
-        orig_idx = int(row["index"]) #元のインデックス（st.session_state["shifts"] 上の位置）
+    selected_set: set = st.session_state.setdefault("selected_shift_ids", set()) #一括操作の選択（シフトIDで保持、ページをまたいで残る）
+    selected_set &= set(df_sorted["id"].astype(str)) if not df_sorted.empty else set() #絞り込みで見えなくなった行の選択は外す
+
+    total_rows = len(df_sorted) #操作対象の件数
+    col_p1, col_p2, col_p3, col_p4, col_p5 = st.columns([1.5, 1, 1.5, 1, 2]) #ページサイズ/前へ/ページ番号/次へ/選択件数
+    with col_p1:
+        page_size = st.selectbox(
+            "1ページの件数", OPS_PAGE_SIZES, index=0, key="ops_page_size"
+        ) #1ページに並べる行数（再描画の手間はこの件数で頭打ち）
+    page_count = max(1, -(-total_rows // page_size)) #総ページ数（切り上げ）
+    st.session_state["ops_page"] = min(max(1, st.session_state.get("ops_page", 1)), page_count) #範囲外のページ番号を補正
+    with col_p2:
+        st.button(
+            "◀ 前へ", key="ops_prev", on_click=move_ops_page, args=(-1, page_count),
+            disabled=st.session_state["ops_page"] <= 1, **page_shortcut("PageUp"),
+        ) #前のページ（PageUpキーでも移動）
+    with col_p4:
+        st.button(
+            "次へ ▶", key="ops_next", on_click=move_ops_page, args=(1, page_count),
+            disabled=st.session_state["ops_page"] >= page_count, **page_shortcut("PageDown"),
+        ) #次のページ（PageDownキーでも移動）
+    with col_p3:
+        page_no = st.number_input(
+            f"ページ（全{page_count}ページ）", min_value=1, max_value=page_count, step=1, key="ops_page"
+        ) #ページ番号の直接入力（Enterで移動）
+    with col_p5:
+        st.write(f"{len(selected_set)}件選択中") #ページをまたいだ選択件数
+        if st.button("選択をすべて解除", key="ops_clear_selection"):
+            clear_shift_selection() #選択状態とチェックボックスの値をまとめて消す
+            st.rerun()
+
+    page_start = (int(page_no) - 1) * page_size #このページの先頭行
+    df_ops = df_sorted.iloc[page_start:page_start + page_size] #このページに表示する行だけ
+
+    if not df_ops.empty:
+        page_ids = df_ops["id"].astype(str).tolist() #このページのシフトID
+        if st.button("このページをすべて選択", key="ops_select_page"):
+            selected_set.update(page_ids)
+            for sid in page_ids:
+                st.session_state[f"select_{sid}"] = True #チェックボックスの表示もそろえる
+            st.rerun()
+
+    for _, row in df_ops.iterrows(): #このページの各シフト行について
+        shift_id = str(row["id"]) #シフトID（保存方式によらず一意）
 
         with st.container(): #1行分のUIコンテナ
             cols = st.columns([0.5, 4.5, 3, 1, 1]) #チェックボックス/情報/複製日付/duplicateボタン/deleteボタン
 
             with cols[0]:
-                checked = st.checkbox("", key=f"select_{orig_idx}") #一括操作用チェックボックス
-                if checked:
-                    selected_indices.append(orig_idx) #チェックされたインデックスを保存
+                select_key = f"select_{shift_id}"
+                if select_key not in st.session_state: #別のページから戻ってきたときは保持している選択から復元
+                    st.session_state[select_key] = shift_id in selected_set
+                st.checkbox(
+                    "選択", key=select_key, label_visibility="collapsed",
+                    on_change=toggle_shift_selection, args=(shift_id,),
+                ) #一括操作用チェックボックス
 
             with cols[1]:
                 memo_str = f" / メモ: {row['memo']}" if row.get("memo") else "" #メモがあれば表示用文字列を作る
                 st.write(
                     f"**{row['date'].date()}** "
-                    f"{row['start']} - {row['end']}  "
+                    f"{row['start']} - {'翌' if row.get('crosses_midnight') else ''}{row['end']}  "
                     f"（{row['workplace']} / {row['work_hours']}h / {row['pay']}円 / 交通費{row['transport']}円{memo_str}）"
                 ) #シフト概要表示
 
@@ -1070,16 +1350,16 @@ elif page == "シフト一覧":
                 new_date = st.date_input(
                     "複製先の日付",
                     value=row["date"].date(),
-                    key=f"copy_date_{orig_idx}",
+                    key=f"copy_date_{shift_id}",
                 ) #複製先の日付入力
 
             with cols[3]:
-                if st.button("Duplicate", key=f"copy_btn_{orig_idx}"): #複製ボタン
-                    duplicate_shift(orig_idx, new_date) #シフトを複製
+                if st.button("Duplicate", key=f"copy_btn_{shift_id}"): #複製ボタン
+                    duplicate_shift(shift_id, new_date) #シフトを複製
 
             with cols[4]:
-                if st.button("DelAte", key=f"delete_btn_{orig_idx}"): #削除ボタン
-                    DelAte(orig_idx) #シフトを削除
+                if st.button("DelAte", key=f"delete_btn_{shift_id}"): #削除ボタン
+                    DelAte(shift_id) #シフトを削除
 
    #一括削除・一括編集
     st.markdown("#### 一括削除・一括編集") #一括操作セクション見出し
@@ -1087,14 +1367,13 @@ elif page == "シフト一覧":
     col_bulk1, col_bulk2 = st.columns(2) #一括削除と一括編集を2列に分ける
     with col_bulk1:
         if st.button("選択したシフトを削除"): #一括削除ボタン
-            if not selected_indices: #一つも選択されていない場合
+            selected_ids = sorted(selected_set) #ページをまたいで選択されたシフトID
+            if not selected_ids: #一つも選択されていない場合
                 st.info("削除する行が選択されていません。")
             else:
-                st.session_state["shifts"] = [
-                    s for i, s in enumerate(st.session_state["shifts"]) if i not in selected_indices
-                ] #選択されていないレコードだけ残す
-                save_shifts() #CSV保存
-                st.success(f"{len(selected_indices)}件のシフトを削除しました。") #成功メッセージ
+                commit_shift_ops([delete_op(sid) for sid in selected_ids]) #選択したシフトを削除して保存
+                clear_shift_selection() #削除したシフトの選択を消す
+                st.success(f"{len(selected_ids)}件のシフトを削除しました。") #成功メッセージ
                 st.rerun() #再描画
 
     with col_bulk2:
@@ -1106,28 +1385,41 @@ elif page == "シフト一覧":
             new_memo = st.text_input("新しいメモ（空欄なら変更しない）", "") #変更後のメモ
 
             if st.button("一括編集を適用"): #一括編集実行ボタン
-                if not selected_indices:
+                if not selected_set:
                     st.info("編集する行が選択されていません。")
                 else:
-                    for idx in selected_indices: #選択された全レコードに対して
-                        if 0 <= idx < len(st.session_state["shifts"]):
-                            shift = st.session_state["shifts"][idx] #対象シフトを取得
-                            if new_workplace: #勤務先の変更指定があれば上書き
-                                shift["workplace"] = new_workplace
-                            if new_wage > 0: #時給の変更指定があれば上書き
-                                shift["wage"] = int(new_wage)
-                            if new_memo: #メモの変更指定があれば上書き
-                                shift["memo"] = new_memo
-                           #給与関連を再計算（共通関数を利用）
-                            calc_pay_for_shift(shift)
-
-                    save_shifts() #変更内容を保存
-                    st.success(f"{len(selected_indices)}件のシフトを更新しました。") #成功メッセージ
+                    edited = [dict(s) for s in find_shifts(sorted(selected_set))] #選択された全レコードのコピー（他のページの行も含む、集計の差分計算のため元は変えない）
+                    for shift in edited: #選択された全レコードに対して
+                        if new_workplace: #勤務先の変更指定があれば上書き
+                            shift["workplace"] = new_workplace
+                        if new_wage > 0: #時給の変更指定があれば上書き
+                            shift["wage"] = int(new_wage)
+                        if new_memo: #メモの変更指定があれば上書き
+                            shift["memo"] = new_memo
+                   #給与関連をまとめて再計算（一括計算エンジンを利用）
+                    apply_pay_to_records(edited, WORKPLACE_SETTINGS)
+
+                    commit_shift_ops([update_op(s) for s in edited]) #変更内容を保存
+                    st.success(f"{len(edited)}件のシフトを更新しました。") #成功メッセージ
                     st.rerun() #再描画
 
    #扶養チェック表示
     st.subheader("扶養チェック") #扶養チェックセクション
 
+    with timed("aggregates"):
+        aggregates = period_aggregates(fiscal_start) #集計開始日以降の集計（月別・勤務先別の集計から）
+    total_income = aggregates["total_income"] #期間内の支給合計
+    by_workplace = aggregates["by_workplace"] #勤務先ごとの合計支給額
+    by_month = aggregates["by_month"] #月ごとの給与合計と勤務時間合計
+    by_month["total_hours"] = by_month["total_hours"].round(2) #勤務時間を小数2桁に丸める
+    by_month = by_month.rename(
+        columns={
+            "year_month": "年月",
+            "total_pay": "給与合計(円)",
+            "total_hours": "勤務時間合計(h)",
+        }
+    ) #列名を日本語に変更
+
     remaining = limit_income - total_income #扶養上限までの残額
     col_a, col_b = st.columns(2) #メトリクスを2列に配置
     with col_a:
@@ -1145,6 +1437,128 @@ elif page == "シフト一覧":
     else:
         st.success("まだ扶養の上限には余裕があります。") #余裕ありメッセージ
 
+   #年度末の見込み（入力済みのシフト＋直近のペース）
+    st.subheader("年度末の見込み") #見込みセクション
+    with timed("forecast"):
+        forecast = income_forecast(fiscal_start, int(limit_income)) #月別の集計から計算（シフト追加後の再実行で更新）
+    col_f1, col_f2, col_f3 = st.columns(3) #見込みのメトリクスを3列に配置
+    with col_f1:
+        st.metric("年度末の見込み", f"{forecast.projected:,} 円") #見込み（中央）
+    with col_f2:
+        st.metric("入力済みの今後のシフト", f"{forecast.planned:,} 円") #明日以降に入っているシフトの分
+    with col_f3:
+        st.metric("直近の月平均", f"{forecast.monthly_rate:,} 円") #ペース
+    st.caption(
+        f"{forecast.period_end:%Y/%m/%d}までの見込み。80%の範囲は {forecast.low:,}〜{forecast.high:,} 円"
+        "（シフトが入っていない日は直近の月平均のペースで働くとして見込んでいます）"
+    )
+    if forecast.already_over:
+        pass #超過はすでに上で表示している
+    elif forecast.cross_date is not None:
+        spread = f"早ければ{forecast.cross_date_early:%m/%d}" if forecast.cross_date_early else ""
+        spread += (
+            f"、遅ければ{forecast.cross_date_late:%m/%d}" if forecast.cross_date_late else "、下振れすれば年度内は超えません"
+        )
+        st.warning(f"このペースだと {forecast.cross_date:%Y/%m/%d} ごろに上限を超えそうです（{spread}）。")
+    elif forecast.cross_date_early is not None:
+        st.info(f"見込みでは上限を超えませんが、上振れすると {forecast.cross_date_early:%Y/%m/%d} ごろに超える可能性があります。")
+    else:
+        st.success("年度末まで上限を超えない見込みです。")
+    forecast_chart = forecast.months.set_index("year_month")[["cumulative"]].rename(
+        columns={"cumulative": "見込みの累計(円)"}
+    )
+    forecast_chart["扶養上限(円)"] = int(limit_income)
+    st.line_chart(forecast_chart) #月末ごとの見込みの累計と上限
+
+   #上限内でのシフト案（勤務パターンの候補から、上限を超えない組み合わせを選ぶ）
+    with st.expander("上限内でのシフト案を作る", expanded="optimize_plan" in st.session_state):
+        from shift_recur import WEEKDAY_LABELS
+
+        plan_start = max(date.today() + timedelta(days=1), fiscal_start) #明日から
+        plan_end = forecast.period_end #期間の終わりまで
+        st.caption(
+            f"{plan_start:%Y/%m/%d}〜{plan_end:%Y/%m/%d} に、勤務パターンのシフトを上限までの残り"
+            f" {max(remaining, 0):,} 円 を超えないように組み合わせます（既存のシフトと重なる候補は使いません）。"
+        )
+        opt_patterns = st.multiselect(
+            "使う勤務パターン", list(SHIFT_PATTERNS.keys()), default=list(SHIFT_PATTERNS.keys()), key="opt_patterns"
+        )
+        opt_workplaces = sorted({str(SHIFT_PATTERNS[name].get("workplace", "")) for name in opt_patterns})
+        opt_availability = {
+            wp: tuple(st.multiselect(
+                f"{wp} に入れる曜日", list(range(7)), default=list(range(5)),
+                format_func=lambda i: WEEKDAY_LABELS[i], key=f"opt_days_{wp}",
+            ))
+            for wp in opt_workplaces
+        } #勤務先ごとの入れる曜日
+        col_o1, col_o2 = st.columns(2)
+        with col_o1:
+            opt_goal = st.radio(
+                "目的", ["max_pay", "min_hours"], key="opt_goal",
+                format_func=lambda g: {"max_pay": "上限内で給料を最大に", "min_hours": "目標額を最少の勤務時間で"}[g],
+            )
+            opt_target = st.number_input("目標額（円）", min_value=0, value=min(100000, max(remaining, 0)), step=10000, key="opt_target")
+        with col_o2:
+            opt_skip_holidays = st.checkbox("祝日を除く", value=False, key="opt_skip_holidays")
+            opt_busy = st.checkbox("繁忙期（手当適用）として計算", value=False, key="opt_busy")
+        opt_params = (
+            tuple(opt_patterns), tuple(sorted(opt_availability.items())), opt_goal, int(opt_target),
+            opt_skip_holidays, opt_busy, plan_start, plan_end, int(remaining),
+        ) #シフト案を作ったときの条件（変わったら作り直してもらう）
+
+        if st.button("シフト案を作る", key="opt_button"):
+            from shift_optimize import build_candidates, optimize_shifts
+
+            with timed("optimize"):
+                candidates = build_candidates(
+                    {name: SHIFT_PATTERNS[name] for name in opt_patterns},
+                    plan_start,
+                    plan_end,
+                    opt_availability,
+                    WORKPLACE_SETTINGS,
+                    query_shifts(plan_start - timedelta(days=1), plan_end), #前日に始まる夜勤も重なりの対象
+                    is_busy=opt_busy,
+                    skip_holidays=opt_skip_holidays,
+                )
+                try:
+                    plan = optimize_shifts(candidates, max(remaining, 0), opt_goal, int(opt_target))
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    st.session_state["optimize_plan"] = (opt_params, plan)
+
+        if "optimize_plan" in st.session_state:
+            plan_params, plan = st.session_state["optimize_plan"]
+            if plan_params != opt_params:
+                st.info("条件が変わりました。もう一度「シフト案を作る」を押してください。")
+            elif plan.shifts.empty:
+                st.warning("条件に合うシフトの組み合わせがありません。")
+            else:
+                st.write(
+                    f"候補{plan.candidates}件から{len(plan.shifts)}件・給料合計 {plan.total_pay:,} 円・"
+                    f"実働 {plan.total_work_min / 60:,.1f} 時間（上限までの残り {plan.budget - plan.total_pay:,} 円）"
+                )
+                if not plan.exact:
+                    st.caption("金額を少し粗い単位（切り上げ）で計算したので、最適な案より少しだけ給料が少ないことがあります。上限は超えません。")
+                if plan.skipped:
+                    st.caption(f"時間帯が重なってつながる候補が多すぎたため、{plan.skipped}件の候補は使っていません。")
+                shown = plan.shifts[["date", "pattern", "start", "end", "work_hours", "pay"]].copy()
+                shown.insert(1, "曜日", [WEEKDAY_LABELS[d.weekday()] for d in shown["date"]])
+                st.dataframe(
+                    shown.rename(columns={
+                        "date": "日付", "pattern": "勤務パターン", "start": "開始", "end": "終了",
+                        "work_hours": "実働(h)", "pay": "給料",
+                    }),
+                    hide_index=True,
+                )
+                if st.button("この案のシフトを追加", key="opt_commit"):
+                    from shift_recur import shift_records
+
+                    commit_shift_ops([add_op(rec) for rec in shift_records(plan.shifts.drop(columns=["pattern"]))])
+                    del st.session_state["optimize_plan"]
+                    st.success(f"{len(plan.shifts)}件のシフトを追加しました。")
+                    st.rerun() #見込み・残り額を更新
+
     st.subheader("バイト先ごとの年間合計（期間内）") #勤務先別合計セクション
     st.table(by_workplace) #勤務先別の支給合計をテーブル表示
 
@@ -1152,8 +1566,8 @@ elif page == "シフト一覧":
     st.table(by_month) #月別集計をテーブル表示
 
    #交通費と繁忙期手当の集計
-    total_transport = int(df_period["transport"].sum()) #期間内交通費合計
-    total_busy_bonus = int(df_period["busy_bonus"].sum()) #期間内繁忙期手当合計
+    total_transport = aggregates["total_transport"] #期間内交通費合計
+    total_busy_bonus = aggregates["total_busy_bonus"] #期間内繁忙期手当合計
 
     st.subheader("交通費・繁忙期手当の集計（期間内）") #交通費・手当の集計セクション
     col_t1, col_t2, col_t3 = st.columns(3) #3つのメトリクス表示
@@ -1166,59 +1580,15 @@ elif page == "シフト一覧":
 
    #データチェック（品質管理）
     st.subheader("データチェック（品質管理）") #データチェックセクション
-    issues: list[str] = [] #問題点メッセージのリスト
-
-   #1) 終了時刻が開始時刻より前・同じ
-    for _, row in df.iterrows():
-        try:
-            d = row["date"].date() #日付
-            start_t = datetime.strptime(row["start"], "%H:%M").time() #開始時刻
-            end_t = datetime.strptime(row["end"], "%H:%M").time() #終了時刻
-            start_dt = datetime.combine(d, start_t) #開始datetime
-            end_dt = datetime.combine(d, end_t) #終了datetime
-            if end_dt <= start_dt: #終了が開始以前なら問題
-                issues.append(
-                    f"{d} {row['workplace']}: 終了時刻が開始時刻以前になっています（{row['start']}〜{row['end']}）"
-                )
-        except Exception:
-            continue #パースに失敗した場合はスキップ
-
-   #2) 同じ日・同じ勤務先で時間帯が重複
-    for (d, wp), group in df.groupby([df["date"].dt.date, "workplace"]): #日付と勤務先でグルーピング
-        intervals = [] #(開始datetime, 終了datetime, 開始文字列, 終了文字列) のリスト
-        for _, r in group.iterrows():
-            try:
-                s_t = datetime.strptime(r["start"], "%H:%M").time()
-                e_t = datetime.strptime(r["end"], "%H:%M").time()
-                s_dt = datetime.combine(d, s_t)
-                e_dt = datetime.combine(d, e_t)
-                intervals.append((s_dt, e_dt, r["start"], r["end"]))
-            except Exception:
-                continue
-        intervals.sort(key=lambda x: x[0]) #開始時間でソート
-        for j in range(len(intervals) - 1):
-            s1, e1, s1_str, e1_str = intervals[j]
-            s2, e2, s2_str, e2_str = intervals[j + 1]
-            if s2 < e1: #後のシフト開始が前のシフト終了より早ければ重複
-                issues.append(
-                    f"{d} {wp}: {s1_str}〜{e1_str} と {s2_str}〜{e2_str} のシフトが重複しています"
-                )
-
-   #3) 時給や勤務時間が0・負の値
-    for _, row in df.iterrows():
-        if row["wage"] <= 0: #時給が0以下
-            issues.append(f"{row['date'].date()} {row['workplace']}: 時給が0以下になっています")
-        if row["work_hours"] < 0: #勤務時間が負
-            issues.append(f"{row['date'].date()} {row['workplace']}: 勤務時間が負の値になっています")
-        if row["pay"] < 0: #給与が負
-            issues.append(f"{row['date'].date()} {row['workplace']}: 給与が負の値になっています")
+    df = query_shifts() #データチェックとCSV出力は全シフトが対象
+    with timed("data_check", rows=len(df)):
+        issues = check_shifts(df) #時刻の逆転・時間帯の重複（勤務先をまたいでも）・時給や金額の異常をまとめて判定
 
     if not issues: #問題が一つもなければ
         st.success("明らかな不整合は見つかりませんでした。")
-    else: #問題があれば一覧表示
+    else: #問題があれば一覧表示（件数が多くても表1つで済ませる）
         st.warning(f"データにいくつか気になる点があります（{len(issues)}件）:")
-        for msg in issues:
-            st.write("・" + msg)
+        st.dataframe(issues_frame(issues), hide_index=True)
 
     csv = df.to_csv(index=False).encode("utf-8-sig") #DataFrameをCSV文字列にしてUTF-8(BOM付き)にエンコード
     st.download_button(
@@ -1231,11 +1601,12 @@ elif page == "シフト一覧":
     st.subheader("CSVからシフトを読み込む（任意）") #CSV読み込みセクション
     uploaded = st.file_uploader("shifts.csv を選択", type="csv") #CSVファイルアップロード
     if uploaded is not None:
-        df_uploaded = pd.read_csv(uploaded) #アップロードCSVを読み込む
+        df_uploaded = pd.read_csv(uploaded, dtype={"id": str}) #アップロードCSVを読み込む
         if "date" in df_uploaded.columns:
             df_uploaded["date"] = pd.to_datetime(df_uploaded["date"]).dt.date #date列をdate型に変換
-        st.session_state["shifts"] = df_uploaded.to_dict(orient="records") #セッションに反映
-        save_shifts() #CSVファイルとして保存
+        uploaded_records = df_uploaded.to_dict(orient="records")
+        ensure_shift_ids(uploaded_records) #IDのないシフトにIDを付与
+        save_shifts(uploaded_records) #全件入れ替えなのでスナップショット（SQLiteならテーブル）を作り直す
         st.success("CSVを読み込みました！ 画面を少しスクロールして確認してください。") #成功メッセージ
 
 
@@ -1335,18 +1706,23 @@ elif page == "勤務先設定":
                     key=f"{wp_name}_busy_bonus",
                 ) #繁忙期手当（円/時間）
 
-           #入力値を即マスタに反映
-            settings_wp["default_wage"] = int(default_wage)
-            settings_wp["default_transport"] = int(default_transport)
-            settings_wp["pre_minutes"] = int(pre_minutes)
-            settings_wp["post_minutes"] = int(post_minutes)
-            settings_wp["night_start"] = int(night_start)
-            settings_wp["night_end"] = int(night_end)
-            settings_wp["night_rate"] = float(night_rate)
-            settings_wp["early_start"] = int(early_start)
-            settings_wp["early_end"] = int(early_end)
-            settings_wp["early_bonus_per_hour"] = float(early_bonus_per_hour)
-            settings_wp["busy_bonus_per_hour"] = float(busy_bonus_per_hour)
+           #入力値を即このセッションの設定に反映
+            set_workplace_values(
+                wp_name,
+                {
+                    "default_wage": int(default_wage),
+                    "default_transport": int(default_transport),
+                    "pre_minutes": int(pre_minutes),
+                    "post_minutes": int(post_minutes),
+                    "night_start": int(night_start),
+                    "night_end": int(night_end),
+                    "night_rate": float(night_rate),
+                    "early_start": int(early_start),
+                    "early_end": int(early_end),
+                    "early_bonus_per_hour": float(early_bonus_per_hour),
+                    "busy_bonus_per_hour": float(busy_bonus_per_hour),
+                },
+            )
     
         # --- 勤務パターン設定 -------------------------------------------------
     st.subheader("勤務パターン設定")
@@ -1404,20 +1780,25 @@ elif page == "勤務先設定":
                     key=f"{pname}_break",
                 )
                 transport = st.number_input(
-                    "交通費",
+                    "交通費（0で勤務先デフォルト）",
                     min_value=0,
                     value=int(pattern.get("transport", 0)),
                     step=10,
                     key=f"{pname}_transport",
                 )
 
-            # 入力値を即 SHIFT_PATTERNS に反映
-            SHIFT_PATTERNS[pname]["workplace"] = workplace
-            SHIFT_PATTERNS[pname]["start"] = start_t
-            SHIFT_PATTERNS[pname]["end"] = end_t
-            SHIFT_PATTERNS[pname]["wage"] = int(wage_value) if wage_value > 0 else None
-            SHIFT_PATTERNS[pname]["manual_break_min"] = int(break_min)
-            SHIFT_PATTERNS[pname]["transport"] = int(transport)
+            # 入力値を即このセッションの勤務パターンに反映
+            set_pattern_values(
+                pname,
+                {
+                    "workplace": workplace,
+                    "start": start_t,
+                    "end": end_t,
+                    "wage": int(wage_value) if wage_value > 0 else None,
+                    "manual_break_min": int(break_min),
+                    "transport": int(transport),
+                },
+            )
 
             # 削除ボタン
             if st.button("このパターンを削除", key=f"{pname}_delete"):
@@ -1429,7 +1810,7 @@ elif page == "勤務先設定":
     deleted = st.session_state.get("delete_patterns", [])
     if deleted:
         for pname in deleted:
-            SHIFT_PATTERNS.pop(pname, None)
+            set_pattern_values(pname, None)
         st.session_state["delete_patterns"] = []
         st.success("選択した勤務パターンを削除しました。")
 
@@ -1479,22 +1860,49 @@ elif page == "勤務先設定":
         elif new_name in SHIFT_PATTERNS:
             st.warning("同じ名前のパターンが既に存在します。")
         else:
-            SHIFT_PATTERNS[new_name] = {
-                "workplace": new_wp,
-                "start": new_start,
-                "end": new_end,
-                "wage": int(new_wage),
-                "manual_break_min": int(new_break),
-                "transport": int(new_transport),
-            }
+            set_pattern_values(
+                new_name,
+                {
+                    "workplace": new_wp,
+                    "start": new_start,
+                    "end": new_end,
+                    "wage": int(new_wage),
+                    "manual_break_min": int(new_break),
+                    "transport": int(new_transport),
+                },
+            )
             st.success(f"勤務パターン「{new_name}」を追加しました。")
 
     if st.button("勤務先設定を保存"): #勤務先設定の保存ボタン
         save_settings(limit_income, fiscal_start, theme_name, WORKPLACE_SETTINGS) #JSONに保存
         st.success("勤務先設定を保存しました。") #成功メッセージ
 
+    if st.button("保存済みシフトの給与を現在の設定で再計算"): #設定変更後の全件再計算ボタン
+        from shift_engine import apply_night_early_to_records, apply_pay_to_records #一括計算エンジン
+
+        with data_lock(): #読んでから書き戻すまでの間にほかのセッションの変更が入らないように
+            refresh_session_shifts()
+            shifts_all = all_shift_records() #全シフト
+            apply_night_early_to_records(shifts_all, WORKPLACE_SETTINGS) #深夜・早朝時間を一括で再計算
+            apply_pay_to_records(shifts_all, WORKPLACE_SETTINGS) #給与を一括で再計算
+            save_shifts(shifts_all) #保存
+        st.success(f"{len(shifts_all)}件のシフトの給与を再計算しました。") #成功メッセージ
+
+    if st.button("月別・勤務先別の集計を検証"): #差分更新してきた集計と全件からの再計算を比べる
+        import pandas as pd
+        from shift_rollup import verify_rollup
+
+        problems = verify_rollup(current_rollup(), query_shifts())
+        if not problems:
+            st.success("集計は全件からの再計算と一致しています。")
+        else:
+            st.warning(f"集計に食い違いがありました（{len(problems)}件）。全件から作り直します。")
+            st.dataframe(pd.DataFrame({"内容": problems}), hide_index=True)
+            save_shifts() #保存し直すと集計も作り直される
+
 
 # 最後に設定を保存（テーマ＆背景＆勤務先設定込み）
-save_settings(limit_income, fiscal_start, theme_name, WORKPLACE_SETTINGS) #毎回最後に設定を保存
+save_settings(limit_income, fiscal_start, theme_name, WORKPLACE_SETTINGS) #変更があったときだけ保存される
+finish_timing()
 
 ### End of File ###
\ No newline at end of file
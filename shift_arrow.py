@@ -0,0 +1,445 @@
+## シフトデータの列指向保存（Arrow IPC、年度ごとのファイルに分割）
+# ディレクトリ構成:
+#   shifts_arrow/manifest.json       … 形式のバージョン・年度ごとのファイル名・件数・日付範囲・勤務先・月別集計
+#   shifts_arrow/fy2025-xxxxxxxx.arrow … その年度のシフト（列ごとに型付き、日付順）
+# 日付は date32、給与・時給・時間（分）などは int64、勤務先は辞書エンコードの列で保存するので、読み込み時に文字列を解析しない。
+# 年度ファイルは必要になったときに初めてメモリマップで開く（今年の月だけ見るなら過去の年度は読まない）。
+# 書き込みは新しい名前のファイルを作ってから manifest.json を置き換えるので、途中で落ちても前の状態が残る。
+from __future__ import annotations #型ヒントは実行時に評価しない（pyarrow / pandas を読み込まずに済むように）
+
+import json #manifest.json の読み書き
+import os #ファイル操作用
+import uuid #年度ファイルの名前（世代ごとに変える）
+from datetime import date, datetime #日付の変換用
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Set, Tuple #型ヒント用
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa #Arrow形式を使うときだけ必要（使う関数の中でだけ読み込む）
+
+from shift_rollup import DURATION_COLUMNS, ROLLUP_FIELDS, Rollup, build_rollup, duration_minutes #月別・勤務先別の集計
+from shift_store import (
+    BOOL_COLUMNS,
+    SHIFT_COLUMNS,
+    atomic_write_text,
+    bump_write_counter,
+    ensure_shift_ids,
+    file_lock,
+    read_snapshot,
+    read_write_counter,
+    replay_journal,
+    shift_crosses_midnight,
+)
+
+MANIFEST_FILE = "manifest.json" #年度ファイルの一覧
+DEFAULT_FISCAL_START_MONTH = 1 #年度の始まりの月（扶養の判定は1〜12月なので暦年）
+FORMAT_VERSION = 2 #列や集計の形を変えたら上げる（古い形式は arrow_open で書き直す）。2: 時間を分の整数列で持つ
+
+_table_cache: Dict[str, pa.Table] = {} #年度ファイル → メモリマップしたテーブル（ファイルは書き換えないので名前だけで引ける）
+_manifest_cache: Dict[str, Tuple[Tuple[int, int, int], Dict[str, Any]]] = {} #manifest.json のパス → ((書き込みカウンタ, 更新時刻ns, サイズ), 内容)
+
+
+def fiscal_year_of(day: date, start_month: int = DEFAULT_FISCAL_START_MONTH) -> int:
+    """日付の属する年度（start_month 月始まり）"""
+    return day.year if day.month >= start_month else day.year - 1
+
+
+def _as_date(value: Any) -> date:
+    """date / datetime / Timestamp / "YYYY-MM-DD" を date にする"""
+    if isinstance(value, datetime): #Timestamp も datetime のサブクラス
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+### manifest.json
+def _manifest_path(root: str) -> str:
+    return os.path.join(root, MANIFEST_FILE)
+
+
+def _read_manifest(root: str) -> Dict[str, Any]:
+    """manifest.json を読む（前回から変わっていなければ読み直さない）"""
+    path = _manifest_path(root)
+    if not os.path.exists(path):
+        return _new_manifest(DEFAULT_FISCAL_START_MONTH)
+    st = os.stat(path)
+    stamp = (read_write_counter(path), st.st_mtime_ns, st.st_size) #更新時刻の刻みが粗くても、カウンタで書き換えに気づく
+    cached = _manifest_cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    _manifest_cache[path] = (stamp, manifest)
+    return manifest
+
+
+def _new_manifest(fiscal_start_month: int) -> Dict[str, Any]:
+    return {"version": FORMAT_VERSION, "fiscal_start_month": fiscal_start_month, "partitions": {}}
+
+
+def _write_manifest(root: str, manifest: Dict[str, Any]) -> None:
+    atomic_write_text(_manifest_path(root), json.dumps(manifest, ensure_ascii=False))
+    bump_write_counter(_manifest_path(root))
+
+
+def _partitions_between(
+    manifest: Dict[str, Any], start: Optional[date], end: Optional[date]
+) -> List[Dict[str, Any]]:
+    """日付範囲（両端含む）にかかる年度だけを、年度順に返す"""
+    chosen = []
+    for fy in sorted(manifest["partitions"], key=int):
+        part = manifest["partitions"][fy]
+        if start is not None and part["max_date"] < start.isoformat():
+            continue
+        if end is not None and part["min_date"] > end.isoformat():
+            continue
+        chosen.append(part)
+    return chosen
+
+
+### 年度ファイルの読み書き
+def _open_partition(root: str, part: Dict[str, Any]) -> pa.Table:
+    """年度ファイルをメモリマップで開く（初めて使うときだけ。中身はアクセスした列の分だけ読まれる）"""
+    import pyarrow as pa
+
+    path = os.path.join(root, part["file"])
+    table = _table_cache.get(path)
+    if table is None:
+        with pa.memory_map(path, "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        _table_cache[path] = table
+    return table
+
+
+def _records_to_table(records: List[Dict[str, Any]]) -> pa.Table:
+    """シフトのdictリストを型付きのテーブルにする（整数列の欠損は0）"""
+    import pandas as pd
+    import pyarrow as pa
+
+    df = pd.DataFrame(records)
+    fields = []
+    for col, sql_type in SHIFT_COLUMNS.items():
+        if col not in df.columns:
+            df[col] = None
+        if col == "date":
+            df[col] = pd.Series([_as_date(v) for v in df[col]], index=df.index, dtype=object) #空でも日付の列として扱う
+            fields.append(pa.field(col, pa.date32()))
+        elif col == "crosses_midnight":
+            derived = pd.Series([shift_crosses_midnight(r) for r in records], index=df.index, dtype=bool)
+            df[col] = df[col].where(df[col].notna(), derived).astype(bool) #古いシフトは時刻から決める
+            fields.append(pa.field(col, pa.bool_()))
+        elif col in BOOL_COLUMNS:
+            df[col] = df[col].fillna(False).astype(bool)
+            fields.append(pa.field(col, pa.bool_()))
+        elif col in DURATION_COLUMNS:
+            df[col] = pd.Series([duration_minutes(r, col) for r in records], index=df.index, dtype="int64")
+            fields.append(pa.field(col, pa.int64())) #分の列がない古いシフトは時間数から
+        elif sql_type.startswith("INTEGER"):
+            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).round().astype("int64")
+            fields.append(pa.field(col, pa.int64()))
+        elif sql_type.startswith("REAL"):
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+            fields.append(pa.field(col, pa.float64()))
+        else:
+            df[col] = df[col].astype(object).where(df[col].notna(), None)
+            fields.append(pa.field(col, pa.string()))
+    extra = [c for c in df.columns if c not in SHIFT_COLUMNS] #知らない列は型を推測して残す
+    table = pa.Table.from_pandas(df[list(SHIFT_COLUMNS)], schema=pa.schema(fields), preserve_index=False)
+    for col in extra:
+        table = table.append_column(col, pa.array(df[col].tolist(), from_pandas=True))
+    return table
+
+
+def _write_partition(root: str, fy: str, table: pa.Table, manifest: Dict[str, Any]) -> Optional[str]:
+    """
+    1年度分のテーブルを新しいファイルに書き、manifest の該当年度を差し替える（manifest.json はまだ書かない）。
+    置き換えられた古いファイル名を返す。
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    old = manifest["partitions"].pop(fy, None)
+    old_file = old["file"] if old else None
+    if table.num_rows == 0:
+        return old_file
+
+    workplace = table.column("workplace").cast(pa.string()).combine_chunks()
+    table = table.set_column(
+        table.schema.get_field_index("workplace"), "workplace", pc.dictionary_encode(workplace)
+    ) #勤務先は種類が少ないので辞書エンコード
+    table = table.sort_by([("date", "ascending"), ("start", "ascending")]).combine_chunks()
+
+    name = f"fy{fy}-{uuid.uuid4().hex[:8]}.arrow"
+    tmp_path = os.path.join(root, f".tmp_{name}")
+    with pa.OSFile(tmp_path, "wb") as sink: #メモリマップで読めるよう圧縮はしない
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, os.path.join(root, name))
+
+    rollup = build_rollup(_table_to_frame(table))
+    dates = table.column("date")
+    manifest["partitions"][fy] = {
+        "file": name,
+        "rows": table.num_rows,
+        "min_date": pc.min(dates).as_py().isoformat(),
+        "max_date": pc.max(dates).as_py().isoformat(),
+        "workplaces": sorted(set(workplace.to_pylist()) - {None}),
+        "rollup": [[ym, wp, *cell] for (ym, wp), cell in rollup.items()],
+    }
+    return old_file
+
+
+def _commit(root: str, manifest: Dict[str, Any], old_files: Iterable[Optional[str]]) -> None:
+    """manifest.json を書き換えて確定し、使わなくなった年度ファイルを消す"""
+    _write_manifest(root, manifest)
+    for name in old_files:
+        if not name:
+            continue
+        path = os.path.join(root, name)
+        _table_cache.pop(path, None)
+        try:
+            os.remove(path)
+        except OSError: #他のセッションがまだ開いている場合など。次に開いたときに片付ける
+            pass
+
+
+def _decode_workplace(table: pa.Table) -> pa.Table:
+    """辞書エンコードした勤務先の列を文字列に戻す"""
+    import pyarrow as pa
+
+    if "workplace" not in table.column_names:
+        return table
+    idx = table.schema.get_field_index("workplace")
+    return table.set_column(idx, "workplace", table.column(idx).cast(pa.string()))
+
+
+def _table_to_frame(table: pa.Table, date_as_object: bool = False) -> pd.DataFrame:
+    """テーブルをDataFrameにする（勤務先は文字列に戻す。date列は datetime64 か date）"""
+    return _decode_workplace(table).to_pandas(date_as_object=date_as_object)
+
+
+def _empty_table() -> pa.Table:
+    return _records_to_table([])
+
+
+def _concat(tables: List[pa.Table]) -> pa.Table:
+    import pyarrow as pa
+
+    if not tables:
+        return _empty_table()
+    return pa.concat_tables([_decode_workplace(t) for t in tables], promote_options="permissive")
+
+
+### 公開する操作（sqlite_* と同じ形）
+def arrow_open(root: str, fiscal_start_month: int = DEFAULT_FISCAL_START_MONTH) -> str:
+    """保存ディレクトリを用意する（manifest に載っていない残りファイルを片付ける）"""
+    os.makedirs(root, exist_ok=True)
+    with file_lock(_manifest_path(root)): #ほかのセッションの書き込み・片付けと重ならないように
+        manifest = _read_manifest(root)
+        if not os.path.exists(_manifest_path(root)):
+            manifest = _new_manifest(fiscal_start_month)
+            _write_manifest(root, manifest)
+        elif manifest.get("version", 1) < FORMAT_VERSION: #古い形式は一度だけ今の形式で書き直す
+            arrow_replace_all(root, arrow_load_records(root))
+            manifest = _read_manifest(root)
+        in_use = {part["file"] for part in manifest["partitions"].values()}
+        for name in os.listdir(root):
+            if name.endswith(".arrow") and name not in in_use:
+                try:
+                    os.remove(os.path.join(root, name))
+                except OSError:
+                    pass
+        return root
+
+
+def arrow_manifest_file(root: str) -> str:
+    """書き込みのたびに置き換わるファイル（データのバージョンの判定用）"""
+    return _manifest_path(root)
+
+
+def arrow_replace_all(root: str, records: List[Dict[str, Any]]) -> None:
+    """全シフトを年度ごとに書き直す"""
+    with file_lock(_manifest_path(root)): #ほかのセッションの書き込み・片付けと重ならないように
+        manifest = _read_manifest(root)
+        start_month = manifest["fiscal_start_month"]
+        by_year: Dict[str, List[Dict[str, Any]]] = {}
+        for rec in records:
+            fy = str(fiscal_year_of(_as_date(rec.get("date")), start_month))
+            by_year.setdefault(fy, []).append(rec)
+        old_files = [part["file"] for part in manifest["partitions"].values()]
+        manifest = _new_manifest(start_month)
+        for fy, recs in by_year.items():
+            _write_partition(root, fy, _records_to_table(recs), manifest)
+        _commit(root, manifest, old_files)
+
+
+def _locate_ids(root: str, manifest: Dict[str, Any], ids: Set[str]) -> Dict[str, str]:
+    """シフトID → そのシフトがある年度（id列だけを見る）"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    found: Dict[str, str] = {}
+    if not ids:
+        return found
+    wanted = pa.array(sorted(ids), type=pa.string())
+    for fy, part in manifest["partitions"].items():
+        id_column = _open_partition(root, part).column("id")
+        for sid in id_column.filter(pc.is_in(id_column, value_set=wanted)).to_pylist():
+            found[sid] = fy
+    return found
+
+
+def arrow_apply_ops(root: str, ops: Iterable[Dict[str, Any]]) -> None:
+    """
+    操作（add / update / delete）をまとめて反映する。
+    触れたシフトのある年度（変更前と変更後）のファイルだけを書き直す。存在しないシフトへの更新・削除は無視する。
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    ops = list(ops)
+    if not ops:
+        return
+    with file_lock(_manifest_path(root)): #ほかのセッションの書き込み・片付けと重ならないように
+        manifest = _read_manifest(root)
+        manifest = {**manifest, "partitions": dict(manifest["partitions"])}
+        start_month = manifest["fiscal_start_month"]
+        located = _locate_ids(
+            root, manifest, {op["id"] for op in ops if op.get("op") in ("update", "delete")}
+        )
+
+        exists = {sid: True for sid in located}
+        final: Dict[str, Optional[Dict[str, Any]]] = {} #ID → 操作後のシフト（削除ならNone）
+        for op in ops:
+            kind = op.get("op")
+            sid = op.get("id")
+            if kind == "add":
+                final[sid] = op["shift"]
+                exists[sid] = True
+            elif kind == "update" and exists.get(sid):
+                final[sid] = op["shift"]
+            elif kind == "delete" and exists.get(sid):
+                final[sid] = None
+                exists[sid] = False
+        if not final:
+            return
+
+        new_rows: Dict[str, List[Dict[str, Any]]] = {}
+        for sid, shift in final.items():
+            if shift is not None:
+                fy = str(fiscal_year_of(_as_date(shift.get("date")), start_month))
+                new_rows.setdefault(fy, []).append(shift)
+        touched_years = {located[sid] for sid in final if sid in located} | set(new_rows)
+
+        removed = pa.array(sorted(final), type=pa.string())
+        old_files = []
+        for fy in sorted(touched_years):
+            parts = []
+            part = manifest["partitions"].get(fy)
+            if part is not None:
+                table = _open_partition(root, part)
+                parts.append(table.filter(pc.invert(pc.is_in(table.column("id"), value_set=removed))))
+            if fy in new_rows:
+                parts.append(_records_to_table(new_rows[fy]))
+            old_files.append(_write_partition(root, fy, _concat(parts), manifest))
+        _commit(root, manifest, old_files)
+
+
+def _query_table(
+    root: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    workplaces: Optional[List[str]] = None,
+    ids: Optional[List[str]] = None,
+) -> pa.Table:
+    """条件にかかる年度だけを開いて絞り込む"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    tables = []
+    for part in _partitions_between(_read_manifest(root), start, end):
+        if workplaces is not None and not set(workplaces) & set(part["workplaces"]):
+            continue
+        table = _open_partition(root, part)
+        mask = None
+        conditions = []
+        if start is not None:
+            conditions.append(pc.greater_equal(table.column("date"), pa.scalar(start, pa.date32())))
+        if end is not None:
+            conditions.append(pc.less_equal(table.column("date"), pa.scalar(end, pa.date32())))
+        if workplaces is not None:
+            conditions.append(pc.is_in(
+                table.column("workplace").cast(pa.string()),
+                value_set=pa.array(list(workplaces), type=pa.string()),
+            ))
+        if ids is not None:
+            conditions.append(pc.is_in(table.column("id"), value_set=pa.array(list(ids), type=pa.string())))
+        for cond in conditions:
+            mask = cond if mask is None else pc.and_(mask, cond)
+        tables.append(table if mask is None else table.filter(mask))
+    return _concat(tables)
+
+
+def arrow_query_shifts(
+    root: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    workplaces: Optional[List[str]] = None,
+    ids: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """日付範囲（両端含む）・勤務先・IDで絞り込んだシフトをDataFrameで返す（date列は datetime64）"""
+    return _table_to_frame(_query_table(root, start, end, workplaces, ids))
+
+
+def arrow_load_records(root: str, **filters: Any) -> List[Dict[str, Any]]:
+    """絞り込んだシフトをdictのリスト（date列はdate型）で返す"""
+    df = _table_to_frame(_query_table(root, **filters), date_as_object=True)
+    return df.to_dict(orient="records")
+
+
+def arrow_count(root: str) -> int:
+    return sum(part["rows"] for part in _read_manifest(root)["partitions"].values())
+
+
+def arrow_date_bounds(root: str) -> Tuple[Optional[date], Optional[date]]:
+    """最初と最後のシフトの日付（manifest だけで求まる）"""
+    parts = _read_manifest(root)["partitions"].values()
+    if not parts:
+        return None, None
+    return (
+        date.fromisoformat(min(part["min_date"] for part in parts)),
+        date.fromisoformat(max(part["max_date"] for part in parts)),
+    )
+
+
+def arrow_workplaces(root: str) -> List[str]:
+    """シフトに登場する勤務先の一覧"""
+    names: Set[str] = set()
+    for part in _read_manifest(root)["partitions"].values():
+        names.update(part["workplaces"])
+    return sorted(names)
+
+
+def arrow_load_rollup(root: str) -> Rollup:
+    """年度ごとに保存してある月別・勤務先別の集計をまとめる（シフト本体は読まない）"""
+    rollup: Rollup = {}
+    for part in _read_manifest(root)["partitions"].values():
+        for ym, wp, *cell in part["rollup"]:
+            have = rollup.setdefault((ym, wp), [0] * (len(ROLLUP_FIELDS) + 1))
+            for i, value in enumerate(cell):
+                have[i] += value
+    return rollup
+
+
+def arrow_import_if_empty(root: str, data_file: str, journal_file: str) -> None:
+    """まだ何も保存されておらず、CSV（＋ジャーナル）があれば一度だけ取り込む"""
+    if _read_manifest(root)["partitions"]:
+        return
+    if not os.path.exists(data_file) and not os.path.exists(journal_file):
+        return
+    records = read_snapshot(data_file)
+    ensure_shift_ids(records)
+    replay_journal(records, journal_file)
+    if records:
+        arrow_replace_all(root, records)
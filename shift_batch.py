@@ -0,0 +1,142 @@
+## シフトCSVの一括再計算（画面を開かずに、時給改定などの後で全シフトの給与を計算し直すためのコマンド）
+# 使い方:
+#   python shift_batch.py shifts_data.csv --settings settings.json -o shifts_recomputed.csv
+#   python shift_batch.py data/users/<利用者>/shifts_data.csv --user <利用者> -o shifts_recomputed.csv
+#   python shift_batch.py shifts_data.csv --in-place --journal shifts_journal.jsonl --workers 4
+# CSVは chunksize 行ずつ読み、計算した分から書き出すので、ファイル全体をメモリに載せない。
+# --settings を省くと、アプリと同じく SHIFT_DATA_ROOT（と --user）のデータディレクトリの settings.json を読む。
+import argparse #コマンドライン引数
+import os #パス操作
+import sys
+import time #処理時間の表示
+from contextlib import nullcontext #ロックが要らないとき用
+from multiprocessing import Pool #チャンクを複数プロセスで計算する
+from typing import Any, Dict, Iterator, Optional #型ヒント用
+
+import pandas as pd #CSVのチャンク読み込み用
+
+from shift_config import build_config, read_settings_file, thaw #アプリと同じ勤務先設定（既定値に settings.json を重ねたもの）
+from shift_engine import recompute_shift_frame #派生列の一括計算
+from shift_store import ( #書き終えてから置き換える書き込み・ジャーナルの反映（コンパクション）・アプリとの排他
+    atomic_writer,
+    bump_write_counter,
+    file_lock,
+    load_records,
+    user_data_dir,
+)
+
+DEFAULT_CHUNKSIZE = 50_000 #1回に読み込む行数
+
+_worker_settings: Dict[str, Dict[str, Any]] = {} #ワーカープロセスごとの勤務先設定（初期化時に1回だけ受け取る）
+_worker_reprice = False
+
+
+def load_workplace_settings(settings_file: str) -> Dict[str, Dict[str, Any]]:
+    """アプリと同じ勤務先設定（既定の勤務先設定に settings.json を重ねたもの。ファイルがなければ既定値だけ）"""
+    return thaw(build_config(read_settings_file(settings_file)).workplaces)
+
+
+def _init_worker(workplace_settings: Dict[str, Dict[str, Any]], reprice_wages: bool) -> None:
+    global _worker_settings, _worker_reprice
+    _worker_settings = workplace_settings
+    _worker_reprice = reprice_wages
+
+
+def _recompute_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """1チャンク分を計算し直す（ワーカープロセスで実行）"""
+    return recompute_shift_frame(chunk, _worker_settings, reprice_wages=_worker_reprice)
+
+
+def read_chunks(input_file: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    """CSVを chunksize 行ずつ読む（IDは数字だけでも文字列のまま）"""
+    yield from pd.read_csv(input_file, dtype={"id": str}, chunksize=chunksize)
+
+
+def recompute_file(
+    input_file: str,
+    output_file: str,
+    workplace_settings: Dict[str, Dict[str, Any]],
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    workers: int = 1,
+    reprice_wages: bool = False,
+) -> int:
+    """
+    シフトCSVの派生列をすべて計算し直して output_file に書き出す（処理した行数を返す）。
+    一時ファイルに書いてから置き換えるので、input_file と output_file が同じでもよい。
+    """
+    rows = 0
+    with atomic_writer(output_file) as out:
+        if workers > 1: #チャンクを複数プロセスに配り、順番どおりに受け取って書く
+            with Pool(workers, initializer=_init_worker, initargs=(workplace_settings, reprice_wages)) as pool:
+                results = pool.imap(_recompute_chunk, read_chunks(input_file, chunksize))
+                for i, chunk in enumerate(results):
+                    chunk.to_csv(out, index=False, header=(i == 0))
+                    rows += len(chunk)
+        else:
+            _init_worker(workplace_settings, reprice_wages)
+            for i, chunk in enumerate(read_chunks(input_file, chunksize)):
+                _recompute_chunk(chunk).to_csv(out, index=False, header=(i == 0))
+                rows += len(chunk)
+        if rows == 0: #データ行がなければ見出し行だけ写す
+            pd.read_csv(input_file, dtype={"id": str}, nrows=0).to_csv(out, index=False)
+    return rows
+
+
+def compact_journal(data_file: str, journal_file: str) -> None:
+    """ジャーナルに残っている操作をスナップショットCSVに反映しておく（アプリのデータを直接処理するとき）"""
+    if os.path.exists(journal_file) and os.path.getsize(journal_file) > 0:
+        load_records(data_file, journal_file) #ジャーナルを反映したらスナップショットを書き直してくれる
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="シフトCSVの実働時間・深夜/早朝時間・給与をまとめて計算し直す")
+    parser.add_argument("input", help="シフトCSV（アプリの shifts_data.csv と同じ形式）")
+    parser.add_argument("-o", "--output", help="書き出し先のCSV")
+    parser.add_argument(
+        "--in-place",
+        action="store_true",
+        help="入力ファイルを計算結果で置き換える（終わるまでアプリの保存はロック待ちになる）",
+    )
+    parser.add_argument("--settings", help="勤務先設定を読む settings.json（省くとデータディレクトリの settings.json）")
+    parser.add_argument(
+        "--data-root",
+        default=os.environ.get("SHIFT_DATA_ROOT", ""),
+        help="アプリのデータの置き場所（既定は SHIFT_DATA_ROOT。未設定なら作業ディレクトリ）",
+    )
+    parser.add_argument("--user", help="利用者ID（アプリの利用者ごとのデータディレクトリの settings.json を読む）")
+    parser.add_argument("--journal", help="アプリのジャーナル（あれば先にCSVへ反映してから処理する）")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="1回に読み込む行数")
+    parser.add_argument("--workers", type=int, default=1, help="計算に使うプロセス数")
+    parser.add_argument("--reprice-wages", action="store_true", help="時給も時給履歴から引き直す")
+    args = parser.parse_args(argv)
+
+    if bool(args.output) == bool(args.in_place):
+        parser.error("-o/--output か --in-place のどちらか一方を指定してください")
+    output = args.input if args.in_place else args.output
+
+    settings_file = args.settings or os.path.join(user_data_dir(args.data_root, args.user), "settings.json")
+    workplace_settings = load_workplace_settings(settings_file)
+
+    started = time.perf_counter()
+    #アプリのデータを書き換えるときは、アプリの保存（data_lock）と同じロックを置き換えまで持ち続ける。
+    #途中でアプリが書いた新しいスナップショットやジャーナルの操作を、古い内容で上書きしないように
+    lock = file_lock(args.input) if (args.in_place or args.journal) else nullcontext()
+    with lock:
+        if args.journal:
+            compact_journal(args.input, args.journal)
+        rows = recompute_file(
+            args.input,
+            output,
+            workplace_settings,
+            chunksize=args.chunksize,
+            workers=max(1, args.workers),
+            reprice_wages=args.reprice_wages,
+        )
+        if args.in_place:
+            bump_write_counter(output) #開いているセッションに集計を作り直させる
+    print(f"{rows}行を再計算しました（{time.perf_counter() - started:.2f}秒）: {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
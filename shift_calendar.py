@@ -0,0 +1,102 @@
+## カレンダー表示用のデータ作成（月のシフトを日付ごとに1回でまとめる＋祝日表）
+import calendar #カレンダー生成用モジュール
+import threading #祝日表の作成を複数セッションで重複させないため
+from dataclasses import dataclass #日別集計の型定義用
+from datetime import date #日付の型
+from typing import Any, Dict, FrozenSet, List, Tuple #型ヒント用
+
+import numpy as np #祝日判定の一括計算用
+import pandas as pd #DataFrame処理用
+
+from shift_engine import EPOCH_ORDINAL, dates_to_ordinals #日付の列を序数の配列に変換
+from shift_rollup import duration_minutes_column #勤務時間（分）の列
+
+
+@dataclass(frozen=True)
+class DaySummary:
+    """1日分のシフトの集計"""
+    total_pay: int #その日の支給額合計
+    total_hours: float #その日の勤務時間合計
+    workplaces: Tuple[str, ...] #その日の勤務先名（名前順）
+
+
+@dataclass(frozen=True)
+class MonthModel:
+    """カレンダー1か月分の表示データ"""
+    year: int
+    month: int
+    weeks: List[List[date]] #週ごとの日付リスト（前後の月の日付を含む、月曜始まり）
+    days: Dict[date, DaySummary] #シフトのある日だけの集計
+
+    def in_month(self, d: date) -> bool:
+        """表示中の月の日付かどうか"""
+        return d.year == self.year and d.month == self.month
+
+
+def summarize_days(df_month: pd.DataFrame) -> Dict[date, DaySummary]:
+    """月のシフトを日付ごとに1回のgroupbyで集計する（O(行数)）"""
+    if df_month.empty:
+        return {}
+    keys = pd.to_datetime(df_month["date"]).dt.date #日付（時刻なし）
+    grouped = df_month.groupby(keys, sort=True)
+    pay = grouped["pay"].sum()
+    minutes = duration_minutes_column(df_month, "work_min").groupby(keys).sum() #勤務時間は整数の分で足す
+    workplaces = grouped["workplace"].agg(lambda s: tuple(sorted(s.astype(str).unique())))
+    return {
+        d: DaySummary(
+            total_pay=int(pay[d]),
+            total_hours=int(minutes[d]) / 60,
+            workplaces=workplaces[d],
+        )
+        for d in pay.index
+    }
+
+
+def build_month_model(year: int, month: int, df_month: pd.DataFrame) -> MonthModel:
+    """表示する月のカレンダー構造と日別集計をまとめて作る"""
+    cal = calendar.Calendar(firstweekday=0) #月曜始まりのカレンダー（0=月曜）
+    return MonthModel(
+        year=year,
+        month=month,
+        weeks=cal.monthdatescalendar(year, month), #表示対象月の「週ごとの日付リスト」
+        days=summarize_days(df_month),
+    )
+
+
+### 祝日表（年ごとに1回だけ jpholiday から作り、プロセス内の全セッションで共有する）
+_HOLIDAY_CACHE: Dict[int, FrozenSet[int]] = {} #年 → その年の祝日の序数（date.toordinal()）
+_HOLIDAY_LOCK = threading.Lock()
+
+
+def year_holiday_ordinals(year: int) -> FrozenSet[int]:
+    """その年の祝日（振替休日を含む）の序数の集合"""
+    cached = _HOLIDAY_CACHE.get(year)
+    if cached is not None:
+        return cached
+    with _HOLIDAY_LOCK:
+        if year not in _HOLIDAY_CACHE:
+            import jpholiday #日本の祝日判定用ライブラリ（初めてその年を引くときだけ使う）
+
+            _HOLIDAY_CACHE[year] = frozenset(
+                d.toordinal() for d, _name in jpholiday.year_holidays(year)
+            )
+        return _HOLIDAY_CACHE[year]
+
+
+def is_holiday(d: date) -> bool:
+    """祝日かどうか（2回目以降は jpholiday を呼ばず、集合を引くだけ）"""
+    return d.toordinal() in year_holiday_ordinals(d.year)
+
+
+def is_holiday_array(dates: Any) -> np.ndarray:
+    """日付の列に対して祝日かどうかを一括で判定する（祝日手当の集計などに使う）"""
+    ordinals = dates_to_ordinals(dates)
+    if len(ordinals) == 0:
+        return np.zeros(0, dtype=bool)
+    days = (ordinals - EPOCH_ORDINAL).astype("datetime64[D]") #1970-01-01 からの日数
+    years = np.unique(days.astype("datetime64[Y]").astype(np.int64) + 1970) #登場する年
+    holidays = np.fromiter(
+        sorted(set().union(*(year_holiday_ordinals(int(y)) for y in years))),
+        dtype=np.int64,
+    )
+    return np.isin(ordinals, holidays)
@@ -0,0 +1,338 @@
+## 勤務先設定・勤務パターンの読み込み（設定ファイルが変わったときだけ読み直し、全セッションで読み取り専用に共有する）
+from __future__ import annotations #型ヒントは実行時に評価しない
+
+import copy #既定値を書き換えずに重ねるため
+import hashlib #設定の版（内容のハッシュ）用
+import json #settings.json の読み込み
+import os #ファイルの状態の取得
+import threading #共有キャッシュの排他
+from dataclasses import dataclass #設定オブジェクトの型定義用
+from datetime import datetime, time #勤務パターンの時刻の変換
+from types import MappingProxyType #読み取り専用の辞書
+from typing import TYPE_CHECKING, Any, Dict, Mapping, Optional, Tuple #型ヒント用
+
+if TYPE_CHECKING:
+    import sqlite3
+
+CONFIG_CACHE_ENTRIES = 256 #覚えておく設定の数（設定ファイルごと。超えたら一度捨てる）
+
+
+DEFAULT_WORKPLACE_SETTINGS: Dict[str, Dict[str, Any]] = { #各バイト先ごとのルールやデフォルト時給などを定義（設定ファイルの内容はこれに重ねる）
+    "すたば": { #バイト先「すたば」の設定
+        "default_wage": 1310, #デフォルト時給
+        "default_transport": 640, #デフォルト交通費
+        "wage_history": [ #時給改定の履歴（開始日と時給）
+            {"from": "2024-12-12", "wage": 1200},
+            {"from": "2025-04-01", "wage": 1220},
+            {"from": "2025-10-01", "wage": 1310},
+        ],
+        "pre_minutes": 10, #給与計算上、開始前に自動でプラスされる分数
+        "post_minutes": 5, #給与計算上、終了後に自動でプラスされる分数
+        "break_rules": [ #勤務時間に応じた休憩時間の自動付与ルール
+            {"min_hours": 4, "break_minutes": 15},
+            {"min_hours": 6, "break_minutes": 45},
+            {"min_hours": 8, "break_minutes": 60},
+        ],
+        "night_start": 22, #深夜時間帯の開始時刻（時）
+        "night_end": 1, #深夜時間帯の終了時刻（時）
+        "night_rate": 1.25, #深夜割増率（1.25倍など）
+        "early_start": 5, #早朝手当の開始時刻（時）
+        "early_end": 7, #早朝手当の終了時刻（時）
+        "early_bonus_per_hour": 160, #早朝手当（円/時間）
+        "busy_bonus_per_hour": 200,  #繁忙期手当（円/時間）
+    },
+    "駿台": { #バイト先「駿台」の設定
+        "default_wage": 1350,
+        "default_transport": 0,
+        "wage_history": [
+            {"from": "2024-04-24", "wage": 1200},
+            {"from": "2025-04-01", "wage": 1350},
+        ],
+        "pre_minutes": 0,
+        "post_minutes": 0,
+        "break_rules": [
+            {"min_hours": 6, "break_minutes": 45},
+        ],
+        "night_start": 23,
+        "night_end": 1,
+        "night_rate": 1, #深夜割増なし
+        "early_start": 5,
+        "early_end": 6,
+        "early_bonus_per_hour": 0, #早朝手当なし
+        "busy_bonus_per_hour": 0, #繁忙期手当なし
+    },
+    "C": { #バイト先「C」の設定
+        "default_wage": 1100,
+        "default_transport": 0, 
+        "wage_history": [
+            {"from": "2024-01-01", "wage": 1100},
+        ],
+        "pre_minutes": 0,
+        "post_minutes": 0,
+        "break_rules": [
+            {"min_hours": 5, "break_minutes": 30},
+            {"min_hours": 8, "break_minutes": 60},
+        ],
+        "night_start": 22,
+        "night_end": 5,
+        "night_rate": 1.25,
+        "early_start": 5,
+        "early_end": 8,
+        "early_bonus_per_hour": 0,
+        "busy_bonus_per_hour": 0,
+    },
+    "D": { #バイト先「D」の設定
+        "default_wage": 1100,
+        "default_transport": 0, 
+        "wage_history": [
+            {"from": "2024-01-01", "wage": 1100},
+        ],
+        "pre_minutes": 0,
+        "post_minutes": 0,
+        "break_rules": [], #特に休憩ルールなし
+        "night_start": 22,
+        "night_end": 5,
+        "night_rate": 1.25,
+        "early_start": 5,
+        "early_end": 8,
+        "early_bonus_per_hour": 0,
+        "busy_bonus_per_hour": 0,
+    },
+}
+
+
+#よく使う勤務パターン
+DEFAULT_SHIFT_PATTERNS: Dict[str, Dict[str, Any]] = { #フォームで選べる「勤務パターン」プリセット（設定ファイルの内容はこれに重ねる）
+    "すたば:15-CL": {
+        "workplace": "すたば",
+        "start": time(15, 0), #15:00開始
+        "end": time(22, 30), #22:30終了
+        "wage": 1310,
+        "manual_break_min": 45,
+    },
+    "すたば:18-CL": {
+        "workplace": "すたば",
+        "start": time(18, 0),
+        "end": time(22, 30),
+        "wage": 1310,
+        "manual_break_min": 15,
+    },
+    "駿台:CL業務": {
+        "workplace": "駿台",
+        "start": time(18, 0),
+        "end": time(22, 00),
+        "wage": 1350,
+        "manual_break_min": 0,
+    },
+}
+
+
+def serialize_shift_patterns_for_settings(
+    patterns: Dict[str, Dict[str, Any]]
+) -> Dict[str, Any]:
+    """SHIFT_PATTERNS を settings.json に保存できる形に変換"""
+    result: Dict[str, Any] = {}
+    for name, p in patterns.items():
+        start_val = p.get("start")
+        end_val = p.get("end")
+        result[name] = {
+            "workplace": p.get("workplace", ""),
+            "start": start_val.strftime("%H:%M") if isinstance(start_val, time) else start_val,
+            "end": end_val.strftime("%H:%M") if isinstance(end_val, time) else end_val,
+            "wage": p.get("wage"),
+            "manual_break_min": int(p.get("manual_break_min", 0)),
+            "transport": int(p.get("transport") or 0), #DB（shift_patterns）と同じく交通費も持つ
+        }
+    return result
+
+
+def load_shift_patterns_from_settings(
+    data: Dict[str, Any]
+) -> Dict[str, Dict[str, Any]]:
+    """settings.json に保存したパターン情報を SHIFT_PATTERNS 形式に戻す"""
+    loaded: Dict[str, Dict[str, Any]] = {}
+    for name, p in data.items():
+        start_str = p.get("start")
+        end_str = p.get("end")
+        start_obj = (
+            datetime.strptime(start_str, "%H:%M").time()
+            if isinstance(start_str, str) and start_str
+            else time(0, 0)
+        )
+        end_obj = (
+            datetime.strptime(end_str, "%H:%M").time()
+            if isinstance(end_str, str) and end_str
+            else time(0, 0)
+        )
+        loaded[name] = {
+            "workplace": p.get("workplace", ""),
+            "start": start_obj,
+            "end": end_obj,
+            "wage": p.get("wage"),
+            "manual_break_min": int(p.get("manual_break_min", 0)),
+            "transport": int(p.get("transport") or 0), #DB（shift_patterns）と同じく交通費も持つ
+        }
+    return loaded
+
+
+def freeze(value: Any) -> Any:
+    """辞書・リストを読み取り専用（MappingProxyType・タプル）に変換（ほかのセッションと共有しても書き換えられない）"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """freeze の逆（JSONに保存するときなど、ふつうの辞書・リストに戻す）"""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+@dataclass(frozen=True)
+class AppConfig:
+    """設定ファイル1つ分の読み取り専用の設定（同じ版なら全セッションで同じオブジェクトを使う）"""
+    version: str #内容（設定ファイル＋SQLiteの勤務先表）のハッシュ。中身が同じなら同じ値
+    settings: Mapping[str, Any] #settings.json の中身（ファイルがなければ空）
+    workplaces: Mapping[str, Mapping[str, Any]] #既定の勤務先設定に設定ファイル（SQLiteならDB）を重ねたもの
+    patterns: Mapping[str, Mapping[str, Any]] #既定の勤務パターンに設定ファイル（SQLiteならDB）を重ねたもの
+
+
+def _file_state(path: Optional[str]) -> Tuple[int, int]:
+    """ファイルの (更新時刻ns, サイズ)。書き換えのたびに変わる（ないファイルは (0, -1)）"""
+    if not path:
+        return (0, -1)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return (0, -1)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def read_settings_file(settings_file: str) -> Dict[str, Any]:
+    """settings.json の中身（ファイルがない・壊れているときは空。キャッシュせず毎回読む）"""
+    try:
+        with open(settings_file, "r") as f:
+            settings = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return settings if isinstance(settings, dict) else {}
+
+
+def build_config(
+    settings: Dict[str, Any],
+    db_workplaces: Optional[Tuple[Dict[str, Any], Dict[str, Any]]] = None,
+) -> AppConfig:
+    """設定（settings.json の中身）と、SQLiteなら DB の (勤務先設定, 勤務パターン) から設定オブジェクトを作る"""
+    workplaces = copy.deepcopy(DEFAULT_WORKPLACE_SETTINGS)
+    ws = settings.get("workplace_settings") #JSON中の勤務先設定を取得
+    if isinstance(ws, dict): #すでにある勤務先は上書きマージ、新しい勤務先はそのまま追加
+        for name, cfg in ws.items():
+            workplaces.setdefault(name, {}).update(copy.deepcopy(cfg))
+    sp = settings.get("shift_patterns") #JSON中の勤務パターン設定を取得
+    if db_workplaces is not None: #SQLiteなら勤務先・時給履歴・パターンはDBの内容を優先
+        ws_db, sp_db = db_workplaces
+        for name, cfg in ws_db.items():
+            workplaces.setdefault(name, {}).update(cfg)
+        if sp_db:
+            sp = sp_db
+    patterns = copy.deepcopy(DEFAULT_SHIFT_PATTERNS)
+    if isinstance(sp, dict):
+        patterns.update(load_shift_patterns_from_settings(sp)) #形式を変換して既定のパターンにマージ
+
+    text = json.dumps(
+        [settings, db_workplaces], sort_keys=True, ensure_ascii=False, default=str
+    )
+    return AppConfig(
+        version=hashlib.sha256(text.encode("utf-8")).hexdigest()[:16],
+        settings=freeze(settings),
+        workplaces=freeze(workplaces),
+        patterns=freeze(patterns),
+    )
+
+
+_CONFIG_CACHE: Dict[str, Tuple[Tuple[Any, ...], AppConfig]] = {} #設定ファイルのパス → (ファイルの状態, 設定)
+_CONFIG_LOCK = threading.Lock() #セッション（スレッド）をまたいで共有するので、読み書きは排他する
+
+
+def load_config(
+    settings_file: str,
+    db_conn: Optional[sqlite3.Connection] = None,
+    db_file: Optional[str] = None,
+) -> AppConfig:
+    """
+    設定オブジェクトを返す。設定ファイル（SQLiteならDBファイルも）が前回から変わっていなければ、
+    読み直さずに前回と同じオブジェクトを返す（全セッション共通・読み取り専用）。
+    """
+    path = os.path.abspath(settings_file)
+    state = (_file_state(settings_file), _file_state(db_file if db_conn is not None else None))
+    with _CONFIG_LOCK:
+        cached = _CONFIG_CACHE.get(path)
+    if cached is not None and cached[0] == state:
+        return cached[1]
+
+    db_workplaces = None
+    if db_conn is not None:
+        from shift_store import sqlite_load_workplaces
+
+        db_workplaces = sqlite_load_workplaces(db_conn)
+    config = build_config(read_settings_file(settings_file), db_workplaces)
+    with _CONFIG_LOCK:
+        if cached is not None and cached[1].version == config.version:
+            config = cached[1] #中身が同じなら前のオブジェクトを使い続ける（版も変わらない）
+        if len(_CONFIG_CACHE) >= CONFIG_CACHE_ENTRIES:
+            _CONFIG_CACHE.clear()
+        _CONFIG_CACHE[path] = (state, config)
+    return config
+
+
+### セッションごとの上書き（設定ページで編集中の値。共有の設定オブジェクトは書き換えない）
+Overrides = Dict[str, Optional[Dict[str, Any]]] #名前 → 変えた項目（None ならそのセッションでは削除）
+
+
+def set_override(
+    overrides: Overrides,
+    base: Mapping[str, Mapping[str, Any]],
+    name: str,
+    values: Optional[Mapping[str, Any]],
+) -> None:
+    """
+    名前 name の項目を values にする上書きを overrides に記録する（values が None なら削除）。
+    共有の設定 base と同じ値の項目は記録しないので、編集していなければ overrides は空のまま。
+    """
+    if values is None:
+        if name in base:
+            overrides[name] = None
+        else:
+            overrides.pop(name, None)
+        return
+    current = base.get(name)
+    previous = overrides.get(name) or {}
+    if current is None: #このセッションで追加した項目
+        overrides[name] = {**previous, **values}
+        return
+    changes = {key: value for key, value in previous.items() if key not in values}
+    changes.update({key: value for key, value in values.items() if current.get(key) != freeze(value)})
+    if changes:
+        overrides[name] = changes
+    else:
+        overrides.pop(name, None)
+
+
+def apply_overrides(
+    base: Mapping[str, Mapping[str, Any]], overrides: Overrides
+) -> Mapping[str, Mapping[str, Any]]:
+    """共有の設定にセッションの上書きを重ねた読み取り専用の表（上書きがなければ base をそのまま返す）"""
+    if not overrides:
+        return base
+    merged = dict(base) #上書きのない項目は共有のオブジェクトをそのまま使う
+    for name, changes in overrides.items():
+        if changes is None:
+            merged.pop(name, None)
+        else:
+            merged[name] = freeze({**base.get(name, {}), **changes})
+    return MappingProxyType(merged)
@@ -0,0 +1,568 @@
+## 給与計算エンジン（列指向・一括計算）
+# 時間はすべて整数の分、給与は整数の円で計算する（小数の時間数は表示用に分から作るだけ）。
+# 給与の各項目は「分 × 円/時 ÷ 60」を1回だけ四捨五入し、合計支給額は丸めた項目の和にする（給与明細と同じ）。
+import bisect #二分探索用
+from dataclasses import dataclass #時給テーブルの型定義用
+from datetime import date, datetime, time #日付の変換用
+import numpy as np #配列計算用
+import pandas as pd #DataFrame処理用
+from typing import Dict, Any, List, Optional, Tuple #型ヒント用
+
+from shift_rollup import duration_minutes, duration_minutes_column, minutes_to_hours #時間（分）の取り出し・表示用の時間数
+
+# 勤務先設定のうち給与計算に使う列と、その既定値（calc_pay_for_shift と同じ既定値）
+PAY_SETTING_DEFAULTS: Dict[str, float] = {
+    "night_rate": 1.0, #深夜割増率
+    "early_bonus_per_hour": 0.0, #早朝手当（円/h）
+    "busy_bonus_per_hour": 0.0, #繁忙期手当（円/h）
+}
+
+# 深夜・早朝の時間帯設定（時）と、その既定値（calc_night_early_minutes と同じ既定値）
+WINDOW_SETTING_DEFAULTS: Dict[str, float] = {
+    "night_start": 22, #深夜開始時刻
+    "night_end": 5, #深夜終了時刻
+    "early_start": 5, #早朝開始時刻
+    "early_end": 8, #早朝終了時刻
+}
+
+PAY_OUTPUT_COLUMNS = ["base_pay", "night_bonus", "early_bonus", "busy_bonus", "pay"] #計算結果の列
+
+MINUTES_PER_DAY = 24 * 60 #1日の分数
+RATE_SCALE = 1000 #割増率・手当（円/h）は1000倍した整数で計算する（1.25倍 → 1250, 160円/h → 160000）
+
+
+def round_half_up_div(numerator: Any, denominator: int) -> Any:
+    """numerator / denominator を整数のまま四捨五入する（0以上の整数・整数配列）"""
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+def rate_units(value: Any) -> Any:
+    """割増率・手当（小数可）を RATE_SCALE 倍の整数にする（スカラー・配列どちらでも可）"""
+    if np.ndim(value) == 0:
+        return int(round(float(value) * RATE_SCALE))
+    return np.rint(np.asarray(value, dtype=np.float64) * RATE_SCALE).astype(np.int64)
+
+
+def workplace_settings_frame(workplace_settings: Dict[str, Dict[str, Any]]) -> pd.DataFrame:
+    """勤務先設定を「1勤務先 = 1行」のDataFrameに変換（シフト側に列として結合するため）"""
+    rows = []
+    for name, cfg in workplace_settings.items():
+        row: Dict[str, Any] = {"workplace": str(name)}
+        for col, default in {**PAY_SETTING_DEFAULTS, **WINDOW_SETTING_DEFAULTS}.items():
+            row[col] = float(cfg.get(col, default)) #設定がなければ既定値
+        rows.append(row)
+    columns = ["workplace"] + list(PAY_SETTING_DEFAULTS) + list(WINDOW_SETTING_DEFAULTS)
+    return pd.DataFrame(rows, columns=columns).set_index("workplace")
+
+
+### 時給履歴の索引（二分探索）
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal() #datetime64[D] の0日目に当たる序数
+
+
+@dataclass(frozen=True)
+class WageTable:
+    """1勤務先分の時給履歴を「適用開始日の序数」で昇順に並べた表"""
+    from_ordinals: np.ndarray #適用開始日（date.toordinal()）
+    wages: np.ndarray #その日から適用される時給
+    default_wage: int #履歴より前の日付に使う時給
+
+    def wage_for_date(self, shift_date: date) -> int:
+        """指定日に適用される時給（二分探索で O(log n)）"""
+        i = bisect.bisect_right(self.from_ordinals, shift_date.toordinal()) - 1
+        return int(self.wages[i]) if i >= 0 else self.default_wage
+
+    def wages_for_ordinals(self, ordinals: np.ndarray) -> np.ndarray:
+        """日付の序数の配列から、それぞれの時給を一括で求める"""
+        idx = np.searchsorted(self.from_ordinals, ordinals, side="right") - 1
+        if len(self.wages) == 0:
+            return np.full(len(idx), self.default_wage, dtype=np.int64)
+        return np.where(idx >= 0, self.wages[np.maximum(idx, 0)], self.default_wage)
+
+
+def compile_wage_table(settings_wp: Dict[str, Any]) -> WageTable:
+    """勤務先設定の wage_history を WageTable に変換（並べ替えと日付の解析はここで1回だけ）"""
+    history = settings_wp.get("wage_history") or []
+    entries = sorted(history, key=lambda h: h["from"]) #from日付でソート（同日なら後の要素が優先）
+    ordinals = [datetime.strptime(h["from"], "%Y-%m-%d").date().toordinal() for h in entries]
+    wages = [int(h["wage"]) for h in entries]
+    return WageTable(
+        from_ordinals=np.asarray(ordinals, dtype=np.int64),
+        wages=np.asarray(wages, dtype=np.int64),
+        default_wage=int(settings_wp.get("default_wage", 1100)),
+    )
+
+
+def _wage_table_key(settings_wp: Dict[str, Any]) -> Tuple[Any, ...]:
+    """時給テーブルの作り直しが必要かどうかを判定するためのキー"""
+    history = settings_wp.get("wage_history") or []
+    return (
+        tuple((h.get("from"), h.get("wage")) for h in history),
+        settings_wp.get("default_wage", 1100),
+    )
+
+
+WAGE_TABLE_CACHE_ENTRIES = 1024 #覚えておく時給テーブルの数（超えたら一度捨てる）
+_WAGE_TABLE_CACHE: Dict[Tuple[str, Tuple[Any, ...]], WageTable] = {} #(勤務先名, キー) → 時給テーブル
+
+
+def get_wage_table(workplace: str, settings_wp: Dict[str, Any]) -> WageTable:
+    """
+    勤務先の時給テーブルを返す（同じ設定なら作り直さない）。
+    同じ勤務先名でも利用者ごとに時給履歴が違うので、設定の中身もキーに含める。
+    """
+    key = (workplace, _wage_table_key(settings_wp))
+    table = _WAGE_TABLE_CACHE.get(key)
+    if table is None:
+        table = compile_wage_table(settings_wp)
+        if len(_WAGE_TABLE_CACHE) >= WAGE_TABLE_CACHE_ENTRIES:
+            _WAGE_TABLE_CACHE.clear()
+        _WAGE_TABLE_CACHE[key] = table
+    return table
+
+
+def dates_to_ordinals(dates: Any) -> np.ndarray:
+    """日付の列（date / datetime / 文字列）を date.toordinal() と同じ序数の配列に変換"""
+    days = pd.to_datetime(pd.Series(dates)).to_numpy().astype("datetime64[D]")
+    return days.astype(np.int64) + EPOCH_ORDINAL
+
+
+### 毎日くり返す時間帯（深夜・早朝）との重なり計算
+# 時刻はすべて「基準日0時からの経過分」で扱う。
+# 窓の累積関数 F(t) = [0, t) に含まれる窓の分数 を閉じた式で求め、
+# 重なり = F(終了) - F(開始) とすることで、日数によらず O(1) で計算できる。
+
+def _window_cumulative_minutes(t, win_start_min, win_end_min, crossing):
+    """基準日0時から t 分までに含まれる窓の分数（スカラー・配列どちらでも可）"""
+    days = np.floor_divide(t, MINUTES_PER_DAY) #経過した日数
+    r = t - days * MINUTES_PER_DAY #当日の0時からの分
+    if np.ndim(crossing) == 0 and not crossing: #日付をまたがない窓 [start, end)
+        per_day = np.maximum(win_end_min - win_start_min, 0)
+        return days * per_day + np.clip(r - win_start_min, 0, per_day)
+    #日付をまたぐ窓 [0, end) ∪ [start, 24:00)
+    cross_per_day = win_end_min + MINUTES_PER_DAY - win_start_min
+    cross_today = np.minimum(r, win_end_min) + np.maximum(r - win_start_min, 0)
+    if np.ndim(crossing) == 0:
+        return days * cross_per_day + cross_today
+    #行ごとに窓の種類が違う場合（配列版）
+    per_day = np.maximum(win_end_min - win_start_min, 0)
+    plain_today = np.clip(r - win_start_min, 0, per_day)
+    return np.where(
+        crossing, days * cross_per_day + cross_today, days * per_day + plain_today
+    )
+
+
+def window_overlap_minutes(
+    start_min: float,
+    end_min: float,
+    win_start_min: float,
+    win_end_min: float,
+    crossing: Optional[bool] = None,
+) -> float:
+    """
+    勤務 [start_min, end_min) と毎日くり返す窓 [win_start_min, win_end_min) の重なり（分）。
+    start_min は勤務開始日の0時からの分、end_min は同じ基準で翌日以降なら1440以上になる。
+    crossing を省略すると「開始 > 終了」のとき日付をまたぐ窓として扱う。
+    """
+    if crossing is None:
+        crossing = win_start_min > win_end_min
+    if end_min <= start_min: #終了が開始以前なら重なりなし
+        return 0.0
+    overlap = _window_cumulative_minutes(
+        end_min, win_start_min, win_end_min, crossing
+    ) - _window_cumulative_minutes(start_min, win_start_min, win_end_min, crossing)
+    return float(overlap)
+
+
+def window_overlap_minutes_array(
+    start_min: np.ndarray,
+    end_min: np.ndarray,
+    win_start_min: np.ndarray,
+    win_end_min: np.ndarray,
+    crossing: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """window_overlap_minutes の配列版（勤務ごとに窓が違ってもよい）"""
+    start_min = np.asarray(start_min, dtype=np.float64)
+    end_min = np.asarray(end_min, dtype=np.float64)
+    win_start_min = np.asarray(win_start_min, dtype=np.float64)
+    win_end_min = np.asarray(win_end_min, dtype=np.float64)
+    if crossing is None:
+        crossing = win_start_min > win_end_min
+    crossing = np.asarray(crossing, dtype=bool)
+    overlap = _window_cumulative_minutes(
+        end_min, win_start_min, win_end_min, crossing
+    ) - _window_cumulative_minutes(start_min, win_start_min, win_end_min, crossing)
+    return np.where(end_min > start_min, overlap, 0.0) #終了が開始以前なら0
+
+
+def hhmm_to_minutes(values: pd.Series) -> np.ndarray:
+    """"HH:MM" 形式の列を0時からの分の配列に変換（読めない値はNaN）"""
+    codes, uniques = pd.factorize(values.astype(str)) #時刻の種類は高々1440通りなので、種類ごとに1回だけ解析
+    parsed = np.full(len(uniques), np.nan)
+    for i, text in enumerate(uniques):
+        hh, sep, mm = text.partition(":")
+        if sep and hh.strip().isdigit() and mm.strip().isdigit():
+            parsed[i] = int(hh) * 60 + int(mm)
+    result = parsed[codes] if len(uniques) else np.full(len(values), np.nan)
+    result[codes < 0] = np.nan #欠損値
+    return result
+
+
+def shift_minutes(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    給与計算上の開始・終了を、シフトの日付の0時からの分で返す（付け時間込み。読めない時刻はNaN）。
+    終了時刻が開始時刻より前のシフトは翌日に終わるものとして、終了に1日分（1440分）を足す。
+    """
+    start_clock = hhmm_to_minutes(df["start"])
+    end_clock = hhmm_to_minutes(df["end"])
+    next_day = np.where(end_clock < start_clock, MINUTES_PER_DAY, 0) #NaN との比較は False
+    start_min = start_clock - _float_column(df, "pre_min")
+    end_min = end_clock + next_day + _float_column(df, "post_min")
+    return start_min, end_min
+
+
+def crosses_midnight_array(df: pd.DataFrame) -> np.ndarray:
+    """シフトごとに、終了時刻が開始時刻より前（翌日に終わる）かどうか"""
+    return hhmm_to_minutes(df["end"]) < hhmm_to_minutes(df["start"])
+
+
+def calc_night_early_batch(
+    df: pd.DataFrame, workplace_settings: Dict[str, Dict[str, Any]]
+) -> pd.DataFrame:
+    """
+    シフトのDataFrame全体から深夜時間・早朝時間（分）を一括で計算し直す。
+
+    必要な列: workplace, start, end（"HH:MM"。終了が開始より前なら翌日）, pre_min, post_min
+    更新される列: night_min, early_min（と表示用の night_hours, early_hours）
+    時刻が読めない行は元の値のまま残す。
+    """
+    out = df.copy()
+    n = len(out)
+    if n == 0:
+        return out
+
+    wp = out["workplace"].astype(str) if "workplace" in out.columns else pd.Series([""] * n)
+    joined = workplace_settings_frame(workplace_settings).reindex(wp.to_numpy())
+    for col, default in WINDOW_SETTING_DEFAULTS.items():
+        joined[col] = joined[col].fillna(default)
+    known = wp.isin(list(workplace_settings.keys())).to_numpy() #設定のない勤務先は0時間
+
+    start_min, end_min = shift_minutes(out) #給与計算上の開始・終了（日付またぎは翌日の分まで）
+    valid = ~(np.isnan(start_min) | np.isnan(end_min))
+
+    night_start = joined["night_start"].to_numpy() * 60
+    night_end = joined["night_end"].to_numpy() * 60
+    early_start = joined["early_start"].to_numpy() * 60
+    early_end = joined["early_end"].to_numpy() * 60
+
+    night = window_overlap_minutes_array(
+        start_min, end_min, night_start, night_end, crossing=night_start > night_end
+    )
+    early = window_overlap_minutes_array(
+        start_min, end_min, early_start, early_end, crossing=~(early_start < early_end)
+    )
+    night = np.where(known & valid, night, 0.0)
+    early = np.where(known & valid, early, 0.0)
+
+    prev_night = duration_minutes_column(out, "night_min").to_numpy()
+    prev_early = duration_minutes_column(out, "early_min").to_numpy()
+    out["night_min"] = np.where(valid, np.rint(night).astype(np.int64), prev_night)
+    out["early_min"] = np.where(valid, np.rint(early).astype(np.int64), prev_early)
+    out["night_hours"] = minutes_to_hours(out["night_min"])
+    out["early_hours"] = minutes_to_hours(out["early_min"])
+    return out
+
+
+def apply_night_early_to_records(
+    records: List[Dict[str, Any]], workplace_settings: Dict[str, Dict[str, Any]]
+) -> None:
+    """シフトdictのリストに対して深夜・早朝時間を一括で計算し直し、各dictを直接更新する"""
+    if not records:
+        return
+    computed = calc_night_early_batch(pd.DataFrame(records), workplace_settings)
+    columns = ["night_min", "early_min", "night_hours", "early_hours"]
+    values = {col: computed[col].tolist() for col in columns} #Pythonのint / floatに戻す
+    for i, rec in enumerate(records):
+        for col in columns:
+            rec[col] = values[col][i]
+
+
+def calc_pay_arrays(
+    work_min: np.ndarray,
+    night_min: np.ndarray,
+    early_min: np.ndarray,
+    wage: np.ndarray,
+    is_busy: np.ndarray,
+    night_rate: np.ndarray,
+    early_bonus_per_hour: np.ndarray,
+    busy_bonus_per_hour: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    NumPy配列（時間は整数の分、時給は整数の円）で給与を一括計算する。途中で小数を使わない。
+    丸めは calc_pay_for_shift と同じ（項目ごとに1回の四捨五入）なので、1件ずつ計算した結果と一致する。
+    """
+    work_min = np.asarray(work_min, dtype=np.int64)
+    wage = np.asarray(wage, dtype=np.int64)
+    night_premium = np.maximum(rate_units(night_rate) - RATE_SCALE, 0) #深夜割増率 − 1（RATE_SCALE 倍）
+    per_hour = 60 * RATE_SCALE #円/h（RATE_SCALE 倍）× 分 → 円 の割る数
+
+    base_pay = round_half_up_div(work_min * wage, 60) #基本給 = 実働時間 × 時給
+    night_bonus = round_half_up_div(
+        np.asarray(night_min, dtype=np.int64) * wage * night_premium, per_hour
+    ) #深夜割増分
+    early_bonus = round_half_up_div(
+        np.asarray(early_min, dtype=np.int64) * rate_units(early_bonus_per_hour), per_hour
+    ) #早朝手当
+    busy_bonus = np.where(
+        is_busy, round_half_up_div(work_min * rate_units(busy_bonus_per_hour), per_hour), 0
+    ) #繁忙期手当（繁忙期のみ）
+
+    return {
+        "base_pay": base_pay,
+        "night_bonus": night_bonus,
+        "early_bonus": early_bonus,
+        "busy_bonus": busy_bonus,
+        "pay": base_pay + night_bonus + early_bonus + busy_bonus, #合計支給額（丸めた項目の和）
+    }
+
+
+def _float_column(df: pd.DataFrame, col: str) -> np.ndarray:
+    """列をfloat配列で取り出す（列がない・欠損は0）"""
+    if col not in df.columns:
+        return np.zeros(len(df), dtype=np.float64)
+    return pd.to_numeric(df[col], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+
+
+def calc_pay_batch(
+    df: pd.DataFrame, workplace_settings: Dict[str, Dict[str, Any]]
+) -> pd.DataFrame:
+    """
+    シフトのDataFrame全体から給与関連の列を1回のベクトル演算で計算する。
+
+    必要な列: workplace, work_min, night_min, early_min（なければ *_hours から分に直す）, wage, is_busy
+    追加・更新される列: base_pay, night_bonus, early_bonus, busy_bonus, pay
+
+    勤務先設定は行ごとに引かず、workplace 列をキーに列として結合する。
+    元のDataFrameは変更せず、列を追加したコピーを返す。
+    """
+    out = df.copy()
+    n = len(out)
+    if n == 0: #空なら列だけ用意して返す
+        for col in PAY_OUTPUT_COLUMNS:
+            out[col] = pd.Series(dtype=np.int64)
+        return out
+
+    wp = (
+        out["workplace"].astype(str)
+        if "workplace" in out.columns
+        else pd.Series([""] * n, index=out.index)
+    ) #勤務先名
+    settings_df = workplace_settings_frame(workplace_settings)
+    joined = settings_df.reindex(wp.to_numpy()) #勤務先設定を行に結合（未登録の勤務先はNaN）
+
+    wage = np.trunc(_float_column(out, "wage")).astype(np.int64) #時給（int() と同じく切り捨て）
+    if "is_busy" in out.columns:
+        is_busy = out["is_busy"].fillna(False).astype(bool).to_numpy() #繁忙期フラグ
+    else:
+        is_busy = np.zeros(n, dtype=bool)
+
+    result = calc_pay_arrays(
+        work_min=duration_minutes_column(out, "work_min").to_numpy(),
+        night_min=duration_minutes_column(out, "night_min").to_numpy(),
+        early_min=duration_minutes_column(out, "early_min").to_numpy(),
+        wage=wage,
+        is_busy=is_busy,
+        night_rate=joined["night_rate"].fillna(PAY_SETTING_DEFAULTS["night_rate"]).to_numpy(),
+        early_bonus_per_hour=joined["early_bonus_per_hour"]
+        .fillna(PAY_SETTING_DEFAULTS["early_bonus_per_hour"])
+        .to_numpy(),
+        busy_bonus_per_hour=joined["busy_bonus_per_hour"]
+        .fillna(PAY_SETTING_DEFAULTS["busy_bonus_per_hour"])
+        .to_numpy(),
+    )
+    for col in PAY_OUTPUT_COLUMNS:
+        out[col] = result[col]
+    return out
+
+
+def apply_pay_to_records(
+    records: List[Dict[str, Any]], workplace_settings: Dict[str, Dict[str, Any]]
+) -> None:
+    """シフトdictのリストに対して給与を一括計算し、各dictを直接更新する"""
+    if not records:
+        return
+    computed = calc_pay_batch(pd.DataFrame(records), workplace_settings)
+    values = {col: computed[col].tolist() for col in PAY_OUTPUT_COLUMNS} #Pythonのintに戻す
+    for i, rec in enumerate(records):
+        for col in PAY_OUTPUT_COLUMNS:
+            rec[col] = values[col][i]
+
+
+### 1件ずつの計算（入力フォーム用）。勤務先設定は引数で受け取る
+def get_auto_break_minutes(
+    total_hours: float, workplace: str, workplace_settings: Dict[str, Dict[str, Any]]
+) -> int:
+    """勤務時間と勤務先に応じて、自動で休憩時間（分）を計算"""
+    settings = workplace_settings.get(workplace) #勤務先設定を取得
+    if not settings: #なければ休憩0
+        return 0
+    rules = settings.get("break_rules", []) #休憩ルールリスト
+    break_min = 0 #デフォルトは0分
+    for rule in sorted(rules, key=lambda r: r["min_hours"]): #必要時間が小さい順にソート
+        if total_hours >= rule["min_hours"]: #条件を満たすごとに休憩時間を更新
+            break_min = rule["break_minutes"]
+    return break_min #最も大きな条件を満たした休憩時間を返す
+
+
+def calc_night_early_minutes(
+    start_dt: datetime,
+    end_dt: datetime,
+    workplace: str,
+    workplace_settings: Dict[str, Dict[str, Any]],
+) -> Tuple[int, int]:
+    """指定の勤務先設定に基づいて、深夜時間・早朝時間（分）を返す"""
+    settings = workplace_settings.get(workplace) #勤務先設定取得
+    if not settings:
+        return 0, 0
+
+    night_start = settings.get("night_start", WINDOW_SETTING_DEFAULTS["night_start"]) #深夜開始時刻
+    night_end = settings.get("night_end", WINDOW_SETTING_DEFAULTS["night_end"]) #深夜終了時刻
+    early_start = settings.get("early_start", WINDOW_SETTING_DEFAULTS["early_start"]) #早朝開始時刻
+    early_end = settings.get("early_end", WINDOW_SETTING_DEFAULTS["early_end"]) #早朝終了時刻
+
+   #開始日の0時からの経過分に直して、閉じた式で重なりを計算（日数によらずO(1)）
+    start_min = (start_dt - datetime.combine(start_dt.date(), time(0, 0))).total_seconds() / 60
+    end_min = start_min + (end_dt - start_dt).total_seconds() / 60
+
+   #深夜時間の計算（例: 22〜5時のように開始 > 終了なら日付をまたぐ窓）
+    night_minutes = window_overlap_minutes(
+        start_min, end_min, night_start * 60, night_end * 60,
+        crossing=night_start > night_end,
+    )
+
+   #早朝時間の計算（例: 5〜8時のように開始 < 終了なら日付をまたがない窓）
+    early_minutes = window_overlap_minutes(
+        start_min, end_min, early_start * 60, early_end * 60,
+        crossing=not early_start < early_end,
+    )
+
+    return int(round(night_minutes)), int(round(early_minutes)) #(深夜時間, 早朝時間) を分で返す
+
+
+def calc_pay_for_shift(
+    shift: Dict[str, Any], workplace_settings: Dict[str, Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    1件分のシフト情報から、給与関連の項目を計算して埋める。
+
+    必要な入力:
+        shift["workplace"] : str
+        shift["work_min"]  : int（なければ work_hours から分に直す）
+        shift["night_min"] : int（同じく night_hours から）
+        shift["early_min"] : int（同じく early_hours から）
+        shift["wage"]      : int
+        shift["is_busy"]   : bool
+
+    追加・更新される出力:
+        shift["base_pay"]   : int
+        shift["night_bonus"]: int
+        shift["early_bonus"]: int
+        shift["busy_bonus"] : int
+        shift["pay"]        : int
+    """
+    workplace = str(shift.get("workplace", "")) #勤務先名を取得
+    settings_wp = workplace_settings.get(workplace, {}) #勤務先設定を取得（なければ空dict）
+
+    work_min = duration_minutes(shift, "work_min") #実働時間（休憩控除後、分）を取得
+    night_min = duration_minutes(shift, "night_min") #深夜労働時間（分）
+    early_min = duration_minutes(shift, "early_min") #早朝労働時間（分）
+    wage = int(shift.get("wage", 0)) #時給
+    is_busy = bool(shift.get("is_busy", False)) #繁忙期フラグ
+
+    night_rate = settings_wp.get("night_rate", PAY_SETTING_DEFAULTS["night_rate"]) #深夜割増率
+    early_bonus_per_hour = settings_wp.get(
+        "early_bonus_per_hour", PAY_SETTING_DEFAULTS["early_bonus_per_hour"]
+    ) #早朝手当（円/h）
+    busy_bonus_per_hour = settings_wp.get(
+        "busy_bonus_per_hour", PAY_SETTING_DEFAULTS["busy_bonus_per_hour"]
+    ) #繁忙期手当（円/h）
+
+    per_hour = 60 * RATE_SCALE #円/h（RATE_SCALE 倍）× 分 → 円 の割る数
+    night_premium = max(rate_units(night_rate) - RATE_SCALE, 0) #深夜割増率 − 1（RATE_SCALE 倍）
+    base_pay = round_half_up_div(work_min * wage, 60) #基本給 = 実働時間 × 時給
+    night_bonus = round_half_up_div(night_min * wage * night_premium, per_hour) #深夜割増分
+    early_bonus = round_half_up_div(early_min * rate_units(early_bonus_per_hour), per_hour) #早朝手当
+    busy_bonus = (
+        round_half_up_div(work_min * rate_units(busy_bonus_per_hour), per_hour) if is_busy else 0
+    ) #繁忙期手当（繁忙期のみ）
+
+    shift["base_pay"] = base_pay #基本給（整数）
+    shift["night_bonus"] = night_bonus #深夜手当
+    shift["early_bonus"] = early_bonus #早朝手当
+    shift["busy_bonus"] = busy_bonus #繁忙期手当
+    shift["pay"] = base_pay + night_bonus + early_bonus + busy_bonus #合計給料（丸めた項目の和）
+
+    return shift #結果を含んだシフトdictを返す
+
+
+### 保存済みシフトの派生列をまとめて計算し直す（設定変更後の全件再計算・バッチ処理用）
+def calc_hours_batch(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    開始・終了時刻と付け時間・休憩から、合計時間と実働時間（分）を一括で計算し直す。
+
+    必要な列: start, end（"HH:MM"。終了が開始より前なら翌日）, pre_min, post_min, break_min
+    更新される列: total_min, work_min（と表示用の total_hours_raw, work_hours）, crosses_midnight
+    時刻が読めない行・開始と終了が同じ時刻の行（付け時間だけの長さになる）・合計時間が0以下の行は元の値のまま残す。
+    """
+    out = df.copy()
+    if len(out) == 0:
+        return out
+    start_min, end_min = shift_minutes(out) #給与計算上の開始・終了（日付またぎは翌日の分まで）
+    total = end_min - start_min #合計時間（付け時間込み、分）
+    same_clock = hhmm_to_minutes(out["start"]) == hhmm_to_minutes(out["end"])
+    valid = ~np.isnan(total) & (total > 0) & ~same_clock
+    total = np.rint(np.where(valid, total, 0)).astype(np.int64)
+    paid = np.maximum(total - np.rint(_float_column(out, "break_min")).astype(np.int64), 0) #実働時間
+
+    out["total_min"] = np.where(valid, total, duration_minutes_column(out, "total_min").to_numpy())
+    out["work_min"] = np.where(valid, paid, duration_minutes_column(out, "work_min").to_numpy())
+    out["total_hours_raw"] = minutes_to_hours(out["total_min"])
+    out["work_hours"] = minutes_to_hours(out["work_min"])
+    out["crosses_midnight"] = crosses_midnight_array(out)
+    return out
+
+
+def reprice_wages_batch(
+    df: pd.DataFrame, workplace_settings: Dict[str, Dict[str, Any]]
+) -> pd.DataFrame:
+    """
+    時給を勤務先の時給履歴（日付で二分探索）から引き直す（時給改定を過去のシフトに反映するとき用）。
+    設定のない勤務先の行はそのまま残す。
+    """
+    out = df.copy()
+    if len(out) == 0 or "workplace" not in out.columns:
+        return out
+    wage = _float_column(out, "wage")
+    workplaces = out["workplace"].astype(str).to_numpy()
+    ordinals = dates_to_ordinals(out["date"])
+    for name, cfg in workplace_settings.items():
+        mask = workplaces == str(name)
+        if mask.any():
+            wage[mask] = get_wage_table(str(name), cfg).wages_for_ordinals(ordinals[mask])
+    out["wage"] = wage.astype(np.int64)
+    return out
+
+
+def recompute_shift_frame(
+    df: pd.DataFrame,
+    workplace_settings: Dict[str, Dict[str, Any]],
+    reprice_wages: bool = False,
+) -> pd.DataFrame:
+    """
+    保存済みシフトの派生列（合計時間・実働時間・深夜/早朝時間の分・給与）をすべて計算し直したコピーを返す。
+    reprice_wages=True なら、時給も時給履歴から引き直す。
+    """
+    out = calc_hours_batch(df)
+    if reprice_wages:
+        out = reprice_wages_batch(out, workplace_settings)
+    out = calc_night_early_batch(out, workplace_settings)
+    return calc_pay_batch(out, workplace_settings)
@@ -0,0 +1,184 @@
+## 扶養の上限に対する年度末の収入の見込み（月別・勤務先別の集計から、全シフトを読み直さずに計算する）
+import calendar #月の日数用
+import math #信頼区間の計算用
+from dataclasses import dataclass #見込みの型定義用
+from datetime import date, timedelta #日付の型
+from typing import Dict, List, Optional, Tuple #型ヒント用
+
+import numpy as np #月ごとの見込みの計算用
+import pandas as pd #月別の表の作成用
+
+from shift_rollup import Rollup #月別・勤務先別の集計
+
+RUN_RATE_MONTHS = 3 #ペース（月平均）に使う直近の月数（今月は含めない）
+BAND_Z = 1.28 #見込みの幅（80%の範囲。正規分布の上下10%点）
+
+
+@dataclass(frozen=True)
+class IncomeForecast:
+    """年度末の収入の見込み（金額は円）"""
+    period_start: date #集計期間の初日
+    period_end: date #集計期間の最終日
+    earned: int #今日までに働いた分
+    planned: int #入力済みの、明日以降のシフトの分
+    projected: int #年度末の見込み（中央）
+    low: int #見込みの下限（80%の範囲）
+    high: int #見込みの上限（80%の範囲）
+    monthly_rate: int #直近の月平均（ペース）
+    cross_date: Optional[date] #見込み（中央）で上限を超える日（超えない・超え済みなら None）
+    cross_date_early: Optional[date] #上振れしたときに上限を超える日
+    cross_date_late: Optional[date] #下振れしたときに上限を超える日
+    already_over: bool #今日までの分だけで上限を超えている
+    months: pd.DataFrame #月ごとの 実績・予定・見込み・見込みの累計
+
+
+def period_end_of(start: date) -> date:
+    """集計開始日から1年間の最終日（開始日の1年後の前日）"""
+    try:
+        next_start = start.replace(year=start.year + 1)
+    except ValueError: #2月29日始まり
+        next_start = date(start.year + 1, 3, 1)
+    return next_start - timedelta(days=1)
+
+
+def _month_key(d: date) -> str:
+    return d.strftime("%Y-%m")
+
+
+def _months_between(first: date, last: date) -> List[date]:
+    """first の月から last の月までの各月の1日"""
+    months = []
+    y, m = first.year, first.month
+    while (y, m) <= (last.year, last.month):
+        months.append(date(y, m, 1))
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return months
+
+
+def monthly_pay(rollup: Rollup) -> Dict[str, int]:
+    """月ごとの支給合計（勤務先をまとめる。集計のセルを1回なめるだけ）"""
+    totals: Dict[str, int] = {}
+    for (year_month, _workplace), cell in rollup.items():
+        totals[year_month] = totals.get(year_month, 0) + int(cell[0])
+    return totals
+
+
+def run_rate(monthly: Dict[str, int], before: date, months: int = RUN_RATE_MONTHS) -> Tuple[float, float]:
+    """
+    before の月より前の直近 months か月の、月あたりの支給の平均と標準偏差。
+    シフトのない月も0円の月として数える（最初にシフトがある月より前は数えない）。
+    """
+    keys = sorted(k for k in monthly if k < _month_key(before))
+    if not keys:
+        return 0.0, 0.0
+    first = date.fromisoformat(keys[0] + "-01")
+    history = _months_between(first, before)[:-1][-months:] #before の月は含めない
+    values = np.array([monthly.get(_month_key(m), 0) for m in history], dtype=np.float64)
+    spread = float(values.std(ddof=1)) if len(values) >= 2 else float(values.mean()) / 2 #1か月分だけなら幅は大きめに
+    return float(values.mean()), spread
+
+
+def _cross_date(
+    starts: List[date], lengths: np.ndarray, amounts: np.ndarray, base: float, limit: int
+) -> Optional[date]:
+    """月ごとの金額を月内で日割りにして積み上げ、base から limit に達する日"""
+    total = base
+    for first_day, days, amount in zip(starts, lengths, amounts):
+        if amount > 0 and total + amount >= limit:
+            day = max(math.ceil((limit - total) / (amount / days)), 1)
+            return first_day + timedelta(days=int(min(day, days)) - 1)
+        total += amount
+    return None
+
+
+def forecast_income(
+    rollup: Rollup,
+    start: date,
+    today: date,
+    limit: int,
+    by_month: Dict[str, int],
+    current_month: Optional[pd.DataFrame] = None,
+) -> IncomeForecast:
+    """
+    集計期間（start から1年間）の年度末の収入を見込む。
+
+    - 過去の月：実績（by_month。集計開始日で切った期間内の月別の支給）
+    - 今月：今日までの実績＋明日以降の入力済みシフト（今月のシフト current_month の date・pay から分ける）
+    - 来月以降：入力済みシフトの合計と、直近のペースの日割りのうち大きいほう
+    ペースで埋めた分だけにばらつき（直近の月の標準偏差）があるとして、80%の範囲を出す。
+    """
+    end = period_end_of(start)
+    rate, spread = run_rate(monthly_pay(rollup), min(max(today, start), end + timedelta(days=1)))
+    months = _months_between(start, end)
+
+    starts, lengths, actual, planned, expected, variance = [], [], [], [], [], []
+    if current_month is None or current_month.empty:
+        current_month = pd.DataFrame({"date": pd.Series([], dtype=object), "pay": pd.Series([], dtype=np.int64)})
+    current_days = pd.to_datetime(current_month["date"]).dt.date
+    current_pay = pd.to_numeric(current_month["pay"], errors="coerce").fillna(0)
+    for month_first in months:
+        month_last = month_first.replace(day=calendar.monthrange(month_first.year, month_first.month)[1])
+        first_day = max(month_first, start)
+        last_day = min(month_last, end)
+        length = (last_day - first_day).days + 1 #期間内の日数
+        total = int(by_month.get(_month_key(month_first), 0))
+        if last_day <= today: #終わった月
+            done, ahead, open_days = total, 0, 0
+        elif first_day > today: #これからの月
+            done, ahead, open_days = 0, total, length
+        else: #今月：今日までと明日以降に分ける
+            past = (current_days <= today).to_numpy()
+            done = int(current_pay[past].sum())
+            ahead = total - done
+            open_days = (last_day - today).days
+        pace = rate * open_days / month_last.day #ペースで見込む額（残りの日数分）
+        starts.append(first_day if open_days == length else today + timedelta(days=1))
+        lengths.append(max(open_days, 1))
+        actual.append(done)
+        planned.append(ahead)
+        expected.append(max(ahead, pace))
+        variance.append(spread ** 2 * open_days / month_last.day if pace > ahead else 0.0)
+
+    actual_arr = np.array(actual, dtype=np.float64)
+    expected_arr = np.array(expected, dtype=np.float64)
+    sigma_months = np.sqrt(np.array(variance, dtype=np.float64))
+    sigma = math.sqrt(float(np.sum(variance)))
+    earned = int(actual_arr.sum())
+    projected = earned + float(expected_arr.sum())
+    floor = earned + sum(planned) #入力済みのシフトの分は下回らない
+    low = max(projected - BAND_Z * sigma, floor)
+    high = projected + BAND_Z * sigma
+
+    already_over = earned >= limit
+    cross = early = late = None
+    if not already_over:
+        scale = BAND_Z * sigma / sigma_months.sum() if sigma_months.sum() > 0 else 0.0 #月ごとの幅の和を全体の幅に合わせる
+        future = np.array(lengths)
+        cross = _cross_date(starts, future, expected_arr, earned, limit)
+        early = _cross_date(starts, future, expected_arr + scale * sigma_months, earned, limit)
+        late = _cross_date(starts, future, np.maximum(expected_arr - scale * sigma_months, planned), earned, limit)
+
+    table = pd.DataFrame(
+        {
+            "year_month": [_month_key(m) for m in months],
+            "actual": actual_arr.astype(np.int64),
+            "planned": np.array(planned, dtype=np.int64),
+            "expected": np.rint(actual_arr + expected_arr).astype(np.int64),
+        }
+    )
+    table["cumulative"] = table["expected"].cumsum()
+    return IncomeForecast(
+        period_start=start,
+        period_end=end,
+        earned=earned,
+        planned=int(sum(planned)),
+        projected=int(round(projected)),
+        low=int(round(low)),
+        high=int(round(high)),
+        monthly_rate=int(round(rate)),
+        cross_date=cross,
+        cross_date_early=early,
+        cross_date_late=late,
+        already_over=already_over,
+        months=table,
+    )
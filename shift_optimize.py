@@ -0,0 +1,213 @@
+## 扶養の上限内でのシフト案（候補のシフトから、上限を超えない組み合わせを選ぶ）
+import itertools #重なりのまとまりの中の組み合わせ用
+import math #金額の単位の計算用
+from dataclasses import dataclass #シフト案の型定義用
+from datetime import date #日付の型
+from typing import Any, List, Mapping, Optional, Sequence, Tuple #型ヒント用
+
+import numpy as np #動的計画法の配列計算用
+import pandas as pd #候補シフトの表
+
+from shift_quality import conflicts_with, shift_intervals #既存シフト・候補どうしの時間帯の重なり
+from shift_recur import RecurrenceRule, build_recurring_shifts, expand_dates #候補日の展開と給与の一括計算
+
+OPTIMIZE_GOALS = ("max_pay", "min_hours") #給料を最大にする / 目標額を最少の勤務時間で
+MAX_CAPACITY = 20000 #動的計画法の金額の刻みの数（上限までの残りをこの数以下の単位に分ける）
+MAX_SHIFTS_PER_DAY = 2 #1日に入れる候補シフトの数の上限（時間帯が重ならないものだけ）
+MAX_GROUP_CANDIDATES = 8 #時間帯が重なってつながる候補のまとまり1つに入れる候補の数の上限（組み合わせは最大 2^8 通り）
+_UNREACHABLE = np.iinfo(np.int64).min // 4 #その金額ちょうどにはできない状態
+
+
+@dataclass(frozen=True)
+class ShiftPlan:
+    """選んだシフトの組み合わせ（金額は円、時間は分）"""
+    shifts: pd.DataFrame #選んだ候補（build_recurring_shifts と同じ列＋pattern）
+    total_pay: int #選んだシフトの給料合計
+    total_work_min: int #選んだシフトの実働時間の合計
+    budget: int #上限までの残り（これを超えない）
+    candidates: int #候補の数
+    skipped: int #重なりのまとまりが大きすぎて使わなかった候補の数（0 でなければ最適から少しずれることがある）
+    exact: bool #金額を丸めずに解いたか（False なら金額を切り上げて解いたので、上限は必ず守るが最適から少しずれることがある）
+
+
+def build_candidates(
+    patterns: Mapping[str, Mapping[str, Any]],
+    start: date,
+    end: date,
+    availability: Mapping[str, Sequence[int]],
+    workplace_settings: Mapping[str, Mapping[str, Any]],
+    existing: pd.DataFrame,
+    is_busy: bool = False,
+    skip_holidays: bool = False,
+) -> pd.DataFrame:
+    """
+    勤務パターンごとに、勤務先の入れる曜日（availability：勤務先 → 曜日。月=0〜日=6）の日付へ展開した候補シフト。
+    給与は入力フォームと同じ計算（深夜・早朝・繁忙期手当込み）で一括計算し、既存シフトと重なる候補は除く。
+    """
+    frames = []
+    for name, pattern in patterns.items():
+        weekdays = tuple(sorted(availability.get(str(pattern.get("workplace", "")), ())))
+        if not weekdays:
+            continue
+        rule = RecurrenceRule(start=start, until=end, freq="DAILY", weekdays=weekdays, skip_holidays=skip_holidays)
+        frame = build_recurring_shifts(pattern, expand_dates(rule), workplace_settings, is_busy)
+        frame["pattern"] = name
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=["id", "workplace", "date", "start", "end", "pay", "work_min", "pattern"])
+    candidates = pd.concat(frames, ignore_index=True)
+    candidates = candidates[~conflicts_with(candidates, existing)] if len(existing) else candidates
+    return candidates[candidates["pay"] > 0].reset_index(drop=True) #給料が出ない候補は選ぶ意味がない
+
+
+def _group_options(
+    rows: List[int], start_min: np.ndarray, end_min: np.ndarray, days: np.ndarray
+) -> List[Tuple[int, ...]]:
+    """まとまりの中で、時間帯が重ならず1日 MAX_SHIFTS_PER_DAY 件までの候補の組み合わせを並べる"""
+    options = []
+    for size in range(1, len(rows) + 1):
+        for combo in itertools.combinations(rows, size):
+            spans = sorted((start_min[i], end_min[i]) for i in combo)
+            if any(spans[k][1] > spans[k + 1][0] for k in range(len(spans) - 1)):
+                continue
+            if np.unique(days[list(combo)], return_counts=True)[1].max() > MAX_SHIFTS_PER_DAY:
+                continue
+            options.append(combo)
+    return options
+
+
+def _overlap_groups(candidates: pd.DataFrame) -> Tuple[List[List[Tuple[int, ...]]], int]:
+    """
+    時間帯が重なってつながる候補（日付をまたぐ夜勤と翌日のシフトも含む）を1つのまとまりにし、
+    まとまりごとに選べる組み合わせを並べる。まとまりどうしは重ならないので、まとまりごとに1つ選べばよい。
+    まとまりが MAX_GROUP_CANDIDATES 件を超えるときは、超えた分の候補を使わない（戻り値の2つ目はその数）。
+    """
+    start_min, end_min, valid = shift_intervals(candidates)
+    days = pd.to_datetime(candidates["date"]).to_numpy().astype("datetime64[D]")
+    groups: List[List[Tuple[int, ...]]] = []
+    members: List[int] = []
+    group_end = -np.inf
+    skipped = int((~valid).sum()) #時刻が読めない候補は使わない
+    for i in np.lexsort((end_min, start_min)).tolist(): #開始順に見て、まとまりの終わりより前に始まれば同じまとまり
+        if not valid[i]:
+            continue
+        if members and start_min[i] < group_end:
+            if len(members) >= MAX_GROUP_CANDIDATES:
+                skipped += 1
+                continue
+            members.append(i)
+            group_end = max(group_end, end_min[i])
+            continue
+        if members:
+            groups.append(_group_options(members, start_min, end_min, days))
+        members, group_end = [i], end_min[i]
+    if members:
+        groups.append(_group_options(members, start_min, end_min, days))
+    return groups, skipped
+
+
+def _pay_unit(pays: np.ndarray, budget: int) -> Tuple[int, bool]:
+    """金額の刻み（給料の最大公約数の倍数）と、丸めずに済むか"""
+    gcd = int(np.gcd.reduce(pays)) if len(pays) else 1
+    unit = gcd * max(math.ceil(budget / (gcd * MAX_CAPACITY)), 1)
+    return unit, unit == gcd
+
+
+def _group_knapsack(
+    groups: List[List[Tuple[int, ...]]], weights: np.ndarray, values: np.ndarray, capacity: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    まとまり（グループ）ごとに組み合わせを1つまで選ぶナップサック問題（動的計画法）。
+    best[c] は重さの合計がちょうど c のときの価値の最大、choice[g, c] はそのとき g 番目のまとまりで選んだ組み合わせ（-1 は選ばない）。
+    """
+    best = np.full(capacity + 1, _UNREACHABLE, dtype=np.int64)
+    best[0] = 0
+    choice = np.full((len(groups), capacity + 1), -1, dtype=np.int16)
+    for g, options in enumerate(groups):
+        current = best.copy()
+        picked = choice[g]
+        for k, combo in enumerate(options):
+            weight = int(weights[list(combo)].sum())
+            if weight > capacity:
+                continue
+            value = int(values[list(combo)].sum())
+            source = best[: capacity + 1 - weight]
+            candidate = np.where(source > _UNREACHABLE, source + value, _UNREACHABLE)
+            better = candidate > current[weight:]
+            current[weight:][better] = candidate[better]
+            picked[weight:][better] = k
+        best = current
+    return best, choice
+
+
+def _selected_rows(
+    groups: List[List[Tuple[int, ...]]], weights: np.ndarray, choice: np.ndarray, end_state: int
+) -> List[int]:
+    """choice を最後のまとまりからたどって、選んだ候補の行番号を返す"""
+    rows: List[int] = []
+    state = end_state
+    for g in range(len(groups) - 1, -1, -1):
+        k = int(choice[g, state])
+        if k < 0:
+            continue
+        combo = groups[g][k]
+        rows.extend(combo)
+        state -= int(weights[list(combo)].sum())
+    return sorted(rows)
+
+
+def optimize_shifts(
+    candidates: pd.DataFrame, budget: int, goal: str = "max_pay", target: Optional[int] = None
+) -> ShiftPlan:
+    """
+    候補から、給料の合計が budget（上限までの残り）を超えない組み合わせを選ぶ。
+
+    - goal="max_pay"：給料の合計を最大にする（同じ額なら勤務時間が短いほう）
+    - goal="min_hours"：給料の合計が target 以上になる中で、勤務時間の合計を最小にする
+    選ぶシフトどうしは時間帯が重ならず（日付をまたぐ夜勤と翌日のシフトも見る）、1日 MAX_SHIFTS_PER_DAY 件まで。
+    金額は給料の最大公約数を単位にして解く。上限までの残りが大きくて刻みが MAX_CAPACITY を超えるときは、
+    単位を粗くして給料を切り上げるので、上限は必ず守るが最適から少しずれることがある（exact=False）。
+    """
+    if goal not in OPTIMIZE_GOALS:
+        raise ValueError(f"goal は {' / '.join(OPTIMIZE_GOALS)} のどれかにしてください: {goal}")
+    if goal == "min_hours" and (target is None or target <= 0):
+        raise ValueError("目標額を1円以上で指定してください")
+    if goal == "min_hours" and target > budget:
+        raise ValueError(f"目標額 {target:,} 円が上限までの残り {budget:,} 円を超えています")
+    budget = max(int(budget), 0)
+    pays = candidates["pay"].to_numpy(dtype=np.int64) if len(candidates) else np.zeros(0, dtype=np.int64)
+    minutes = candidates["work_min"].to_numpy(dtype=np.int64) if len(candidates) else np.zeros(0, dtype=np.int64)
+    unit, exact = _pay_unit(pays, budget)
+    capacity = budget // unit
+    weights = -(-pays // unit) #切り上げ（丸めても上限を超えないように）
+    groups, skipped = _overlap_groups(candidates) if len(candidates) else ([], 0)
+
+    if goal == "max_pay": #給料の大きさを優先し、同じなら時間の短いほう
+        values = pays * (int(minutes.sum()) + 1) - minutes
+    else:
+        values = -minutes
+    best, choice = _group_knapsack(groups, weights, values, capacity)
+
+    rows: List[int] = []
+    reachable = np.flatnonzero(best > _UNREACHABLE)
+    if goal == "max_pay":
+        rows = _selected_rows(groups, weights, choice, int(reachable[np.argmax(best[reachable])]))
+    else: #目標額に届く状態のうち、勤務時間が最小のもの（丸めたときは実際の給料で確かめる）
+        reachable = reachable[reachable * unit >= target] #切り上げた額でも届かない状態は見なくてよい
+        for state in reachable[np.argsort(-best[reachable], kind="stable")]:
+            picked = _selected_rows(groups, weights, choice, int(state))
+            if pays[picked].sum() >= target:
+                rows = picked
+                break
+
+    shifts = candidates.iloc[rows] if len(candidates) else candidates
+    shifts = shifts.sort_values(["date", "start"], kind="stable").reset_index(drop=True) #日付・開始時刻の順
+    return ShiftPlan(
+        shifts=shifts,
+        total_pay=int(pays[rows].sum()),
+        total_work_min=int(minutes[rows].sum()),
+        budget=budget,
+        candidates=len(candidates),
+        skipped=skipped,
+        exact=exact,
+    )
@@ -0,0 +1,173 @@
+## シフトデータの品質チェック（行ごとのループを使わず、列単位でまとめて判定する）
+from dataclasses import dataclass #問題点レコードの型定義用
+from datetime import date #日付の型
+from typing import List, Optional, Tuple #型ヒント用
+
+import numpy as np #配列計算用
+import pandas as pd #DataFrame処理用
+
+from shift_engine import EPOCH_ORDINAL, MINUTES_PER_DAY, hhmm_to_minutes #時刻・日付の数値化
+from shift_rollup import duration_minutes_column #勤務時間（分）の列
+
+ISSUE_LABELS = { #問題の種類 → 画面に出す名前
+    "zero_length": "開始と終了が同じ時刻",
+    "overlap": "時間帯の重複",
+    "non_positive_wage": "時給が0以下",
+    "negative_hours": "勤務時間が負",
+    "negative_pay": "給与が負",
+}
+
+
+@dataclass(frozen=True)
+class QualityIssue:
+    """データチェックで見つかった問題1件"""
+    kind: str #問題の種類（ISSUE_LABELS のキー）
+    date: Optional[date] #対象シフトの日付
+    workplace: str #対象シフトの勤務先（重複の場合は後のシフトの勤務先）
+    message: str #画面表示用のメッセージ
+    shift_ids: Tuple[str, ...] #関係するシフトID（重複なら2件）
+
+
+def _column(df: pd.DataFrame, col: str, default: object) -> pd.Series:
+    """列がなければ既定値で埋めた列を返す"""
+    if col in df.columns:
+        return df[col]
+    return pd.Series([default] * len(df), index=df.index)
+
+
+def find_overlaps(abs_start: np.ndarray, abs_end: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    区間 [開始, 終了) の重なりを、開始順に並べて1回なめるだけで見つける（O(n log n)）。
+
+    それまでの区間の終了の最大値（累積最大）より前に始まる区間は、
+    その最大値を持つ区間と重なっている。戻り値は (先の区間の位置, 後の区間の位置)。
+    """
+    n = len(abs_start)
+    if n < 2:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    order = np.lexsort((abs_end, abs_start)) #開始順（同時刻なら終了順）
+    s = abs_start[order]
+    e = abs_end[order]
+    running_end = np.maximum.accumulate(e) #そこまでの終了の最大値
+    positions = np.arange(n)
+    holder = np.maximum.accumulate(np.where(e == running_end, positions, 0)) #最大値を持つ区間の位置
+    later = np.flatnonzero(s[1:] < running_end[:-1]) + 1 #先の区間が終わる前に始まっている
+    return order[holder[later - 1]], order[later]
+
+
+def check_shifts(df: pd.DataFrame) -> List[QualityIssue]:
+    """
+    シフトのDataFrame全体をチェックして、問題点のリストを返す。
+
+    - 開始時刻と終了時刻が同じシフト（終了が開始より前なら翌日に終わる夜勤として扱う）
+    - 時間帯が重なっているシフト（勤務先が違っても同時には働けないので、全シフトを対象にする。夜勤は翌日の分まで）
+    - 時給が0以下、勤務時間・給与が負のシフト
+    """
+    if df.empty:
+        return []
+    days = pd.to_datetime(_column(df, "date", None), errors="coerce").to_numpy().astype("datetime64[D]")
+    valid_date = ~np.isnat(days) #日付が読めたシフト
+    ordinals = np.where(valid_date, days.astype(np.int64), 0) + EPOCH_ORDINAL #date.toordinal() と同じ序数
+
+    def day_of(i: int) -> Optional[date]:
+        """表示用の日付（問題のあった行だけ作る）"""
+        return date.fromordinal(int(ordinals[i])) if valid_date[i] else None
+
+    workplaces = _column(df, "workplace", "").astype(str).to_numpy()
+    ids = _column(df, "id", "").astype(str).to_numpy()
+    start_text = _column(df, "start", "").astype(str).to_numpy()
+    end_text = _column(df, "end", "").astype(str).to_numpy()
+
+    start_min = hhmm_to_minutes(_column(df, "start", None)) #時刻は1回だけ分に変換
+    end_min = hhmm_to_minutes(_column(df, "end", None))
+    parsed = ~np.isnan(start_min) & ~np.isnan(end_min) #時刻が読めたシフト
+    end_min = end_min + np.where(end_min < start_min, MINUTES_PER_DAY, 0) #翌日に終わるシフトは終了を翌日の分に
+
+    issues: List[QualityIssue] = []
+
+    def add_rows(kind: str, mask: np.ndarray, text: str) -> None:
+        for i in np.flatnonzero(mask):
+            issues.append(QualityIssue(
+                kind=kind,
+                date=day_of(i),
+                workplace=workplaces[i],
+                message=f"{day_of(i)} {workplaces[i]}: {text.format(start=start_text[i], end=end_text[i])}",
+                shift_ids=(ids[i],),
+            ))
+
+   #1) 開始時刻と終了時刻が同じ（勤務時間が0）
+    zero_length = parsed & (end_min == start_min)
+    add_rows("zero_length", zero_length, "開始時刻と終了時刻が同じです（{start}〜{end}）")
+
+   #2) 時間帯の重複（日付・時刻が正しいシフトだけを対象に、通し番号の分で比べる）
+    sweep = np.flatnonzero(parsed & valid_date & ~zero_length)
+    if len(sweep) >= 2:
+        day_min = (ordinals[sweep] - EPOCH_ORDINAL) * MINUTES_PER_DAY #日付の0時の通し分
+        first, second = find_overlaps(day_min + start_min[sweep], day_min + end_min[sweep])
+        for a, b in zip(sweep[first], sweep[second]):
+            issues.append(QualityIssue(
+                kind="overlap",
+                date=day_of(b),
+                workplace=workplaces[b],
+                message=(
+                    f"{day_of(a)} {workplaces[a]} {start_text[a]}〜{end_text[a]} と "
+                    f"{day_of(b)} {workplaces[b]} {start_text[b]}〜{end_text[b]} のシフトが重複しています"
+                ),
+                shift_ids=(ids[a], ids[b]),
+            ))
+
+   #3) 時給や勤務時間・給与が0・負の値
+    wage = pd.to_numeric(_column(df, "wage", np.nan), errors="coerce").to_numpy()
+    work_min = duration_minutes_column(df, "work_min").to_numpy() #分の列がなければ時間数から
+    pay = pd.to_numeric(_column(df, "pay", np.nan), errors="coerce").to_numpy()
+    add_rows("non_positive_wage", wage <= 0, "時給が0以下になっています")
+    add_rows("negative_hours", work_min < 0, "勤務時間が負の値になっています")
+    add_rows("negative_pay", pay < 0, "給与が負の値になっています")
+    return issues
+
+
+def shift_intervals(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    シフトの勤務時間帯を通し番号の分（1970-01-01 0時から）の区間 [開始, 終了) にする。
+    夜勤は翌日の分まで。戻り値は (開始, 終了, 日付と時刻が読めて長さが正か)。
+    """
+    days = pd.to_datetime(_column(df, "date", None), errors="coerce").to_numpy().astype("datetime64[D]")
+    valid_date = ~np.isnat(days)
+    day_min = np.where(valid_date, days.astype(np.int64), 0) * MINUTES_PER_DAY #日付の0時の通し分
+    start_min = hhmm_to_minutes(_column(df, "start", None))
+    end_min = hhmm_to_minutes(_column(df, "end", None))
+    end_min = end_min + np.where(end_min < start_min, MINUTES_PER_DAY, 0) #翌日に終わるシフトは終了を翌日の分に
+    valid = valid_date & ~np.isnan(start_min) & ~np.isnan(end_min) & (end_min > start_min)
+    return day_min + np.nan_to_num(start_min), day_min + np.nan_to_num(end_min), valid
+
+
+def conflicts_with(df_new: pd.DataFrame, df_existing: pd.DataFrame) -> np.ndarray:
+    """
+    追加しようとしているシフト（df_new）の行ごとに、既存のシフトと時間帯が重なるかどうか。
+    既存を開始順に並べ、「自分の終了より前に始まった既存シフトの終了の最大値」が自分の開始より後なら重なり
+    （二分探索と累積最大で O((n + m) log m)）。
+    """
+    new_start, new_end, new_valid = shift_intervals(df_new)
+    old_start, old_end, old_valid = shift_intervals(df_existing)
+    old_start, old_end = old_start[old_valid], old_end[old_valid]
+    if len(old_start) == 0:
+        return np.zeros(len(df_new), dtype=bool)
+    order = np.argsort(old_start, kind="stable")
+    starts = old_start[order]
+    running_end = np.maximum.accumulate(old_end[order]) #開始順に見た終了の最大値
+    before = np.searchsorted(starts, new_end, side="left") #自分の終了より前に始まる既存シフトの数
+    latest_end = np.where(before > 0, running_end[np.maximum(before - 1, 0)], -np.inf)
+    return new_valid & (latest_end > new_start)
+
+
+def issues_frame(issues: List[QualityIssue]) -> pd.DataFrame:
+    """問題点のリストを表示用のDataFrameにする"""
+    return pd.DataFrame(
+        {
+            "日付": [i.date for i in issues],
+            "勤務先": [i.workplace for i in issues],
+            "種類": [ISSUE_LABELS.get(i.kind, i.kind) for i in issues],
+            "内容": [i.message for i in issues],
+        }
+    )
@@ -0,0 +1,199 @@
+## 繰り返しシフトの一括作成（勤務パターン＋曜日の規則＋期間から、まとめて作って1回で保存する）
+from dataclasses import dataclass #繰り返し規則の型定義用
+from datetime import date, time #日付・時刻の型
+from typing import Any, Dict, List, Mapping, Optional, Tuple #型ヒント用
+
+import numpy as np #日付の一括計算用
+import pandas as pd #DataFrame処理用
+
+from shift_calendar import is_holiday_array #祝日の一括判定
+from shift_engine import ( #派生列の一括計算
+    EPOCH_ORDINAL,
+    calc_hours_batch,
+    calc_night_early_batch,
+    calc_pay_batch,
+    dates_to_ordinals,
+    get_auto_break_minutes,
+    get_wage_table,
+    shift_minutes,
+)
+from shift_quality import conflicts_with #既存シフトとの重なり
+from shift_store import new_shift_id #シフトIDの発行
+
+WEEKDAY_CODES = ("MO", "TU", "WE", "TH", "FR", "SA", "SU") #RRULE の曜日（date.weekday() の順）
+WEEKDAY_LABELS = ("月", "火", "水", "木", "金", "土", "日") #画面表示用の曜日
+MAX_OCCURRENCES = 1000 #1回で作るシフトの上限（終了日・回数の指定ミスで大量に作らないように）
+
+
+@dataclass(frozen=True)
+class RecurrenceRule:
+    """繰り返しの規則（RRULE の FREQ=DAILY / WEEKLY と BYDAY・INTERVAL・UNTIL・COUNT に当たる）"""
+    start: date #最初の日（この日から数える）
+    until: Optional[date] = None #最後の日（この日を含む）
+    freq: str = "WEEKLY" #"WEEKLY"（毎週）か "DAILY"（毎日）
+    weekdays: Tuple[int, ...] = () #曜日（月=0〜日=6）。毎週で空なら start の曜日
+    interval: int = 1 #何週（毎日なら何日）おきか
+    count: Optional[int] = None #作る回数の上限
+    skip_holidays: bool = False #祝日を除く
+    exclude: Tuple[date, ...] = () #除く日（休講日など）
+
+
+def _parse_rrule_date(text: str) -> date:
+    digits = text.strip()[:8] #"20260131" / "20260131T000000Z" の日付部分
+    if len(digits) != 8 or not digits.isdigit():
+        raise ValueError(f"UNTIL の日付が読めません: {text}")
+    return date(int(digits[:4]), int(digits[4:6]), int(digits[6:8]))
+
+
+def parse_rrule(text: str, start: date, **options: Any) -> RecurrenceRule:
+    """
+    "FREQ=WEEKLY;BYDAY=MO,WE;INTERVAL=2;UNTIL=20260131" のような RRULE の一部を規則にする。
+    使えるのは FREQ（WEEKLY / DAILY）・BYDAY・INTERVAL・UNTIL・COUNT。options は RecurrenceRule の残りの項目。
+    """
+    fields: Dict[str, Any] = {}
+    body = text.strip()
+    if body.upper().startswith("RRULE:"):
+        body = body[len("RRULE:"):]
+    for part in filter(None, (p.strip() for p in body.split(";"))):
+        name, sep, value = part.partition("=")
+        name = name.strip().upper()
+        value = value.strip().upper()
+        if not sep or not value:
+            raise ValueError(f"RRULE の項目が読めません: {part}")
+        if name == "FREQ":
+            if value not in ("WEEKLY", "DAILY"):
+                raise ValueError(f"FREQ は WEEKLY か DAILY だけが使えます: {value}")
+            fields["freq"] = value
+        elif name == "BYDAY":
+            codes = [code.strip()[-2:] for code in value.split(",")] #"1MO" のような位置指定は曜日だけを見る
+            if any(code not in WEEKDAY_CODES for code in codes):
+                raise ValueError(f"BYDAY の曜日が読めません: {value}")
+            fields["weekdays"] = tuple(sorted({WEEKDAY_CODES.index(code) for code in codes}))
+        elif name == "INTERVAL":
+            if not value.isdigit() or int(value) < 1:
+                raise ValueError(f"INTERVAL は1以上の整数にしてください: {value}")
+            fields["interval"] = int(value)
+        elif name == "UNTIL":
+            fields["until"] = _parse_rrule_date(value)
+        elif name == "COUNT":
+            if not value.isdigit() or int(value) < 1:
+                raise ValueError(f"COUNT は1以上の整数にしてください: {value}")
+            fields["count"] = int(value)
+        else:
+            raise ValueError(f"{name} には対応していません（FREQ・BYDAY・INTERVAL・UNTIL・COUNT が使えます）")
+    return RecurrenceRule(start=start, **{**options, **fields})
+
+
+def expand_dates(rule: RecurrenceRule) -> List[date]:
+    """規則に当てはまる日付を古い順に返す（期間の日付を配列にして、曜日・間隔・祝日をまとめて判定する）"""
+    if rule.until is None and rule.count is None:
+        raise ValueError("終了日か回数のどちらかを指定してください")
+    if rule.interval < 1:
+        raise ValueError("間隔は1以上にしてください")
+    first = rule.start.toordinal()
+    if rule.until is not None:
+        last = rule.until.toordinal()
+    else: #回数だけのときは、除く日・祝日で減る分も見込んで十分な長さの期間を作ってから切る
+        spare = len(rule.exclude) + (rule.count if rule.skip_holidays else 0)
+        last = first + 7 * rule.interval * (rule.count + spare) + 6
+    if last < first:
+        return []
+    ordinals = np.arange(first, last + 1, dtype=np.int64)
+    weekday = (ordinals - 1) % 7 #date.weekday() と同じ（序数1 = 0001-01-01 は月曜）
+    if rule.freq == "DAILY":
+        keep = (ordinals - first) % rule.interval == 0
+        if rule.weekdays:
+            keep &= np.isin(weekday, rule.weekdays)
+    else:
+        weekdays = rule.weekdays or (rule.start.weekday(),)
+        week = (ordinals - (first - rule.start.weekday())) // 7 #start の週を0とする週番号
+        keep = (week % rule.interval == 0) & np.isin(weekday, weekdays)
+    picked = ordinals[keep]
+    if rule.exclude:
+        picked = picked[~np.isin(picked, [d.toordinal() for d in rule.exclude])]
+    if rule.skip_holidays and len(picked):
+        picked = picked[~is_holiday_array((picked - EPOCH_ORDINAL).astype("datetime64[D]"))]
+    if rule.count is not None:
+        picked = picked[: rule.count]
+    if len(picked) > MAX_OCCURRENCES:
+        raise ValueError(f"一度に作れるのは{MAX_OCCURRENCES}件までです（{len(picked)}件になりました）")
+    return [date.fromordinal(int(o)) for o in picked]
+
+
+def _clock_text(value: Any) -> str:
+    return value.strftime("%H:%M") if isinstance(value, time) else str(value)
+
+
+def build_recurring_shifts(
+    pattern: Mapping[str, Any],
+    dates: List[date],
+    workplace_settings: Mapping[str, Mapping[str, Any]],
+    is_busy: bool = False,
+    memo: str = "",
+) -> pd.DataFrame:
+    """
+    勤務パターンを日付ごとに展開したシフトのDataFrame（時間・深夜/早朝・給与は一括計算済み）。
+    時給・休憩・交通費は入力フォームと同じく、パターンの値がなければ勤務先設定から決める。
+    """
+    workplace = str(pattern.get("workplace", ""))
+    settings_wp = workplace_settings.get(workplace, {})
+    n = len(dates)
+    frame = pd.DataFrame(
+        {
+            "id": [new_shift_id() for _ in range(n)],
+            "workplace": workplace,
+            "date": pd.Series(dates, dtype=object),
+            "start": _clock_text(pattern.get("start", time(18, 0))),
+            "end": _clock_text(pattern.get("end", time(22, 0))),
+            "pre_min": int(settings_wp.get("pre_minutes", 0)),
+            "post_min": int(settings_wp.get("post_minutes", 0)),
+            "wage": int(pattern.get("wage") or 0),
+            "transport": int(pattern.get("transport") or settings_wp.get("default_transport", 0)),
+            "is_busy": bool(is_busy),
+            "memo": memo,
+        }
+    )
+    if n == 0:
+        return frame
+    if not pattern.get("wage"): #パターンに時給がなければ、日付ごとに時給履歴から引く（入力フォームと同じ）
+        frame["wage"] = get_wage_table(workplace, settings_wp).wages_for_ordinals(
+            dates_to_ordinals(frame["date"])
+        )
+
+    manual_break = int(pattern.get("manual_break_min", 0))
+    if manual_break > 0:
+        frame["break_min"] = manual_break
+    else: #休憩ルールは合計時間（付け時間込み）で決まる。合計時間の種類ごとに1回だけ引く
+        start_min, end_min = shift_minutes(frame)
+        total = pd.Series(np.rint(end_min - start_min), index=frame.index).fillna(0).astype(np.int64)
+        breaks = {
+            minutes: get_auto_break_minutes(minutes / 60, workplace, workplace_settings)
+            for minutes in total.unique().tolist()
+        }
+        frame["break_min"] = total.map(breaks).astype(np.int64)
+
+    frame = calc_hours_batch(frame)
+    frame = calc_night_early_batch(frame, workplace_settings)
+    return calc_pay_batch(frame, workplace_settings)
+
+
+def preview_recurring_shifts(
+    pattern: Mapping[str, Any],
+    rule: RecurrenceRule,
+    workplace_settings: Mapping[str, Mapping[str, Any]],
+    existing: pd.DataFrame,
+    is_busy: bool = False,
+    memo: str = "",
+) -> pd.DataFrame:
+    """
+    規則から作るシフトと、既存シフトとの重なり（conflict 列）を返す（まだ保存しない）。
+    existing には期間内（前日に始まる夜勤を含む）の既存シフトを渡す。
+    """
+    frame = build_recurring_shifts(pattern, expand_dates(rule), workplace_settings, is_busy, memo)
+    frame["conflict"] = conflicts_with(frame, existing) if len(frame) else pd.Series(dtype=bool)
+    return frame
+
+
+def shift_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """プレビューのDataFrameを保存用のシフトdictのリストにする（Pythonの int / float / bool に戻す）"""
+    return frame.drop(columns=["conflict"], errors="ignore").to_dict(orient="records")
@@ -0,0 +1,208 @@
+## 月別・勤務先別の集計（シフトの追加・変更・削除のたびに差分だけ足し引きする）
+from __future__ import annotations #型ヒントは実行時に評価しない（pandas を読み込まずに済むように）
+
+import math #NaN判定用
+from datetime import date #日付の型
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple #型ヒント用
+
+if TYPE_CHECKING:
+    import pandas as pd #集計表の作成・検証用（使う関数の中でだけ読み込む。差分更新だけなら不要）
+
+ROLLUP_FIELDS = ("pay", "work_min", "transport", "busy_bonus") #集計する列（すべて整数。勤務時間は分で足す）
+
+# 時間の列（整数の分）と、表示用に残している時間数の列（小数2桁）。分の列がない古いシフトは時間数から求める
+DURATION_COLUMNS: Dict[str, str] = {
+    "total_min": "total_hours_raw", #合計時間（付け時間込み）
+    "work_min": "work_hours", #実働時間（休憩控除後）
+    "night_min": "night_hours", #深夜時間
+    "early_min": "early_hours", #早朝時間
+}
+
+RollupKey = Tuple[str, str] #(年月 "YYYY-MM", 勤務先)
+Rollup = Dict[RollupKey, List[int]] #キー → [pay, work_min, transport, busy_bonus, 件数]
+
+
+def _number(value: Any) -> float:
+    """数値（欠損・読めない値は0）"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if math.isnan(number) else number
+
+
+def _integer(value: Any) -> int:
+    """集計用の整数（欠損・読めない値は0）"""
+    return int(round(_number(value)))
+
+
+def duration_minutes(shift: Dict[str, Any], column: str) -> int:
+    """シフトの時間（分）。分の列がなければ、表示用の時間数から分に直す"""
+    value = shift.get(column)
+    if value is not None and not (isinstance(value, float) and math.isnan(value)):
+        return _integer(value)
+    return int(round(_number(shift.get(DURATION_COLUMNS[column])) * 60))
+
+
+def minutes_to_hours(minutes: Any) -> Any:
+    """分を表示用の時間数（小数2桁）にする（スカラー・配列どちらでも可）"""
+    return round(minutes / 60, 2) if isinstance(minutes, (int, float)) else (minutes / 60).round(2)
+
+
+def rollup_values(shift: Dict[str, Any]) -> List[int]:
+    """シフト1件分の、集計する列の値（ROLLUP_FIELDS の順）"""
+    return [
+        duration_minutes(shift, field) if field in DURATION_COLUMNS else _integer(shift.get(field))
+        for field in ROLLUP_FIELDS
+    ]
+
+
+def year_month_of(value: Any) -> str:
+    """日付（date / datetime / "YYYY-MM-DD"）から "YYYY-MM" を取り出す"""
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m")
+    return str(value)[:7]
+
+
+def rollup_key(shift: Dict[str, Any]) -> RollupKey:
+    return year_month_of(shift.get("date")), str(shift.get("workplace", ""))
+
+
+def rollup_add(rollup: Rollup, shift: Dict[str, Any], sign: int = 1) -> None:
+    """シフト1件分を集計に足す（sign=-1 なら引く）。O(1)"""
+    key = rollup_key(shift)
+    cell = rollup.setdefault(key, [0] * (len(ROLLUP_FIELDS) + 1))
+    for i, value in enumerate(rollup_values(shift)):
+        cell[i] += sign * value
+    cell[-1] += sign
+    if cell[-1] <= 0: #その月・勤務先のシフトがなくなったら消す
+        del rollup[key]
+
+
+def rollup_apply_ops(
+    rollup: Rollup, ops: Iterable[Dict[str, Any]], before: Dict[str, Dict[str, Any]]
+) -> None:
+    """
+    操作（add / update / delete）を集計に反映する。
+    before には操作前のシフト（ID → シフト）を渡す。update / delete はそのシフトの分を引いてから足し直す。
+    """
+    current = dict(before) #同じ操作列の中で同じIDを何度も触る場合に備えて、適用後の状態を追う
+    for op in ops:
+        kind = op.get("op")
+        sid = op.get("id")
+        if kind in ("update", "delete") and sid not in current:
+            continue #存在しないシフトへの操作は apply_ops と同じく無視する
+        old = current.pop(sid, None)
+        if old is not None:
+            rollup_add(rollup, old, -1)
+        if kind in ("add", "update"):
+            rollup_add(rollup, op["shift"])
+            current[sid] = op["shift"]
+
+
+def _numeric(df: pd.DataFrame, column: str) -> pd.Series:
+    import pandas as pd
+
+    if column not in df.columns:
+        return pd.Series(float("nan"), index=df.index)
+    return pd.to_numeric(df[column], errors="coerce")
+
+
+def duration_minutes_column(df: pd.DataFrame, column: str) -> pd.Series:
+    """duration_minutes の列版（分の列が欠けている行は時間数から求める。int64）"""
+    minutes = _numeric(df, column)
+    from_hours = (_numeric(df, DURATION_COLUMNS[column]) * 60).round()
+    return minutes.fillna(from_hours).fillna(0).round().astype("int64")
+
+
+def build_rollup(df: pd.DataFrame) -> Rollup:
+    """シフトのDataFrame全体から集計を作り直す（1回のgroupby。整数のまま足す）"""
+    import pandas as pd
+
+    if df.empty:
+        return {}
+    dates = pd.to_datetime(df["date"])
+    frame = pd.DataFrame(
+        {
+            "year_month": dates.dt.year * 100 + dates.dt.month, #年月は整数（202501）で束ね、文字列にするのはキーだけ
+            "workplace": df["workplace"].astype(str),
+        }
+    )
+    for field in ROLLUP_FIELDS:
+        if field in DURATION_COLUMNS:
+            frame[field] = duration_minutes_column(df, field)
+        else:
+            frame[field] = _numeric(df, field).fillna(0).round().astype("int64")
+    grouped = frame.groupby(["year_month", "workplace"], sort=False)
+    sums = grouped[list(ROLLUP_FIELDS)].sum()
+    counts = grouped.size().to_numpy()
+    return {
+        (f"{ym // 100:04d}-{ym % 100:02d}", wp): [*map(int, values), int(count)]
+        for (ym, wp), values, count in zip(sums.index, sums.to_numpy(), counts)
+    }
+
+
+def rollup_frame(rollup: Rollup) -> pd.DataFrame:
+    """集計を (year_month, workplace, pay, work_min, transport, busy_bonus, shift_count) の表にする"""
+    import pandas as pd
+
+    rows = [(ym, wp, *cell) for (ym, wp), cell in rollup.items()]
+    frame = pd.DataFrame(
+        rows, columns=["year_month", "workplace", *ROLLUP_FIELDS, "shift_count"]
+    )
+    return frame.astype({field: "int64" for field in (*ROLLUP_FIELDS, "shift_count")})
+
+
+def rollup_period_aggregates(
+    rollup: Rollup, start: date, partial_month: Optional[pd.DataFrame] = None
+) -> Dict[str, Any]:
+    """
+    集計開始日以降の合計・勤務先別・月別の集計を、月別・勤務先別の集計から組み立てる。
+
+    集計開始日が月の途中のときは、その月だけ集計を使わず、
+    partial_month（開始日〜その月末のシフト）から足し込む。
+    """
+    import pandas as pd
+
+    start_month = start.strftime("%Y-%m")
+    frame = rollup_frame(rollup)
+    if start.day == 1:
+        frame = frame[frame["year_month"] >= start_month]
+    else:
+        frame = frame[frame["year_month"] > start_month] #開始月は日単位で絞ったシフトから足す
+        if partial_month is not None and not partial_month.empty:
+            partial = rollup_frame(build_rollup(partial_month))
+            frame = pd.concat([partial, frame], ignore_index=True)
+
+    by_workplace = frame.groupby("workplace")["pay"].sum().reset_index() #勤務先ごとの合計支給額
+    by_month = (
+        frame
+        .groupby("year_month")
+        .agg(total_pay=("pay", "sum"), total_min=("work_min", "sum"))
+        .reset_index()
+        .sort_values("year_month")
+    ) #月ごとの給与合計と勤務時間合計（分）
+    by_month["total_hours"] = by_month.pop("total_min") / 60 #時間数に直すのは表示の直前だけ
+    return {
+        "total_income": int(frame["pay"].sum()), #期間内の支給合計
+        "total_transport": int(frame["transport"].sum()), #期間内交通費合計
+        "total_busy_bonus": int(frame["busy_bonus"].sum()), #期間内繁忙期手当合計
+        "by_workplace": by_workplace,
+        "by_month": by_month,
+    }
+
+
+def verify_rollup(rollup: Rollup, df: pd.DataFrame) -> List[str]:
+    """集計を全件からの再計算と比べ、食い違いの内容を返す（空なら一致）"""
+    expected = build_rollup(df)
+    problems: List[str] = []
+    for key in sorted(set(rollup) | set(expected)):
+        have = rollup.get(key)
+        want = expected.get(key)
+        if have is None or want is None:
+            problems.append(f"{key[0]} {key[1]}: {'集計にない' if have is None else '余分な集計がある'}")
+            continue
+        for i, field in enumerate((*ROLLUP_FIELDS, "shift_count")):
+            if have[i] != want[i]: #整数どうしなので完全に一致するはず
+                problems.append(f"{key[0]} {key[1]}: {field} が {have[i]} （再計算では {want[i]}）")
+    return problems
@@ -0,0 +1,817 @@
+## シフトデータの保存（スナップショットCSV＋追記型ジャーナル / SQLiteバックエンド）
+from __future__ import annotations #型ヒントは実行時に評価しない（pandas を読み込まずに済むように）
+
+import hashlib #ブロブのキー（SHA-256）用
+import json #ジャーナルの1行をJSONで書くため
+import math #NaN判定用
+import os #ファイル操作用
+import re #利用者IDをディレクトリ名にするため
+import sqlite3 #SQLiteバックエンド用
+import stat #置き換えるファイルのパーミッションを引き継ぐため
+import tempfile #一時ファイル（原子的な書き込み）用
+import threading #ロックの入れ子判定（スレッドごと）用
+import time #ロック待ち用
+import uuid #シフトIDの発行用
+from contextlib import contextmanager #ファイルロック用
+from datetime import date, datetime #日付の変換用
+from typing import TYPE_CHECKING, Dict, Any, Iterable, Iterator, List, Optional, Tuple #型ヒント用
+
+try:
+    import fcntl #ファイルロック（Linux / macOS）
+except ImportError: #Windows
+    fcntl = None
+    try:
+        import msvcrt #ファイルロック（Windows）
+    except ImportError:
+        msvcrt = None
+
+if TYPE_CHECKING:
+    import pandas as pd #CSVの読み書きなど、使う関数の中でだけ読み込む（起動を速くするため）
+
+from shift_rollup import (
+    DURATION_COLUMNS,
+    ROLLUP_FIELDS,
+    Rollup,
+    duration_minutes,
+    rollup_key,
+    rollup_values,
+) #月別・勤務先別の集計・時間（分）の取り出し
+
+JOURNAL_COMPACT_BYTES = 256 * 1024 #ジャーナルがこのサイズを超えたらスナップショットにまとめる
+LOCK_TIMEOUT_SECONDS = 30.0 #書き込みロックを待つ最長時間（SQLiteのロック待ちにも使う）
+
+
+def new_shift_id() -> str:
+    """シフトに付ける一意なIDを発行"""
+    return uuid.uuid4().hex
+
+
+def ensure_shift_ids(records: List[Dict[str, Any]]) -> bool:
+    """IDのないシフトにIDを付ける（付けたものがあれば True）"""
+    changed = False
+    for rec in records:
+        sid = rec.get("id")
+        if not isinstance(sid, str) or not sid:
+            rec["id"] = new_shift_id()
+            changed = True
+    return changed
+
+
+def _to_json_value(value: Any) -> Any:
+    """シフトの値をJSONに書ける形に変換"""
+    if isinstance(value, datetime): #Timestamp も datetime のサブクラス
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if hasattr(value, "item"): #numpyのスカラー
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value): #欠損はnullに
+        return None
+    return value
+
+
+def _record_to_json(rec: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: _to_json_value(v) for k, v in rec.items()}
+
+
+def _record_from_json(data: Dict[str, Any]) -> Dict[str, Any]:
+    rec = dict(data)
+    if isinstance(rec.get("date"), str): #日付文字列をdate型に戻す
+        rec["date"] = date.fromisoformat(rec["date"])
+    return rec
+
+
+_umask_lock = threading.Lock() #umask は読むときに一度書き換えるので、スレッド間で同時に触らない
+
+
+def _new_file_mode() -> int:
+    """新しく作るファイルの既定のパーミッション（open() で作ったときと同じ 0o666 & ~umask）"""
+    with _umask_lock:
+        umask = os.umask(0)
+        os.umask(umask)
+    return 0o666 & ~umask
+
+
+@contextmanager
+def atomic_writer(path: str, mode: str = "w") -> Iterator[Any]:
+    """
+    一時ファイルを開いて渡し、書き終えたら path と置き換える（途中で落ちても壊れたファイルが残らない）。
+    mkstemp の一時ファイルは 0600 で作られるので、置き換える前に元のファイルのパーミッション
+    （新しいファイルなら 0o666 & ~umask）に合わせる。グループで共有しているデータが読めなくならないように。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=directory)
+    try:
+        with (os.fdopen(fd, mode) if "b" in mode else os.fdopen(fd, mode, encoding="utf-8", newline="")) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            file_mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            file_mode = _new_file_mode()
+        os.chmod(tmp_path, file_mode)
+        os.replace(tmp_path, path) #同じディレクトリ内なら置き換えは原子的
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_text(path: str, text: str) -> None:
+    """一時ファイルに書いてから置き換える（パーミッションは元のファイルのまま）"""
+    with atomic_writer(path) as f:
+        f.write(text)
+
+
+def write_snapshot(records: List[Dict[str, Any]], data_file: str, journal_file: str) -> None:
+    """全シフトをスナップショットCSVに書き出し、ジャーナルを空にする（コンパクション）"""
+    import pandas as pd
+
+    df_save = pd.DataFrame(records) #シフトリストをDataFrameに変換
+    if not df_save.empty and "date" in df_save.columns: #date列がある場合
+        df_save["date"] = pd.to_datetime(df_save["date"]).dt.strftime("%Y-%m-%d") #日付を文字列に変換
+    atomic_write_text(data_file, df_save.to_csv(index=False)) #CSVとして保存
+    if os.path.exists(journal_file):
+        os.remove(journal_file) #スナップショットに反映済みなのでジャーナルは不要
+    bump_write_counter(data_file)
+
+
+def read_snapshot(data_file: str) -> List[Dict[str, Any]]:
+    """スナップショットCSVを読み込む（空ファイル・ファイルなしは空リスト）"""
+    import pandas as pd
+
+    if not os.path.exists(data_file) or os.path.getsize(data_file) == 0:
+        return []
+    try:
+        df_loaded = pd.read_csv(data_file, dtype={"id": str}) #IDは数字だけでも文字列のまま
+    except pd.errors.EmptyDataError: #形式的には存在するが中身が空の場合
+        return []
+    if "date" in df_loaded.columns: #date列がある場合
+        df_loaded["date"] = pd.to_datetime(df_loaded["date"]).dt.date #date列をdate型に変換
+    return df_loaded.to_dict(orient="records")
+
+
+def append_journal(journal_file: str, ops: List[Dict[str, Any]]) -> None:
+    """操作（add / update / delete）をジャーナルの末尾に追記（全体は書き直さない）"""
+    if not ops:
+        return
+    lines = []
+    for op in ops:
+        entry = dict(op)
+        if "shift" in entry:
+            entry["shift"] = _record_to_json(entry["shift"])
+        lines.append(json.dumps(entry, ensure_ascii=False))
+    with open(journal_file, "a", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    bump_write_counter(journal_file)
+
+
+def apply_ops(records: List[Dict[str, Any]], ops: Iterable[Dict[str, Any]]) -> int:
+    """操作（add / update / delete）を順にシフトリストへ適用する（適用した件数を返す）"""
+    pos = {rec.get("id"): i for i, rec in enumerate(records)} #ID → リスト上の位置
+    applied = 0
+    for op in ops:
+        kind = op.get("op")
+        sid = op.get("id")
+        if kind == "add":
+            rec = op["shift"]
+            pos[rec.get("id")] = len(records)
+            records.append(rec)
+        elif kind == "update" and sid in pos:
+            records[pos[sid]] = op["shift"]
+        elif kind == "delete" and sid in pos:
+            records[pos.pop(sid)] = None #位置がずれないよう一旦Noneにしておく
+        else:
+            continue
+        applied += 1
+    records[:] = [rec for rec in records if rec is not None]
+    return applied
+
+
+def _read_journal_ops(journal_file: str) -> Iterator[Dict[str, Any]]:
+    """ジャーナルの操作を1行ずつ読み出す"""
+    with open(journal_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                op = json.loads(line)
+            except json.JSONDecodeError: #書き込み途中で落ちた最終行などは無視
+                continue
+            if "shift" in op:
+                op["shift"] = _record_from_json(op["shift"])
+            yield op
+
+
+def replay_journal(records: List[Dict[str, Any]], journal_file: str) -> int:
+    """ジャーナルの操作を順にシフトリストへ適用する（適用した件数を返す）"""
+    if not os.path.exists(journal_file):
+        return 0
+    return apply_ops(records, _read_journal_ops(journal_file))
+
+
+def load_records(data_file: str, journal_file: str) -> List[Dict[str, Any]]:
+    """スナップショット＋ジャーナルから現在のシフト一覧を復元する"""
+    records = read_snapshot(data_file)
+    missing_ids = ensure_shift_ids(records) #古いCSVにはIDがないので付ける
+    applied = replay_journal(records, journal_file)
+    if missing_ids or applied: #IDを固定するため・ジャーナルをまとめるためにスナップショットを書き直す
+        write_snapshot(records, data_file, journal_file)
+    return records
+
+
+def record_ops(
+    ops: List[Dict[str, Any]],
+    records: List[Dict[str, Any]],
+    data_file: str,
+    journal_file: str,
+    compact_bytes: Optional[int] = None,
+) -> None:
+    """
+    操作をジャーナルに追記する。ジャーナルが大きくなったら現在のシフト一覧でスナップショットを作り直す。
+    records には操作を適用した後のシフト一覧を渡す。
+    """
+    append_journal(journal_file, ops)
+    limit = JOURNAL_COMPACT_BYTES if compact_bytes is None else compact_bytes
+    if os.path.exists(journal_file) and os.path.getsize(journal_file) > limit:
+        write_snapshot(records, data_file, journal_file)
+
+
+def add_op(shift: Dict[str, Any]) -> Dict[str, Any]:
+    return {"op": "add", "id": shift["id"], "shift": shift}
+
+
+def update_op(shift: Dict[str, Any]) -> Dict[str, Any]:
+    return {"op": "update", "id": shift["id"], "shift": shift}
+
+
+def delete_op(shift_id: str) -> Dict[str, Any]:
+    return {"op": "delete", "id": shift_id}
+
+
+VERSION_SUFFIX = ".version" #書き込みのたびに1ずつ増やすカウンタのファイル（path + ".version"）
+
+
+def read_write_counter(path: str) -> int:
+    """path の書き込みカウンタ（まだ書かれていなければ0）"""
+    try:
+        with open(path + VERSION_SUFFIX, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_write_counter(path: str) -> int:
+    """path を書き換えたあとに呼び、書き込みカウンタを1増やす（増やしたあとの値を返す）"""
+    counter_path = path + VERSION_SUFFIX
+    with file_lock(counter_path): #同時に書き込んでも番号が重ならないように
+        value = read_write_counter(path) + 1
+        atomic_write_text(counter_path, str(value))
+    return value
+
+
+def storage_version(*paths: str) -> Tuple[Tuple[str, int, int, int], ...]:
+    """
+    保存ファイルの (パス, 書き込みカウンタ, 更新時刻ns, サイズ) の組。シフトを書き換えるたびに変わるので
+    「データのバージョン」として集計キャッシュのキーに使う。同じ状態のファイルを読んだセッション同士は同じ値になり、
+    集計結果を共有できる。カウンタは書き込みのたびに必ず増えるので、更新時刻の刻みが粗いファイルシステムで
+    同じサイズに書き直しても別のバージョンになる（更新時刻とサイズは、カウンタを使わない書き込みに気づくため）。
+    """
+    version = []
+    for path in paths:
+        counter = read_write_counter(path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            version.append((path, counter, 0, -1)) #まだ作られていない・消されたファイル
+            continue
+        version.append((path, counter, stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+
+### 利用者ごとの保存先と書き込みの排他（1つのサーバーを複数の利用者・タブで使うとき用）
+def user_data_dir(root: str, user_id: Optional[str]) -> str:
+    """
+    利用者ごとのデータディレクトリ（root/users/<ID>-<ハッシュ>）。
+    利用者が分からなければ root そのもの（今までどおりの置き場所）。
+    """
+    if root:
+        os.makedirs(root, exist_ok=True)
+    if not user_id:
+        return root
+    slug = re.sub(r"[^0-9A-Za-z_.@-]", "_", user_id)[:40].strip(".") or "user" #人が見て分かる部分
+    digest = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:12] #切り詰め・置き換えで同じ名前にならないように
+    path = os.path.join(root, "users", f"{slug}-{digest}")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+_held_locks = threading.local() #このスレッドが持っているロック（入れ子で取り直さないように）
+
+
+def _try_lock(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif msvcrt is not None:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True #ロックの仕組みがない環境では排他しない（1人で使う前提）
+
+
+def _unlock(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path: str, timeout: float = LOCK_TIMEOUT_SECONDS) -> Iterator[None]:
+    """
+    path に対する排他ロック（path + ".lock" を使う助言ロック）。別プロセス・別スレッドの書き込みを待たせる。
+    同じスレッドの中で同じ path を入れ子で取っても止まらない。
+    """
+    lock_path = os.path.abspath(path) + ".lock"
+    held = getattr(_held_locks, "paths", None)
+    if held is None:
+        held = _held_locks.paths = set()
+    if lock_path in held:
+        yield
+        return
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        deadline = time.monotonic() + timeout
+        while not _try_lock(fd):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"{path} のロックを取れませんでした（ほかの書き込みが終わっていません）")
+            time.sleep(0.01)
+        held.add(lock_path)
+        try:
+            yield
+        finally:
+            held.discard(lock_path)
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+
+def merge_settings(
+    current: Dict[str, Any], base: Dict[str, Any], mine: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    設定の3方向マージ。base（このセッションが読んだ・保存した内容）から mine で変えた項目だけを
+    current（いまファイルにある内容）に反映する。ほかのセッションが変えた項目はそのまま残る。
+    辞書の値は項目ごとに比べ、それ以外の値（リストなど）は丸ごと比べる。
+    """
+    merged = dict(current)
+    for key, value in mine.items():
+        old = base.get(key)
+        if isinstance(value, dict) and isinstance(old, dict) and isinstance(current.get(key), dict):
+            merged[key] = merge_settings(current[key], old, value)
+        elif key not in base or old != value:
+            merged[key] = value
+    for key in base:
+        if key not in mine: #このセッションで消した項目
+            merged.pop(key, None)
+    return merged
+
+
+### SQLiteバックエンド（日付・勤務先の索引つきで、必要な範囲だけ読み出す）
+SHIFT_COLUMNS: Dict[str, str] = { #shiftsテーブルの列と型
+    "id": "TEXT PRIMARY KEY",
+    "workplace": "TEXT NOT NULL",
+    "date": "TEXT NOT NULL", #"YYYY-MM-DD"（文字列の大小比較で範囲検索できる）
+    "start": "TEXT",
+    "end": "TEXT",
+    "crosses_midnight": "INTEGER", #終了時刻が開始時刻より前（翌日に終わる）なら1
+    "pre_min": "INTEGER",
+    "post_min": "INTEGER",
+    "total_min": "INTEGER", #合計時間（付け時間込み、分）
+    "total_hours_raw": "REAL", #*_hours は表示用（分の列から作る。古いアプリでも読めるように残している）
+    "break_min": "INTEGER",
+    "work_min": "INTEGER", #実働時間（分）
+    "work_hours": "REAL",
+    "night_min": "INTEGER", #深夜時間（分）
+    "night_hours": "REAL",
+    "early_min": "INTEGER", #早朝時間（分）
+    "early_hours": "REAL",
+    "wage": "INTEGER",
+    "transport": "INTEGER",
+    "is_busy": "INTEGER",
+    "memo": "TEXT",
+    "base_pay": "INTEGER",
+    "night_bonus": "INTEGER",
+    "early_bonus": "INTEGER",
+    "busy_bonus": "INTEGER",
+    "pay": "INTEGER",
+}
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shifts ({shift_columns});
+CREATE INDEX IF NOT EXISTS idx_shifts_date ON shifts("date");
+CREATE INDEX IF NOT EXISTS idx_shifts_workplace_date ON shifts("workplace", "date");
+CREATE TABLE IF NOT EXISTS workplaces (
+    "name" TEXT PRIMARY KEY,
+    "settings_json" TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS wage_history (
+    "workplace" TEXT NOT NULL,
+    "from_date" TEXT NOT NULL,
+    "wage" INTEGER NOT NULL,
+    PRIMARY KEY ("workplace", "from_date")
+);
+CREATE TABLE IF NOT EXISTS shift_rollups (
+    "year_month" TEXT NOT NULL,
+    "workplace" TEXT NOT NULL,
+    "pay" INTEGER NOT NULL DEFAULT 0,
+    "work_min" INTEGER NOT NULL DEFAULT 0,
+    "transport" INTEGER NOT NULL DEFAULT 0,
+    "busy_bonus" INTEGER NOT NULL DEFAULT 0,
+    "shift_count" INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY ("year_month", "workplace")
+);
+CREATE TABLE IF NOT EXISTS shift_patterns (
+    "name" TEXT PRIMARY KEY,
+    "workplace" TEXT,
+    "start" TEXT,
+    "end" TEXT,
+    "wage" INTEGER,
+    "manual_break_min" INTEGER,
+    "transport" INTEGER
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    "key" TEXT PRIMARY KEY,
+    "value" INTEGER NOT NULL
+);
+""".format(
+    shift_columns=", ".join(f'"{c}" {t}' for c, t in SHIFT_COLUMNS.items())
+)
+
+_COLS_SQL = ", ".join(f'"{c}"' for c in SHIFT_COLUMNS) #SELECT / INSERT 用の列リスト
+BOOL_COLUMNS = ("is_busy", "crosses_midnight") #真偽値の列（DBには0/1で保存）
+
+
+def _clock_minutes(value: Any) -> Optional[int]:
+    """"HH:MM" を0時からの分にする（読めなければNone）"""
+    hh, sep, mm = str(value).partition(":")
+    if sep and hh.strip().isdigit() and mm.strip().isdigit():
+        return int(hh) * 60 + int(mm)
+    return None
+
+
+def shift_crosses_midnight(shift: Dict[str, Any]) -> bool:
+    """終了時刻が開始時刻より前（翌日に終わる夜勤）かどうか"""
+    start = _clock_minutes(shift.get("start"))
+    end = _clock_minutes(shift.get("end"))
+    return start is not None and end is not None and end < start
+
+
+def sqlite_connect(db_file: str) -> sqlite3.Connection:
+    """SQLiteに接続し、テーブルと索引がなければ作る（古いDBに足りない列は追加する）"""
+    conn = sqlite3.connect(db_file, timeout=LOCK_TIMEOUT_SECONDS) #ほかの接続が書き込み中なら待つ
+    conn.executescript(SQLITE_SCHEMA)
+    existing = {row[1] for row in conn.execute('PRAGMA table_info("shifts")')}
+    with conn:
+        for col, sql_type in SHIFT_COLUMNS.items():
+            if col not in existing:
+                conn.execute(f'ALTER TABLE shifts ADD COLUMN "{col}" {sql_type}')
+    if "crosses_midnight" not in existing: #追加した列は開始・終了時刻から埋める
+        with conn:
+            conn.execute(
+                'UPDATE shifts SET "crosses_midnight" = ("end" < "start") '
+                'WHERE length("start") = 5 AND length("end") = 5'
+            ) #"HH:MM" 同士なら文字列の大小が時刻の前後と同じ
+    with conn:
+        for col, hours_col in DURATION_COLUMNS.items():
+            if col not in existing: #分の列は、それまで保存していた時間数から埋める
+                conn.execute(
+                    f'UPDATE shifts SET "{col}" = CAST(ROUND(COALESCE("{hours_col}", 0) * 60) AS INTEGER)'
+                )
+    rollup_columns = {row[1] for row in conn.execute('PRAGMA table_info("shift_rollups")')}
+    if not set(ROLLUP_FIELDS) <= rollup_columns: #集計する列が変わった古いDBは集計表を作り直す
+        with conn:
+            conn.execute("DROP TABLE shift_rollups")
+        conn.executescript(SQLITE_SCHEMA)
+    has_rollups = conn.execute("SELECT 1 FROM shift_rollups LIMIT 1").fetchone()
+    if not has_rollups and sqlite_count(conn) > 0: #集計表がない古いDBなら一度だけ作る
+        with conn:
+            sqlite_rebuild_rollups(conn)
+    return conn
+
+
+def _record_to_row(rec: Dict[str, Any]) -> Tuple[Any, ...]:
+    """シフトdictをshiftsテーブルの1行に変換"""
+    row = []
+    for col in SHIFT_COLUMNS:
+        value = _to_json_value(rec.get(col))
+        if col == "crosses_midnight" and value is None: #古いシフトには列がないので時刻から決める
+            value = shift_crosses_midnight(rec)
+        elif col in DURATION_COLUMNS: #分の列がない古いシフトは時間数から
+            value = duration_minutes(rec, col)
+        if col in BOOL_COLUMNS:
+            value = 1 if value else 0
+        row.append(value)
+    return tuple(row)
+
+
+_ROLLUP_COLS_SQL = ", ".join(f'"{c}"' for c in ROLLUP_FIELDS) #集計する列
+
+
+def _sqlite_rollup_add(conn: sqlite3.Connection, shift: Dict[str, Any], sign: int) -> None:
+    """シフト1件分を shift_rollups に足す（sign=-1 なら引く）"""
+    values = [sign * value for value in rollup_values(shift)]
+    conn.execute(
+        f'INSERT INTO shift_rollups ("year_month", "workplace", {_ROLLUP_COLS_SQL}, "shift_count") '
+        f"VALUES (?, ?, {', '.join('?' for _ in ROLLUP_FIELDS)}, ?) "
+        'ON CONFLICT ("year_month", "workplace") DO UPDATE SET '
+        + ", ".join(f'"{c}" = "{c}" + excluded."{c}"' for c in (*ROLLUP_FIELDS, "shift_count")),
+        (*rollup_key(shift), *values, sign),
+    )
+    if sign < 0:
+        conn.execute(
+            'DELETE FROM shift_rollups WHERE "year_month" = ? AND "workplace" = ? AND "shift_count" <= 0',
+            rollup_key(shift),
+        )
+
+
+def _sqlite_old_shift(conn: sqlite3.Connection, shift_id: Any) -> Optional[Dict[str, Any]]:
+    """集計から引くための、更新・削除前のシフト（日付・勤務先・集計する列だけ）"""
+    row = conn.execute(
+        f'SELECT "date", "workplace", {_ROLLUP_COLS_SQL} FROM shifts WHERE id = ?', (shift_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(("date", "workplace", *ROLLUP_FIELDS), row))
+
+
+def _sqlite_bump_version(conn: sqlite3.Connection) -> None:
+    """シフトを書き換えたトランザクションの中で、データのバージョンを1増やす（同じコミットで確定する）"""
+    conn.execute(
+        'INSERT INTO store_meta ("key", "value") VALUES (\'data_version\', 1) '
+        'ON CONFLICT ("key") DO UPDATE SET "value" = "value" + 1'
+    )
+
+
+def sqlite_data_version(conn: sqlite3.Connection) -> int:
+    """シフトを書き換えるたびに増えるデータのバージョン（集計キャッシュのキー用）"""
+    row = conn.execute('SELECT "value" FROM store_meta WHERE "key" = \'data_version\'').fetchone()
+    return int(row[0]) if row else 0
+
+
+def sqlite_apply_ops(conn: sqlite3.Connection, ops: List[Dict[str, Any]]) -> None:
+    """操作（add / update / delete）を1トランザクションでDBに反映（shift_rollups も差分だけ更新）"""
+    placeholders = ", ".join("?" for _ in SHIFT_COLUMNS)
+    with conn: #まとめてコミット（失敗したらロールバック）
+        for op in ops:
+            kind = op.get("op")
+            if kind not in ("add", "update", "delete"):
+                continue
+            shift_id = op["shift"].get("id") if kind != "delete" else op.get("id")
+            old = _sqlite_old_shift(conn, shift_id)
+            if kind == "update" and old is None: #apply_ops と同じく、ないシフトの更新は無視する
+                continue
+            if old is not None:
+                _sqlite_rollup_add(conn, old, -1)
+            if kind in ("add", "update"):
+                conn.execute(
+                    f"INSERT OR REPLACE INTO shifts ({_COLS_SQL}) VALUES ({placeholders})",
+                    _record_to_row(op["shift"]),
+                )
+                _sqlite_rollup_add(conn, op["shift"], 1)
+            else:
+                conn.execute("DELETE FROM shifts WHERE id = ?", (shift_id,))
+        _sqlite_bump_version(conn)
+
+
+def sqlite_replace_all(conn: sqlite3.Connection, records: List[Dict[str, Any]]) -> None:
+    """shiftsテーブルの中身を丸ごと入れ替える（CSV読み込みなど）"""
+    placeholders = ", ".join("?" for _ in SHIFT_COLUMNS)
+    with conn:
+        conn.execute("DELETE FROM shifts")
+        conn.executemany(
+            f"INSERT OR REPLACE INTO shifts ({_COLS_SQL}) VALUES ({placeholders})",
+            [_record_to_row(rec) for rec in records],
+        )
+        sqlite_rebuild_rollups(conn)
+        _sqlite_bump_version(conn)
+
+
+def sqlite_rebuild_rollups(conn: sqlite3.Connection) -> None:
+    """shift_rollups を shifts から作り直す（トランザクション内で呼ぶ）"""
+    conn.execute("DELETE FROM shift_rollups")
+    conn.execute(
+        f'INSERT INTO shift_rollups ("year_month", "workplace", {_ROLLUP_COLS_SQL}, "shift_count") '
+        'SELECT substr("date", 1, 7), "workplace", '
+        + ", ".join(f'COALESCE(SUM("{c}"), 0)' for c in ROLLUP_FIELDS)
+        + ', COUNT(*) FROM shifts GROUP BY substr("date", 1, 7), "workplace"'
+    )
+
+
+def sqlite_load_rollup(conn: sqlite3.Connection) -> Rollup:
+    """shift_rollups を読み出す（月数×勤務先数の行だけ）"""
+    rows = conn.execute(
+        f'SELECT "year_month", "workplace", {_ROLLUP_COLS_SQL}, "shift_count" FROM shift_rollups'
+    ).fetchall()
+    return {(ym, wp): [int(v) for v in values] for ym, wp, *values in rows}
+
+
+def _where_clause(
+    start: Optional[date],
+    end: Optional[date],
+    workplaces: Optional[List[str]],
+    ids: Optional[List[str]] = None,
+) -> Tuple[str, List[Any]]:
+    """日付範囲・勤務先・IDの絞り込み条件をWHERE句にする（索引が使える形）"""
+    conds: List[str] = []
+    params: List[Any] = []
+    if ids is not None:
+        if not ids:
+            return " WHERE 0", []
+        conds.append('"id" IN (' + ", ".join("?" for _ in ids) + ")")
+        params.extend(ids)
+    if workplaces is not None:
+        if not workplaces:
+            return " WHERE 0", []
+        conds.append('"workplace" IN (' + ", ".join("?" for _ in workplaces) + ")")
+        params.extend(workplaces)
+    if start is not None:
+        conds.append('"date" >= ?')
+        params.append(start.isoformat())
+    if end is not None:
+        conds.append('"date" <= ?')
+        params.append(end.isoformat())
+    return (" WHERE " + " AND ".join(conds) if conds else ""), params
+
+
+def sqlite_query_shifts(
+    conn: sqlite3.Connection,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    workplaces: Optional[List[str]] = None,
+    ids: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """日付範囲（両端含む）・勤務先・IDで絞り込んだシフトをDataFrameで返す"""
+    import pandas as pd
+
+    where, params = _where_clause(start, end, workplaces, ids)
+    df = pd.read_sql_query(
+        f'SELECT {_COLS_SQL} FROM shifts{where} ORDER BY "date", "start"', conn, params=params
+    )
+    for col in BOOL_COLUMNS:
+        df[col] = df[col].fillna(0).astype(bool)
+    return df
+
+
+def sqlite_load_records(conn: sqlite3.Connection, **filters: Any) -> List[Dict[str, Any]]:
+    """絞り込んだシフトをdictのリスト（date列はdate型）で返す"""
+    import pandas as pd
+
+    df = sqlite_query_shifts(conn, **filters)
+    df["date"] = pd.to_datetime(df["date"]).dt.date
+    return df.to_dict(orient="records")
+
+
+def sqlite_count(conn: sqlite3.Connection) -> int:
+    return int(conn.execute("SELECT COUNT(*) FROM shifts").fetchone()[0])
+
+
+def sqlite_date_bounds(conn: sqlite3.Connection) -> Tuple[Optional[date], Optional[date]]:
+    """最初と最後のシフトの日付（索引だけで求まる）"""
+    lo, hi = conn.execute('SELECT MIN("date"), MAX("date") FROM shifts').fetchone()
+    return (
+        date.fromisoformat(lo) if lo else None,
+        date.fromisoformat(hi) if hi else None,
+    )
+
+
+def sqlite_workplaces(conn: sqlite3.Connection) -> List[str]:
+    """シフトに登場する勤務先の一覧"""
+    rows = conn.execute('SELECT DISTINCT "workplace" FROM shifts ORDER BY "workplace"')
+    return [r[0] for r in rows]
+
+
+def sqlite_save_workplaces(
+    conn: sqlite3.Connection,
+    workplace_settings: Dict[str, Dict[str, Any]],
+    patterns: Dict[str, Dict[str, Any]],
+) -> None:
+    """勤務先設定・時給履歴・勤務パターンをDBに保存（patterns は settings.json と同じ保存形式）"""
+    with conn:
+        conn.execute("DELETE FROM workplaces")
+        conn.execute("DELETE FROM wage_history")
+        conn.execute("DELETE FROM shift_patterns")
+        for name, cfg in workplace_settings.items():
+            base = {k: v for k, v in cfg.items() if k != "wage_history"}
+            conn.execute(
+                'INSERT INTO workplaces ("name", "settings_json") VALUES (?, ?)',
+                (name, json.dumps(base, ensure_ascii=False)),
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO wage_history ("workplace", "from_date", "wage") '
+                "VALUES (?, ?, ?)",
+                [(name, h["from"], int(h["wage"])) for h in cfg.get("wage_history") or []],
+            )
+        conn.executemany(
+            'INSERT INTO shift_patterns ("name", "workplace", "start", "end", "wage", '
+            '"manual_break_min", "transport") VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [
+                (
+                    name,
+                    p.get("workplace", ""),
+                    p.get("start"),
+                    p.get("end"),
+                    p.get("wage"),
+                    int(p.get("manual_break_min", 0)),
+                    int(p.get("transport", 0)),
+                )
+                for name, p in patterns.items()
+            ],
+        )
+
+
+def sqlite_load_workplaces(
+    conn: sqlite3.Connection,
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """DBから勤務先設定（時給履歴込み）と勤務パターン（保存形式）を読み出す"""
+    workplace_settings: Dict[str, Dict[str, Any]] = {}
+    for name, settings_json in conn.execute('SELECT "name", "settings_json" FROM workplaces'):
+        cfg = json.loads(settings_json)
+        cfg["wage_history"] = []
+        workplace_settings[name] = cfg
+    for wp, from_date, wage in conn.execute(
+        'SELECT "workplace", "from_date", "wage" FROM wage_history ORDER BY "from_date"'
+    ):
+        if wp in workplace_settings:
+            workplace_settings[wp]["wage_history"].append({"from": from_date, "wage": wage})
+    patterns: Dict[str, Dict[str, Any]] = {}
+    for name, wp, start, end, wage, brk, transport in conn.execute(
+        'SELECT "name", "workplace", "start", "end", "wage", "manual_break_min", "transport" '
+        "FROM shift_patterns"
+    ):
+        patterns[name] = {
+            "workplace": wp,
+            "start": start,
+            "end": end,
+            "wage": wage,
+            "manual_break_min": brk or 0,
+            "transport": transport or 0,
+        }
+    return workplace_settings, patterns
+
+
+def sqlite_import_if_empty(conn: sqlite3.Connection, data_file: str, journal_file: str) -> None:
+    """DBが空で、CSV（＋ジャーナル）があれば一度だけ取り込む"""
+    if sqlite_count(conn) > 0:
+        return
+    if not os.path.exists(data_file) and not os.path.exists(journal_file):
+        return
+    records = read_snapshot(data_file)
+    ensure_shift_ids(records)
+    replay_journal(records, journal_file)
+    if records:
+        sqlite_replace_all(conn, records)
+
+
+### 背景画像などのバイナリ（SHA-256をキーにしたブロブ置き場）
+_BLOB_DIGEST = re.compile(r"^[0-9a-f]{64}$") #SHA-256の16進表記（settings.json から読んだ値をパスに使う前に確かめる）
+
+
+def is_blob_digest(value: Any) -> bool:
+    """ブロブのキーとして正しい形（小文字16進64文字）か"""
+    return isinstance(value, str) and _BLOB_DIGEST.match(value) is not None
+
+
+def _blob_path(blob_dir: str, digest: str) -> str:
+    if not is_blob_digest(digest): #"../" などでブロブ置き場の外を指さないように
+        raise ValueError(f"ブロブのキーが正しくありません: {digest!r}")
+    return os.path.join(blob_dir, digest[:2], digest) #1ディレクトリにファイルが集中しないよう先頭2文字で分ける
+
+
+def put_blob(blob_dir: str, data: bytes) -> str:
+    """バイト列をブロブ置き場に保存してSHA-256を返す（同じ内容なら書き込まない）"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = _blob_path(blob_dir, digest)
+    if os.path.exists(path): #内容で名前が決まるので、あれば同じもの
+        return digest
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_writer(path, "wb") as f:
+        f.write(data)
+    return digest
+
+
+def get_blob(blob_dir: str, digest: str) -> Optional[bytes]:
+    """SHA-256からバイト列を取り出す（なければ・キーの形が正しくなければ None）"""
+    if not is_blob_digest(digest):
+        return None
+    path = _blob_path(blob_dir, digest)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
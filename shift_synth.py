@@ -0,0 +1,143 @@
+## ベンチマーク用の架空シフト履歴（同じ seed なら毎回同じデータになる）
+# 勤務先設定の深夜・早朝の時間帯に合わせて、日中・夕方〜深夜・早朝・夜勤（日付またぎ）のシフトを作る。
+# 時給は毎年10月（最低賃金の改定時期）に上がっていく履歴を付け、繁忙期（3月・8月・12月）には繁忙期フラグを立てる。
+# 件数に合わせて期間を過去へ延ばすので、10万件では何十年分にもなる（行数を増やすことが目的）。
+import copy #勤務先設定のコピー
+import random #乱数（seed 固定）
+from datetime import date, datetime, timedelta #日付の計算
+from typing import Any, Dict, List, Tuple #型ヒント用
+
+import pandas as pd #給与の一括計算用
+
+from shift_engine import get_auto_break_minutes, recompute_shift_frame #休憩・給与の計算
+from shift_store import SHIFT_COLUMNS #保存する列の順番
+
+DEFAULT_END_DATE = date(2025, 12, 31) #履歴の最終日（今日の日付に左右されないよう固定）
+BUSY_MONTHS = (3, 8, 12) #繁忙期の月
+RAISE_YEARS = 10 #時給が上がっていく直近の年数
+
+
+def synthetic_workplace_settings(
+    workplace_settings: Dict[str, Dict[str, Any]], first_year: int, last_year: int, seed: int = 0
+) -> Dict[str, Dict[str, Any]]:
+    """
+    勤務先設定のコピーに、毎年10月に時給が上がる時給履歴を付ける（最後の時給が default_wage になる）。
+    改定は直近 RAISE_YEARS 年分だけで、それより前は同じ時給のままにする。
+    """
+    rng = random.Random(seed)
+    result = copy.deepcopy(workplace_settings)
+    raise_years = range(max(first_year, last_year - RAISE_YEARS), last_year)
+    for name in sorted(result):
+        cfg = result[name]
+        raises = [rng.choice((20, 30, 40, 50)) for _ in raise_years] #毎年の上げ幅
+        wage = int(cfg.get("default_wage", 1100)) - sum(raises)
+        history = [{"from": f"{first_year}-01-01", "wage": wage}]
+        for year, step in zip(raise_years, raises):
+            wage += step
+            history.append({"from": f"{year}-10-01", "wage": wage})
+        cfg["wage_history"] = history
+    return result
+
+
+def _slot_templates(cfg: Dict[str, Any]) -> Dict[str, Tuple[int, int, int, int]]:
+    """勤務先の時間帯設定から、シフトの種類ごとの (開始の最早分, 開始の最遅分, 最短の長さ分, 最長の長さ分) を決める"""
+    night_start = int(cfg.get("night_start", 22)) * 60
+    early_start = int(cfg.get("early_start", 5)) * 60
+    return {
+        "early": (early_start, early_start + 60, 180, 270), #早朝の時間帯から始まる
+        "day": (9 * 60, 13 * 60, 240, 480), #日中
+        "evening": (17 * 60, 18 * 60 + 30, 240, min(night_start + 60, 23 * 60 + 30) - 17 * 60), #深夜の時間帯にかかる
+        "overnight": (night_start - 60, night_start, 360, 480), #日付をまたぐ夜勤
+    }
+
+
+def _hhmm(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _raw_shift(
+    rng: random.Random, workplace: str, cfg: Dict[str, Any], day: date, start: int, end: int, memo: str
+) -> Dict[str, Any]:
+    """時刻まで決めたシフト（給与などの派生列はあとでまとめて計算する）"""
+    pre = int(cfg.get("pre_minutes", 0))
+    post = int(cfg.get("post_minutes", 0))
+    total_hours = (end - start + pre + post) / 60 #end は翌日なら24時以降の分
+    return {
+        "id": "%032x" % rng.getrandbits(128), #uuid4().hex と同じ形
+        "workplace": workplace,
+        "date": day,
+        "start": _hhmm(start),
+        "end": _hhmm(end % (24 * 60)),
+        "crosses_midnight": end > 24 * 60,
+        "pre_min": pre,
+        "post_min": post,
+        "break_min": get_auto_break_minutes(total_hours, workplace, {workplace: cfg}),
+        "wage": int(cfg.get("default_wage", 1100)), #時給は時給履歴から引き直す
+        "transport": int(cfg.get("default_transport", 0)),
+        "is_busy": day.month in BUSY_MONTHS and rng.random() < 0.6,
+        "memo": memo,
+    }
+
+
+def generate_history(
+    n_shifts: int,
+    workplace_settings: Dict[str, Dict[str, Any]],
+    seed: int = 0,
+    end: date = DEFAULT_END_DATE,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    n_shifts 件のシフト履歴と、それに使った勤務先設定（時給履歴入り）を返す。
+    同じ日のシフト同士は重ならないようにする（日付をまたぐ夜勤は、翌日の早い時間のシフトとも重ならないように）。
+    """
+    rng = random.Random(seed)
+    names = sorted(workplace_settings)
+    templates = {name: _slot_templates(workplace_settings[name]) for name in names} #時給履歴は期間が決まってから付ける
+    kinds = ("day", "evening", "early", "overnight")
+    weights = {name: [rng.uniform(0.5, 3.0) for _ in kinds] for name in names} #勤務先ごとのシフトの種類の偏り
+
+    raw: List[Dict[str, Any]] = []
+    taken: Dict[date, List[Tuple[int, int]]] = {} #日付 → 入っているシフトの (開始分, 終了分)
+
+    def is_free(d: date, start: int, end_min: int) -> bool:
+        return all(end_min <= s or e <= start for s, e in taken.get(d, []))
+
+    day = end
+    while len(raw) < n_shifts:
+        if rng.random() < 0.75: #休みの日もある
+            for _ in range(1 if rng.random() < 0.6 else 2): #掛け持ちの日は2件
+                name = rng.choice(names)
+                kind = rng.choices(kinds, weights=weights[name])[0]
+                lo, hi, shortest, longest = templates[name][kind]
+                start = rng.randrange(lo, hi + 1, 15)
+                end_min = start + rng.randrange(shortest, max(shortest, longest) + 1, 15)
+                cfg = workplace_settings[name]
+                if end_min <= 24 * 60:
+                    if not is_free(day, start, end_min):
+                        continue #同じ日の別のシフトと重なるなら入れない
+                    taken.setdefault(day, []).append((start, end_min))
+                    raw.append(_raw_shift(rng, name, cfg, day, start, min(end_min, 24 * 60 - 1), ""))
+                    continue
+                next_day = day + timedelta(days=1)
+                if day == end or not is_free(day, start, 24 * 60) or not is_free(next_day, 0, end_min - 24 * 60):
+                    continue
+               #日付をまたぐ夜勤は開始日の1件として入れ、翌日の分は重なりの判定だけに使う
+                taken.setdefault(day, []).append((start, 24 * 60))
+                taken.setdefault(next_day, []).append((0, end_min - 24 * 60))
+                raw.append(_raw_shift(rng, name, cfg, day, start, end_min, "夜勤"))
+        day -= timedelta(days=1)
+
+    raw = raw[:n_shifts]
+    first = min(shift["date"] for shift in raw) #実際に作った最初の日から時給履歴を始める（それより前は最新の時給になってしまう）
+    settings = synthetic_workplace_settings(workplace_settings, first.year, end.year, seed)
+    df = pd.DataFrame(raw)
+    df["total_hours_raw"] = 0.0
+    df["work_hours"] = 0.0
+    df = recompute_shift_frame(df, settings, reprice_wages=True) #時間・時給・深夜/早朝・給与をまとめて計算
+    df = df[[c for c in SHIFT_COLUMNS if c in df.columns]].sort_values(["date", "start"], kind="stable")
+    lowered = df.groupby("workplace", sort=False)["wage"].diff().lt(0) #日付順に見て時給が下がっていないか
+    assert not lowered.any(), f"架空の履歴で時給が下がっています（{int(lowered.sum())}件）"
+    records = df.to_dict(orient="records")
+    for rec in records:
+        if isinstance(rec["date"], datetime):
+            rec["date"] = rec["date"].date()
+    return records, settings
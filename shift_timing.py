@@ -0,0 +1,102 @@
+## 処理時間の記録（再実行ごとに、区間ごとの所要時間と行数を測る）
+# 使い方:
+#   begin_run()                                  #再実行の最初に呼ぶ
+#   with timed("load_settings"): ...             #短い区間はwithで囲む
+#   started = section_start(); ...; record_section("calendar_build", started, rows=len(df))
+#   end_run(log_file, {"page": page})            #最後に呼ぶと、直近の記録に加わる（log_file があればJSONLに1行追記）
+# 記録はセッションのスレッドごとに分け、直近の分はプロセス内で共有する（診断パネルの分位点用）。
+import json #JSONLへの書き出し
+import threading #セッション（スレッド）ごとの記録・共有部分のロック
+import time #計測
+from collections import deque #直近の記録（古いものから捨てる）
+from contextlib import contextmanager #with で囲んで測るため
+from typing import Any, Deque, Dict, Iterator, List, Optional #型ヒント用
+
+RECENT_SAMPLES = 200 #区間ごとに覚えておく直近の記録の数
+PERCENTILES = (50, 90, 99) #診断パネルに出す分位点
+TOTAL_SECTION = "total" #再実行全体の区間名
+
+_local = threading.local() #このスレッド（セッションの再実行）の記録
+_recent: Dict[str, Deque[Dict[str, Any]]] = {} #区間名 → 直近の記録
+_recent_lock = threading.Lock()
+
+
+def _samples() -> List[Dict[str, Any]]:
+    if not hasattr(_local, "samples"): #begin_run の前に測った場合
+        begin_run()
+    return _local.samples
+
+
+def begin_run() -> None:
+    """再実行の記録を始める（前の再実行の記録は捨てる）"""
+    _local.samples = []
+    _local.started = time.perf_counter()
+
+
+def section_start() -> float:
+    """record_section に渡す開始時刻"""
+    return time.perf_counter()
+
+
+def record_section(section: str, started: float, rows: Optional[int] = None) -> Dict[str, Any]:
+    """section_start() からの経過時間を記録する"""
+    sample = {"section": section, "ms": (time.perf_counter() - started) * 1000, "rows": rows}
+    _samples().append(sample)
+    return sample
+
+
+@contextmanager
+def timed(section: str, rows: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """with の中の所要時間を記録する（行数はあとから sample["rows"] に入れてもよい）"""
+    sample: Dict[str, Any] = {"section": section, "ms": 0.0, "rows": rows}
+    started = time.perf_counter()
+    try:
+        yield sample
+    finally:
+        sample["ms"] = (time.perf_counter() - started) * 1000
+        _samples().append(sample)
+
+
+def end_run(log_file: Optional[str] = None, meta: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    再実行の記録を締めて、直近の記録に加える（log_file があれば1行のJSONとして追記）。
+    この再実行の記録（最後に全体の時間）を返す。
+    """
+    samples = list(_samples())
+    samples.append({
+        "section": TOTAL_SECTION,
+        "ms": (time.perf_counter() - _local.started) * 1000,
+        "rows": None,
+    })
+    _local.samples = []
+    with _recent_lock:
+        for sample in samples:
+            _recent.setdefault(sample["section"], deque(maxlen=RECENT_SAMPLES)).append(sample)
+    if log_file:
+        line = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), **(meta or {}), "sections": samples}
+        with open(log_file, "a", encoding="utf-8") as f: #ロックなしでも1行ずつの追記なので混ざりにくい
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return samples
+
+
+def _percentile(sorted_values: List[float], p: int) -> float:
+    """最近順位法の分位点"""
+    rank = max(1, -(-len(sorted_values) * p // 100)) #ceil(n * p / 100)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def section_stats() -> List[Dict[str, Any]]:
+    """区間ごとの直近の記録の件数・分位点（ms）・最大・最後の行数（全体は最後）"""
+    with _recent_lock:
+        recent = {name: list(samples) for name, samples in _recent.items()}
+    stats = []
+    for name in sorted(recent, key=lambda n: (n == TOTAL_SECTION, n)):
+        samples = recent[name]
+        values = sorted(s["ms"] for s in samples)
+        row: Dict[str, Any] = {"section": name, "count": len(values)}
+        for p in PERCENTILES:
+            row[f"p{p}_ms"] = round(_percentile(values, p), 1)
+        row["max_ms"] = round(values[-1], 1)
+        row["last_rows"] = samples[-1]["rows"]
+        stats.append(row)
+    return stats